@@ -1,122 +1,972 @@
 import asyncio
 import aiohttp
+import contextlib
 import time
 import json
+import os
 import random
-from typing import List, Dict, Any
-from question_bank import question_bank
+from typing import List, Dict, Any, Callable, Optional, Tuple, Sequence, Union
+from question_bank import question_bank, AliasTable, QuestionSampler
+from prompt_synth import PromptSynthesizer, input_length_bucket, input_length_buckets
+from sse_parser import SSEParser
+from load_profiles import ArrivalSchedule, LoadProfile, Distribution
+from latency_histogram import LatencyHistogram
+from stats_collector import StatsCollector
+from protocols import Backend, ProtocolAdapter
+from trace_replay import TraceReader
+from result_log import ResultLogWriter
+from result_store import ResultStore
+from live_metrics import LiveMetrics, LiveReporter
+from http_timing import PHASE_FIELDS, create_trace_config, phase_timings
+from loop_monitor import LoopLagMonitor, loop_name
+from request_timeouts import FAILURE_TYPES, StreamWatchdog, client_timeout, classify_exception
+from file_uploads import upload_files
 
 class APIStressTester:
-    def __init__(self, url: str, headers: Dict[str, str], payload: Dict[str, Any], use_random_questions: bool = True):
+    # 需要单独分组统计的结果字段（question_category用于与基线逐类别比较）
+    GROUP_FIELDS = ("stage", "turn", "input_bucket", "backend", "question_category", "attachments")
+    # 离线报告中各分组的标题
+    GROUP_TITLES = {"stage": "🪜 分阶段统计", "turn": "💬 分轮次统计", "input_bucket": "📏 按输入长度统计",
+                    "backend": "🔀 按后端对比", "attachments": "📎 按附件数统计"}
+    # 按后端对比时打印的指标
+    BACKEND_METRICS = (("响应时间", "response_time"), ("响应头到达", "header_time"), ("首字延迟TTFT", "ttft"),
+                       ("字间延迟ITL", "inter_token_latency"), ("解码吞吐", "tokens_per_second"))
+    # 需要按固定顺序打印的分组
+    GROUP_ORDERS = {"input_bucket": input_length_buckets()}
+    # 主动中断流式输出的方式："close"=直接断开连接，"stop"=调用Dify的停止生成接口后读完剩余的流
+    ABORT_MODES = ("close", "stop")
+    # 逐请求结果的分组报告（多于一组时打印）
+    BREAKDOWN_TITLES = {"question_category": "🧮 按问题类别细分", "status_code": "🧮 按状态码细分",
+                        "stage": "🧮 按阶段细分", "time_bucket": "🧮 按时间段细分"}
+
+    def __init__(self, url: str, headers: Dict[str, str], payload: Dict[str, Any], use_random_questions: bool = True,
+                 keep_results: bool = True, histogram_precision: int = 2,
+                 question_seed: Optional[int] = None, category_weights: Optional[Dict[str, float]] = None,
+                 corpus_path: Optional[str] = None, result_log_path: Optional[str] = None,
+                 live_interval: Optional[float] = None, live_window: float = 30.0, metrics_port: Optional[int] = None,
+                 synthetic_prompts: Optional[Dict[str, Any]] = None, http_tracing: bool = True,
+                 warmup_connections: int = 0, loop_lag_threshold: Optional[float] = 0.05,
+                 protocol: str = "dify-chat", protocol_options: Optional[Dict[str, Any]] = None,
+                 backends: Optional[List[Dict[str, Any]]] = None, timeout: Optional[float] = 60.0,
+                 connect_timeout: Optional[float] = None, ttft_timeout: Optional[float] = None,
+                 idle_timeout: Optional[float] = None, abort_after_chunks: Optional[int] = None,
+                 abort_mode: str = "close", abort_ratio: float = 1.0, time_bucket: float = 10.0,
+                 upload_files: Optional[List[str]] = None, attachments_per_request: int = 1,
+                 attachment_ratio: float = 1.0,
+                 uploaded_attachments: Optional[Dict[str, List[Dict[str, Any]]]] = None):
         self.url = url
         self.headers = headers
         self.payload = payload
         self.use_random_questions = use_random_questions
-        self.results = []
+        self.keep_results = keep_results  # 长时间压测可关闭，只保留直方图统计
+        self.time_bucket = time_bucket  # 按时间段细分逐请求结果时每段的秒数
+        self.histogram_precision = histogram_precision  # 直方图有效数字位数
+        self.question_seed = question_seed  # 问题抽样种子，相同种子每轮压测产生相同的问题序列
+        self.category_weights = category_weights  # 各问题类别的抽样权重，None表示等概率
+        # 外部JSONL语料，设置后从语料而不是内置问题库中抽取问题
+        self.corpus = question_bank.load_corpus(corpus_path) if corpus_path else None
+        # 合成问题：按PromptSynthesizer的参数（长度分布、共享前缀比例、缓冲区大小等）预先生成，优先级低于外部语料
+        self.synthesizer = PromptSynthesizer(**synthetic_prompts) if synthetic_prompts and self.corpus is None else None
+        self.sampler = self._new_sampler()
+        self.results = ResultStore()  # 逐请求结果，按列存储
         self.question_stats = {}  # 统计问题类型分布
+        self.last_summary: Optional[Dict[str, Any]] = None  # 最近一轮压测的运行摘要，保存基线时使用
+        self.stats = StatsCollector(histogram_precision, self.GROUP_FIELDS)
+        # 逐请求结果日志（JSONL，.gz结尾时压缩），由后台线程写入，None表示不写
+        self.result_log_path = result_log_path
+        self.result_log: Optional[ResultLogWriter] = None
+        # 实时指标：每live_interval秒在控制台打印一次滑动窗口统计，metrics_port不为None时提供Prometheus的/metrics接口
+        self.live_interval = live_interval
+        self.live_window = live_window
+        self.metrics_port = metrics_port
+        self.live: Optional[LiveMetrics] = None
+        self._live_reporter: Optional[LiveReporter] = None
+        # HTTP分阶段计时（DNS、连接池等待、建连、发送、首字节），关闭后不注册aiohttp的trace回调
+        self.http_tracing = http_tracing
+        self.trace_config = create_trace_config() if http_tracing else None
+        # 计时开始前预先建立的连接数，0表示不预热，首批请求的耗时中会包含建连
+        self.warmup_connections = warmup_connections
+        # 压测期间持续采样客户端事件循环的调度延迟，P99超过loop_lag_threshold秒时在报告中提示，None表示不提示
+        self.loop_lag_threshold = loop_lag_threshold
+        self.loop_monitor: Optional[LoopLagMonitor] = None
+        self.loop_name: Optional[str] = None  # 最近一轮压测所用的事件循环实现
         
-    async def send_request(self, session: aiohttp.ClientSession, request_id: int) -> Dict[str, Any]:
-        """发送单个请求"""
-        start_time = time.time()
+        # 压测目标：protocol为接口协议（dify-chat、dify-completion、dify-workflow、openai-chat），protocol_options为适配器参数；
+        # 设置backends时请求在其中各目标之间轮流发送，每项可包含name、url、headers、payload、protocol、protocol_options，缺省取上述参数
+        self.backends = [
+            Backend(**dict({"url": url, "headers": headers, "payload": payload, "protocol": protocol,
+                            "protocol_options": protocol_options, "attach_files": bool(upload_files)}, **item))
+            for item in (backends or [{}])
+        ]
+        names = [backend.name for backend in self.backends]
+        if len(set(names)) != len(names):
+            raise ValueError(f"压测目标名称重复: {names}，请为每个backends项指定不同的name")
+        self._backend_turn = 0
         
-        # 创建请求payload的副本
-        current_payload = self.payload.copy()
-        question_category = "fixed"
+        # 分阶段超时（秒，None表示不限）：connect为新建连接，ttft为发出请求到第一段输出，
+        # idle为第一段输出之后相邻两块数据的间隔，timeout为整个请求；超时的请求按类型分别统计
+        self.request_timeout = client_timeout(timeout, connect_timeout)
+        self.ttft_timeout = ttft_timeout
+        self.idle_timeout = idle_timeout
+        # 主动中断：收到abort_after_chunks块输出后按abort_mode中断，abort_ratio为参与中断的请求比例，
+        # 用于模拟只关心首字的流量和大量用户同时取消生成的场景
+        if abort_mode not in self.ABORT_MODES:
+            raise ValueError(f"未知的中断方式: {abort_mode}，可选: {', '.join(self.ABORT_MODES)}")
+        if abort_after_chunks and abort_mode == "stop":
+            for backend in self.backends:
+                if backend.adapter.stop_path is None:
+                    raise ValueError(f"压测目标{backend.name}的协议{backend.adapter.name}没有停止生成接口")
+                if backend.stop_url("task") is None:
+                    raise ValueError(f"无法推断压测目标{backend.name}的停止生成接口地址，url需以{backend.adapter.path}结尾")
+        self.abort_after_chunks = abort_after_chunks
+        self.abort_mode = abort_mode
+        self.abort_ratio = abort_ratio
+        self._abort_rng = random.Random(question_seed)
         
-        # 如果使用随机问题，生成新问题
-        if self.use_random_questions:
-            random_question = question_bank.get_random_question()
-            question_category = random_question["category"]
-            
-            # 更新payload中的问题
-            current_payload["inputs"] = {
-                "content": random_question["content"]
-            }
-            current_payload["query"] = random_question["question"]
-            
-            # 统计问题类型
-            if question_category in self.question_stats:
-                self.question_stats[question_category] += 1
-            else:
-                self.question_stats[question_category] = 1
+        # 附件：upload_files中的本地文件在第一轮压测开始前经文件上传接口各上传一次，文件ID缓存后在请求间轮换，
+        # 每个请求附带attachments_per_request个；attachment_ratio为附带附件的请求比例，其余请求不带附件，
+        # 报告中按附件数分组对比延迟。不支持文件上传的协议（openai-chat）的目标不附带附件；
+        # uploaded_attachments为已在别处上传好的各目标文件引用（多进程、分布式模式下由父进程或协调器统一上传），这些目标不再上传
+        self.attachments: Dict[str, List[Dict[str, Any]]] = dict(uploaded_attachments or {})  # 各目标已上传文件的local_file引用
+        if upload_files:
+            attaching = [backend for backend in self.backends if backend.attach_files]
+            if not attaching:
+                raise ValueError("没有支持文件上传的压测目标，附件只适用于Dify协议")
+            pending = [backend for backend in attaching if backend.name not in self.attachments]
+            if pending:
+                for path in upload_files:
+                    if not os.path.isfile(path):
+                        raise ValueError(f"待上传的文件不存在: {path}")
+            for backend in pending:
+                if backend.upload_url() is None:
+                    raise ValueError(f"无法推断压测目标{backend.name}的文件上传接口地址，url需以{backend.adapter.path}结尾")
+        self.upload_files = list(upload_files or [])
+        self.attachments_per_request = attachments_per_request
+        self.attachment_ratio = attachment_ratio
+        self._attachment_turns: Dict[str, int] = {}
+        self._attachment_rng = random.Random(question_seed)
+        
+        # 请求体在启动时一次性编码，发送时直接使用bytes
+        self.body_categories: List[str] = []  # 每个预编码请求体对应的问题类别
+        self.body_lengths: List[int] = []     # 每个预编码请求体中问题的字符数
+        self._build_body_caches()
+        
+    def _new_sampler(self):
+        """按种子和类别权重创建问题抽样器"""
+        if self.corpus is not None:
+            return self.corpus.sampler(self.category_weights, self.question_seed)
+        if self.synthesizer is not None:
+            return QuestionSampler(AliasTable([1.0] * self.synthesizer.pool_size), self.question_seed)
+        return question_bank.sampler(self.category_weights, self.question_seed)
+
+    def _build_body_caches(self):
+        """按各目标的协议把问题库中每个问题对应的请求体预先序列化，同一序号在各目标中是同一个问题"""
+        if self.corpus is not None:
+            # 语料太大无法逐条预编码，问题以拼接方式填入模板
+            return
+        if self.synthesizer is not None:
+            prompts = self.synthesizer.prompts
+            self.body_categories = ["synthetic"] * len(prompts)
+        elif self.use_random_questions:
+            prompts = question_bank.prompts
+            self.body_categories = question_bank.prompt_categories
+        else:
+            prompts = None
+            self.body_categories = ["fixed"]
+            first = self.backends[0]
+            self.body_lengths = [len(first.adapter.prompt_of(first.payload))]
+        if prompts is not None:
+            self.body_lengths = [len(prompt) for prompt in prompts]
+        for backend in self.backends:
+            backend.build_body_cache(prompts)
+
+    def next_backend(self) -> Backend:
+        """轮流选择压测目标，多个目标承受相同的负载"""
+        if len(self.backends) == 1:
+            return self.backends[0]
+        backend = self.backends[self._backend_turn % len(self.backends)]
+        self._backend_turn += 1
+        return backend
+
+    def build_body(self, prompt: str, backend: Optional[Backend] = None, **fields: Any) -> bytes:
+        """以拼接方式把任意问题（及user、conversation_id等字段）填入目标的请求模板"""
+        return (backend or self.backends[0]).build_body(prompt, **fields)
+
+    def next_body(self, backend: Optional[Backend] = None, **fields: Any) -> Tuple[bytes, str, int]:
+        """抽取下一个问题，返回(请求体, 问题类别, 问题字符数)；fields为以拼接方式替换的user、conversation_id等字段"""
+        backend = backend or self.backends[0]
+        if self.corpus is not None:
+            prompt, question_category = self.corpus.get(self.sampler.next_index())
+            return backend.build_body(prompt, **fields), question_category, len(prompt)
+        # 随机问题直接取预编码好的请求体
+        random_body = self.use_random_questions or self.synthesizer is not None
+        body_index = self.sampler.next_index() if random_body else 0
+        return backend.body(body_index, **fields), self.body_categories[body_index], self.body_lengths[body_index]
+
+    def next_attachments(self, backend: Backend) -> Optional[List[Dict[str, Any]]]:
+        """下一个请求的files字段：按attachment_ratio决定是否附带，附带时轮换取已上传的文件；
+        目标不附带附件时为None"""
+        files = self.attachments.get(backend.name)
+        if not files:
+            return None
+        if self.attachment_ratio < 1 and self._attachment_rng.random() >= self.attachment_ratio:
+            return []
+        turn = self._attachment_turns.get(backend.name, 0)
+        count = min(self.attachments_per_request, len(files))
+        self._attachment_turns[backend.name] = turn + count
+        return [files[(turn + i) % len(files)] for i in range(count)]
+
+    async def upload_attachments(self, session: aiohttp.ClientSession, report: bool = True):
+        """把upload_files上传到每个支持附件的目标，已上传过的目标直接复用缓存的文件ID"""
+        for backend in self.backends:
+            if not backend.attach_files or backend.name in self.attachments:
+                continue
+            start_time = time.perf_counter()
+            user = str(backend.payload.get("user") or "stress-test")
+            self.attachments[backend.name] = await upload_files(session, backend.upload_url(), backend.request_headers,
+                                                                self.upload_files, user, self.request_timeout)
+            if report:
+                print(f"📎 已向{backend.name}上传 {len(self.upload_files)} 个附件，耗时 "
+                      f"{time.perf_counter() - start_time:.2f}秒")
+
+    async def prepare_attachments(self, report: bool = True) -> Dict[str, List[Dict[str, Any]]]:
+        """在压测开始前单独上传附件，返回各目标的文件引用，可作为uploaded_attachments传给其他进程中的tester"""
+        if self.upload_files:
+            async with aiohttp.ClientSession() as session:
+                await self.upload_attachments(session, report)
+        return self.attachments
+        
+    async def send_request(self, session: aiohttp.ClientSession, request_id: int, body: Optional[bytes] = None,
+                           question_category: Optional[str] = None, input_length: Optional[int] = None,
+                           intended_start: Optional[float] = None, backend: Optional[Backend] = None,
+                           attachments: Optional[int] = None) -> Dict[str, Any]:
+        """发送单个请求，未指定body时从问题库中抽取；intended_start为负载计划中该请求应发出的时刻（perf_counter），
+        指定body时须同时指定该请求体所属的backend，以及请求体中的附件数attachments（不附带附件的目标为None）"""
+        if backend is None:
+            backend = self.next_backend()
+        if body is None:
+            files = self.next_attachments(backend)
+            body, question_category, input_length = self.next_body(backend, files=files)
+            attachments = None if files is None else len(files)
+        
+        # 统计问题类型
+        if question_category in self.question_stats:
+            self.question_stats[question_category] += 1
+        else:
+            self.question_stats[question_category] = 1
+        
+        if self.live is not None:
+            self.live.request_started()
+        start_time = time.perf_counter()
+        result = self.new_result(request_id, question_category)
+        # 实际发出时刻比计划晚了多少，校正协调遗漏时加到延迟上
+        send_delay = max(start_time - intended_start, 0.0) if intended_start is not None else 0.0
+        result['send_delay'] = send_delay
+        result['intended_timestamp'] = result['timestamp'] - send_delay
+        result['backend'] = backend.name
+        result['attachments'] = attachments
+        if input_length is not None:
+            result['input_length'] = input_length
+            result['input_bucket'] = input_length_bucket(input_length)
+        marks = {} if self.trace_config is not None else None  # trace回调记录的各阶段时刻
+        watchdog = StreamWatchdog(self.ttft_timeout, self.idle_timeout) \
+            if self.ttft_timeout or self.idle_timeout else None
+        abort_after = None
+        if self.abort_after_chunks and (self.abort_ratio >= 1 or self._abort_rng.random() < self.abort_ratio):
+            abort_after = self.abort_after_chunks
+        
+        def stop_generation(task_id: Optional[str]) -> Optional[asyncio.Task]:
+            # 在后台调用停止接口，同时继续读取流，观察后端多快结束生成
+            if not task_id:
+                return None
+            return asyncio.ensure_future(self.stop_generation(session, backend, body, task_id))
         
         try:
             async with session.post(
-                self.url, 
-                headers=self.headers, 
-                json=current_payload,
-                timeout=aiohttp.ClientTimeout(total=60)
+                backend.url, 
+                headers=backend.request_headers, 
+                data=body,
+                timeout=self.request_timeout,
+                trace_request_ctx=marks
             ) as response:
-                end_time = time.time()
-                response_time = end_time - start_time
-                
-                # 由于是streaming模式，我们需要读取完整响应
-                response_text = await response.text()
-                
-                return {
-                    'request_id': request_id,
-                    'status_code': response.status,
-                    'response_time': response_time,
-                    'response_size': len(response_text),
-                    'success': response.status == 200,
-                    'error': None,
-                    'question_category': question_category
-                }
+                result['status_code'] = response.status
+                result['header_time'] = time.perf_counter() - start_time
+                await self.read_response(response, start_time, result, backend.adapter, watchdog, abort_after,
+                                         stop_generation if self.abort_mode == "stop" else None)
+                if watchdog is not None and watchdog.stop():
+                    # 超时取消已经发出但尚未送达，在这里接收，避免取消落到调用方
+                    await asyncio.sleep(0)
+                return result
+        except asyncio.CancelledError:
+            if watchdog is None or watchdog.fired is None:
+                raise
+            watchdog.absorb_cancel()
+            budget = self.ttft_timeout if watchdog.fired == "ttft_timeout" else self.idle_timeout
+            self.mark_failed(result, start_time, watchdog.fired, f"{FAILURE_TYPES[watchdog.fired]}（超过{budget}秒）")
+            return result
         except Exception as e:
-            end_time = time.time()
-            response_time = end_time - start_time
-            return {
-                'request_id': request_id,
-                'status_code': 0,
-                'response_time': response_time,
-                'response_size': 0,
-                'success': False,
-                'error': str(e),
-                'question_category': question_category
-            }
-
-    async def run_stress_test(self, concurrent_requests: int = 150):
-        """运行压测"""
-        print(f"🚀 开始压测，并发数: {concurrent_requests}")
-        print(f"📡 目标API: {self.url}")
-        print("-" * 50)
-        
-        connector = aiohttp.TCPConnector(limit=concurrent_requests * 2)
-        
-        async with aiohttp.ClientSession(connector=connector) as session:
+            self.mark_failed(result, start_time, classify_exception(e), str(e) or type(e).__name__)
+            return result
+        finally:
+            if watchdog is not None:
+                watchdog.stop()
+            if marks:
+                result.update(phase_timings(marks, result['header_time'], start_time))
+    
+    @staticmethod
+    def mark_failed(result: Dict[str, Any], start_time: float, failure_type: str, error: str):
+        """请求中途失败：记录耗时、失败类型和错误信息"""
+        result['response_time'] = time.perf_counter() - start_time
+        result['success'] = False
+        result['failure_type'] = failure_type
+        result['error'] = error
+    
+    async def stop_generation(self, session: aiohttp.ClientSession, backend: Backend, body: bytes,
+                              task_id: str) -> int:
+        """调用Dify的停止生成接口（须使用发起请求时的user），返回状态码，请求失败时返回0"""
+        try:
+            user = json.loads(body).get("user", "")
+            async with session.post(backend.stop_url(task_id), headers=backend.request_headers,
+                                    data=json.dumps({"user": user}).encode("utf-8"),
+                                    timeout=self.request_timeout) as response:
+                await response.read()
+                return response.status
+        except Exception:
+            return 0
+
+    @staticmethod
+    def new_result(request_id: int, question_category: str) -> Dict[str, Any]:
+        """创建一条空的请求结果"""
+        return {
+            'request_id': request_id,
+            'status_code': 0,
+            'response_time': 0.0,
+            'header_time': None,
+            'ttft': None,
+            'generation_time': None,
+            'inter_token_latencies': [],
+            'chunk_count': 0,
+            'output_tokens': 0,
+            'tokens_per_second': None,
+            'response_size': 0,
+            'success': False,
+            'error': None,
+            'failure_type': None,     # 失败类型，见request_timeouts.FAILURE_TYPES
+            'aborted': False,         # 是否按abort_after_chunks主动中断
+            'stop_latency': None,     # 调用停止接口到流结束的耗时（秒）
+            'stop_status': None,      # 停止接口的状态码，0表示调用失败
+            'question_category': question_category,
+            'stage': None,
+            'turn': None,             # 多轮会话中的第几轮
+            'input_length': None,     # 问题的字符数
+            'input_bucket': None,     # 问题长度所在的分桶
+            'conversation_id': None,  # 响应中返回的会话ID
+            'backend': None,          # 请求发往的压测目标
+            'attachments': None,      # 请求附带的已上传文件数，None表示未启用附件
+            'dns_time': None,         # 以下为HTTP分阶段耗时，未开启http_tracing时为None
+            'pool_wait_time': None,
+            'connect_time': None,
+            'send_time': None,
+            'wait_time': None,
+            'first_byte_time': None,
+            'connection_reused': None,
+            'send_delay': None,          # 实际发出时刻相对负载计划的滞后（秒）
+            'intended_timestamp': None,  # 负载计划中请求应发出的Unix时间
+            'timestamp': time.time()     # 请求实际开始的Unix时间，用于离线分析
+        }
+
+    async def read_response(self, response: aiohttp.ClientResponse, start_time: float, result: Dict[str, Any],
+                            adapter: ProtocolAdapter, watchdog: Optional[StreamWatchdog] = None,
+                            abort_after: Optional[int] = None,
+                            stop_generation: Optional[Callable[[Optional[str]], Optional[asyncio.Task]]] = None):
+        """读取响应体并填充结果，streaming模式下边到达边由协议适配器解析SSE事件；
+        abort_after不为None时收到该数量的输出块后中断：stop_generation为None时直接断开连接，
+        否则以流中的task_id调用它并继续读到流结束"""
+        if response.status != 200:
+            if watchdog is not None:
+                watchdog.stop()
+            body = await response.read()
+            result['response_time'] = time.perf_counter() - start_time
+            result['response_size'] = len(body)
+            result['failure_type'] = 'http_error'
+            result['error'] = body[:200].decode('utf-8', errors='replace')
+            return
+        
+        if 'text/event-stream' not in response.headers.get('Content-Type', ''):
+            # blocking模式：整个回答一次性返回，收到响应头即视为收到第一段输出
+            if watchdog is not None:
+                watchdog.first_output()
+            body = await response.read()
+            end_time = time.perf_counter()
+            result['response_time'] = end_time - start_time
+            result['response_size'] = len(body)
+            try:
+                data = json.loads(body)
+            except ValueError:
+                data = {}
+            text, tokens, error = adapter.parse_blocking(data)
+            result['conversation_id'] = adapter.conversation_id(data)
+            if text:
+                result['chunk_count'] = 1
+                result['output_tokens'] = tokens or 1
+            result['error'] = error
+            result['success'] = error is None
+            if error is not None:
+                result['failure_type'] = 'response_error'
+            return
+        
+        parser = SSEParser()
+        first_chunk_time = None
+        last_chunk_time = None
+        usage_tokens = None
+        stream_error = None
+        response_size = 0
+        track_conversation = adapter.supports_conversations
+        task_id = None
+        stop_task = None
+        stop_time = None
+        
+        def handle(events: List[Dict[str, Any]], now: float):
+            nonlocal first_chunk_time, last_chunk_time, usage_tokens, stream_error, track_conversation, task_id
+            for event in events:
+                if track_conversation:
+                    conversation_id = adapter.conversation_id(event['data'])
+                    if conversation_id:
+                        result['conversation_id'] = conversation_id
+                        track_conversation = False
+                if stop_generation is not None and task_id is None:
+                    task_id = adapter.task_id(event['data'])
+                text, tokens, error = adapter.parse_event(event)
+                if text:
+                    if first_chunk_time is None:
+                        first_chunk_time = now
+                        if watchdog is not None:
+                            watchdog.first_output()
+                    else:
+                        result['inter_token_latencies'].append(now - last_chunk_time)
+                    last_chunk_time = now
+                    result['chunk_count'] += 1
+                if tokens:
+                    usage_tokens = tokens
+                if error is not None:
+                    stream_error = f"stream error: {error}"
+        
+        async for chunk in response.content.iter_any():
+            now = time.perf_counter()
+            if watchdog is not None:
+                watchdog.received()
+            if not response_size:
+                result['first_byte_time'] = now - start_time
+            response_size += len(chunk)
+            handle(parser.feed(chunk), now)
+            if abort_after is not None and not result['aborted'] and result['chunk_count'] >= abort_after:
+                result['aborted'] = True
+                if stop_generation is None:
+                    # 不读剩余的流，连接随之关闭，不会回到连接池
+                    response.close()
+                    break
+                stop_time = now
+                stop_task = stop_generation(task_id)
+        end_time = time.perf_counter()
+        if watchdog is not None:
+            watchdog.stop()
+        if not result['aborted'] or stop_generation is not None:
+            handle(parser.close(), end_time)
+        if stop_task is not None:
+            result['stop_latency'] = end_time - stop_time
+            result['stop_status'] = await stop_task
+        elif stop_time is not None:
+            # 流中没有task_id，无法调用停止接口
+            result['stop_status'] = 0
+        
+        result['response_time'] = end_time - start_time
+        result['response_size'] = response_size
+        result['output_tokens'] = usage_tokens or result['chunk_count']
+        if first_chunk_time is not None:
+            result['ttft'] = first_chunk_time - start_time
+            result['generation_time'] = last_chunk_time - first_chunk_time
+            if result['generation_time'] > 0 and result['output_tokens'] > 1:
+                result['tokens_per_second'] = (result['output_tokens'] - 1) / result['generation_time']
+        result['error'] = stream_error
+        result['success'] = stream_error is None
+        if stream_error is not None:
+            result['failure_type'] = 'response_error'
+
+    async def _send_and_record(self, session: aiohttp.ClientSession, request_id: int, body: Optional[bytes] = None,
+                               question_category: Optional[str] = None, input_length: Optional[int] = None,
+                               stage: Optional[str] = None, intended_start: Optional[float] = None,
+                               backend: Optional[Backend] = None, attachments: Optional[int] = None):
+        """发送请求并在完成时记录结果"""
+        result = await self.send_request(session, request_id, body, question_category, input_length, intended_start,
+                                         backend, attachments)
+        result['stage'] = stage
+        self.record_result(result)
+
+    def reset_stats(self):
+        """清空上一轮压测的结果和统计"""
+        self.results = ResultStore()
+        self.question_stats = {}
+        self.stats = StatsCollector(self.histogram_precision, self.GROUP_FIELDS)
+        self.sampler = self._new_sampler()
+        self.close_result_log()
+        if self.result_log_path:
+            self.result_log = ResultLogWriter(self.result_log_path)
+
+    async def begin_run(self):
+        """每轮压测开始时调用：清空统计，打开结果日志，启动实时指标和事件循环延迟采样"""
+        self.reset_stats()
+        self.loop_name = loop_name()
+        self.loop_monitor = LoopLagMonitor(significant_digits=self.histogram_precision)
+        self.loop_monitor.start()
+        if self.live_interval or self.metrics_port is not None:
+            self.live = LiveMetrics(self.live_window, self.histogram_precision)
+            self._live_reporter = LiveReporter(self.live, self.live_interval, self.metrics_port)
+            await self._live_reporter.start()
+
+    async def end_run(self):
+        """每轮压测结束时调用：写完结果日志，停止实时指标和事件循环延迟采样"""
+        if self.loop_monitor is not None:
+            await self.loop_monitor.stop()
+            # 计入统计后可随其他指标一起在多进程、分布式模式下合并
+            self.stats.histogram("loop_lag").merge(self.loop_monitor.lags)
+            self.loop_monitor = None
+        self.close_result_log()
+        if self._live_reporter is not None:
+            await self._live_reporter.stop()
+            self._live_reporter = None
+
+    def close_result_log(self):
+        """等待结果日志写完并关闭"""
+        if self.result_log is not None:
+            self.result_log.close()
+            self.result_log = None
+
+    def record_result(self, result: Dict[str, Any]):
+        """记录一条请求结果"""
+        self.stats.record(result)
+        if self.live is not None:
+            self.live.request_finished(result)
+        if self.result_log is not None:
+            self.result_log.write(result)
+        if self.keep_results:
+            self.results.append(result)
+
+    def record_exceptions(self, outcomes: List[Any]):
+        """记录gather返回的、未被send_request捕获的异常"""
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException):
+                self.stats.record_exception(outcome)
+                if self.live is not None:
+                    self.live.request_raised()
+                if self.result_log is not None:
+                    self.result_log.write_exception(outcome)
+                if self.keep_results:
+                    self.results.record_exception()
+
+    @contextlib.asynccontextmanager
+    async def open_session(self, limit: int, report: bool = True):
+        """创建本轮压测的会话：连接池上限为limit（0表示不限），注册分阶段计时回调，按需预热连接并上传附件"""
+        connector = aiohttp.TCPConnector(limit=limit)
+        trace_configs = [self.trace_config] if self.trace_config is not None else None
+        async with aiohttp.ClientSession(connector=connector, trace_configs=trace_configs) as session:
+            if self.warmup_connections > 0:
+                await self.warm_up_connections(session, min(self.warmup_connections, limit or self.warmup_connections),
+                                               report)
+            if self.upload_files:
+                await self.upload_attachments(session, report)
+            yield session
+
+    async def warm_up_connections(self, session: aiohttp.ClientSession, count: int, report: bool = True) -> int:
+        """并发发送count个HEAD请求（多个目标时平均分配），让连接池在计时开始前建立好连接，返回预热成功的连接数"""
+        async def touch(backend: Backend):
+            async with session.head(backend.url, headers=backend.request_headers, timeout=self.request_timeout,
+                                    allow_redirects=False) as response:
+                await response.read()
+
+        start_time = time.perf_counter()
+        # 请求同时发出且都未释放连接，连接池会为每个请求新建一个连接
+        outcomes = await asyncio.gather(*(touch(self.backends[i % len(self.backends)]) for i in range(count)),
+                                        return_exceptions=True)
+        warmed = sum(1 for outcome in outcomes if not isinstance(outcome, BaseException))
+        if report:
+            print(f"🔥 已预热 {warmed}/{count} 个连接，耗时 {time.perf_counter() - start_time:.2f}秒")
+        return warmed
+
+    def print_targets(self):
+        """打印压测目标，多个目标或非默认协议时注明名称"""
+        for backend in self.backends:
+            named = len(self.backends) > 1 or backend.adapter.name != "dify-chat"
+            print(f"📡 目标API: {backend.url}" + (f" ({backend.name})" if named else ""))
+
+    async def run_stress_test(self, concurrent_requests: int = 150, report: bool = True) -> Dict[str, Any]:
+        """运行压测，report=False时不打印，只返回运行摘要"""
+        if report:
+            print(f"🚀 开始压测，并发数: {concurrent_requests}")
+            self.print_targets()
+            print("-" * 50)
+        
+        await self.begin_run()
+        async with self.open_session(concurrent_requests * 2, report) as session:
             # 创建并发任务
+            # 记录开始时间，同一批请求的计划发出时刻都是开始时间
+            start_time = time.perf_counter()
+            
             tasks = []
             for i in range(concurrent_requests):
-                task = asyncio.create_task(self.send_request(session, i + 1))
+                task = asyncio.create_task(self._send_and_record(session, i + 1, intended_start=start_time))
                 tasks.append(task)
             
-            # 记录开始时间
-            start_time = time.time()
-            
             # 等待所有任务完成
-            self.results = await asyncio.gather(*tasks, return_exceptions=True)
+            outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+            self.record_exceptions(outcomes)
             
             # 记录结束时间
-            end_time = time.time()
+            end_time = time.perf_counter()
             total_time = end_time - start_time
+        
+        await self.end_run()
+        # 打印结果
+        if report:
+            self.print_results(total_time)
+        return {"total_time": total_time}
+
+    async def run_open_loop_test(self, arrival_rate: float, duration: float, distribution: str = "constant",
+                                 max_in_flight: Optional[int] = None, seed: Optional[int] = None,
+                                 warmup: float = 0.0, start_offset: float = 0.0, report: bool = True) -> Dict[str, Any]:
+        """运行开环压测：按目标速率持续发送请求，不等待之前的请求完成
+        warmup>0时前warmup秒发出的请求计入"warmup"阶段，其余计入"measure"阶段，可按阶段分别统计；
+        start_offset为第一个请求的发送时刻（秒），多进程分担速率时由split_plan设置"""
+        schedule = ArrivalSchedule(arrival_rate, duration, distribution, seed, start_offset)
+        
+        if report:
+            print(f"🚀 开始开环压测，目标速率: {arrival_rate}请求/秒 ({distribution})，持续: {duration}秒")
+            self.print_targets()
+            if max_in_flight:
+                print(f"🔒 最大在途请求数: {max_in_flight}")
+            print("-" * 50)
+        
+        await self.begin_run()
+        in_flight = set()
+        send_lags = LatencyHistogram(significant_digits=self.histogram_precision)
+        issued = 0
+        dropped = 0
+        
+        # 开环模式下连接数不能成为瓶颈，否则新请求会排队等待连接
+        async with self.open_session(max_in_flight or 0, report) as session:
+            start_time = time.perf_counter()
+            
+            for offset in schedule:
+                delay = start_time + offset - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                send_lags.record(time.perf_counter() - start_time - offset)
+                
+                if max_in_flight and len(in_flight) >= max_in_flight:
+                    dropped += 1
+                    continue
+                
+                issued += 1
+                stage = None if not warmup else ("warmup" if offset < warmup else "measure")
+                task = asyncio.create_task(self._send_and_record(session, issued, stage=stage,
+                                                                 intended_start=start_time + offset))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+            
+            # 等待仍在进行中的请求完成
+            if in_flight:
+                outcomes = await asyncio.gather(*in_flight, return_exceptions=True)
+                self.record_exceptions(outcomes)
             
-            # 打印结果
+            total_time = time.perf_counter() - start_time
+        
+        await self.end_run()
+        if report:
             self.print_results(total_time)
-    
+            self.print_arrival_stats(arrival_rate, duration, issued, dropped, send_lags)
+        return {"total_time": total_time, "issued": issued, "dropped": dropped, "send_lags": send_lags}
+
+    async def run_trace_replay(self, trace_path: str, speed: float = 1.0, loops: int = 1,
+                               duration: Optional[float] = None, shard_index: int = 0, shard_count: int = 1,
+                               report: bool = True) -> Dict[str, Any]:
+        """回放生产流量轨迹：按记录的相对时间（除以speed）发送记录中的问题、用户和会话ID"""
+        reader = TraceReader(trace_path, speed, loops, duration, shard_index=shard_index, shard_count=shard_count)
+        
+        if report:
+            loop_text = "无限循环" if loops == 0 else f"{loops}遍"
+            print(f"🚀 开始回放流量轨迹: {trace_path}，倍速: {speed}x，{loop_text}")
+            if duration is not None:
+                print(f"⏳ 最长回放时间: {duration}秒")
+            self.print_targets()
+            print("-" * 50)
+        
+        await self.begin_run()
+        in_flight = set()
+        send_lags = LatencyHistogram(significant_digits=self.histogram_precision)
+        issued = 0
+        last_offset = 0.0
+        
+        # 与开环模式相同，连接数不能限制回放节奏
+        async with self.open_session(0, report) as session:
+            start_time = time.perf_counter()
+            
+            for offset, record in reader:
+                # 轨迹在读取时才编码请求体，避免整份轨迹常驻内存
+                prompt = record[reader.prompt_field]
+                backend = self.next_backend()
+                files = self.next_attachments(backend)
+                body = self.build_body(prompt, backend, user=record.get("user"),
+                                       conversation_id=record.get("conversation_id"), files=files)
+                question_category = record.get("category") or "trace"
+                
+                delay = start_time + offset - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                send_lags.record(time.perf_counter() - start_time - offset)
+                
+                issued += 1
+                last_offset = offset
+                task = asyncio.create_task(self._send_and_record(session, issued, body, question_category, len(prompt),
+                                                                 intended_start=start_time + offset, backend=backend,
+                                                                 attachments=None if files is None else len(files)))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+            
+            if in_flight:
+                outcomes = await asyncio.gather(*in_flight, return_exceptions=True)
+                self.record_exceptions(outcomes)
+            
+            total_time = time.perf_counter() - start_time
+        
+        await self.end_run()
+        if report:
+            self.print_results(total_time)
+            self.print_replay_stats(speed, issued, reader.completed_loops, last_offset, send_lags)
+        return {"total_time": total_time, "issued": issued, "loops": reader.completed_loops,
+                "replay_span": last_offset, "send_lags": send_lags}
+
+    async def run_load_profile(self, profile: LoadProfile, tick: float = 0.5, pacing: Optional[float] = None,
+                               report: bool = True) -> Dict[str, Any]:
+        """按负载曲线运行闭环压测：工作协程池始终保持当前阶段要求的在途请求数
+        pacing为每个用户的计划请求间隔（秒）：上一个请求提前完成时等到下一个计划时刻再发，
+        超时完成时立即发出并把滞后计入协调遗漏校正；None表示请求背靠背发送"""
+        if report:
+            print(f"🚀 开始分阶段压测，共{len(profile.stages)}个阶段，总时长: {profile.total_duration}秒")
+            self.print_targets()
+            if pacing:
+                print(f"⏲️  每用户请求间隔: {pacing}秒")
+            for index, stage in enumerate(profile.stages):
+                from_users, to_users = profile.stage_range(index)
+                mode = "爬坡" if stage.ramp and from_users != to_users else "保持"
+                print(f"   {stage.name}: {from_users}→{to_users}用户 ({mode}) {stage.duration}秒")
+            print("-" * 50)
+        
+        await self.begin_run()
+        target_users = 0
+        request_counter = 0
+        workers = {}
+        
+        async def worker(worker_id: int):
+            nonlocal request_counter
+            intended_start = time.perf_counter()
+            # 用户数下调时，编号超出目标的工作协程在当前请求结束后退出
+            while worker_id < target_users:
+                if pacing:
+                    delay = intended_start - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                        if worker_id >= target_users:
+                            break
+                request_counter += 1
+                stage = profile.stages[profile.stage_index_at(time.perf_counter() - start_time)]
+                result = await self.send_request(session, request_counter,
+                                                 intended_start=intended_start if pacing else None)
+                result['stage'] = stage.name
+                self.record_result(result)
+                if pacing:
+                    intended_start += pacing
+        
+        async with self.open_session(max(profile.max_users(), 1), report) as session:
+            start_time = time.perf_counter()
+            
+            while True:
+                elapsed = time.perf_counter() - start_time
+                if elapsed >= profile.total_duration:
+                    break
+                target_users = profile.users_at(elapsed)
+                for worker_id in range(target_users):
+                    task = workers.get(worker_id)
+                    if task is None or task.done():
+                        workers[worker_id] = asyncio.create_task(worker(worker_id))
+                await asyncio.sleep(min(tick, profile.total_duration - elapsed))
+            
+            # 曲线结束后不再发起新请求，等待在途请求完成
+            target_users = 0
+            outcomes = await asyncio.gather(*workers.values(), return_exceptions=True)
+            self.record_exceptions(outcomes)
+            
+            total_time = time.perf_counter() - start_time
+        
+        await self.end_run()
+        if report:
+            self.print_results(total_time)
+            self.print_stage_stats(profile)
+        return {"total_time": total_time}
+
+    async def run_sessions(self, users: int, duration: float, turns: Union[int, Sequence[int]] = 3,
+                           think_time: str = "constant:0", seed: Optional[int] = None,
+                           report: bool = True) -> Dict[str, Any]:
+        """按多轮会话运行闭环压测：每个虚拟用户以独立的user值开启会话，
+        从首轮响应中取得conversation_id，思考think_time后继续追问，直到完成turns轮再开启新会话；
+        每轮的计划发出时刻为上一轮结束时刻加思考时间，用于协调遗漏校正"""
+        for backend in self.backends:
+            if not backend.adapter.supports_conversations:
+                raise ValueError(f"多轮会话模式需要支持conversation_id的协议，目标{backend.name}的协议{backend.adapter.name}不支持")
+            if "conversation_id" not in backend.payload:
+                raise ValueError("多轮会话模式需要payload中包含conversation_id字段")
+        min_turns, max_turns = (turns, turns) if isinstance(turns, int) else tuple(turns)
+        think = Distribution(think_time)
+        rng = random.Random(seed)
+        base_user = self.payload.get("user") or "stress"
+        
+        if report:
+            turn_text = f"{min_turns}" if min_turns == max_turns else f"{min_turns}~{max_turns}"
+            print(f"🚀 开始多轮会话压测，虚拟用户: {users}，每个会话{turn_text}轮，思考时间: {think_time}，持续: {duration}秒")
+            self.print_targets()
+            print("-" * 50)
+        
+        await self.begin_run()
+        request_counter = 0
+        sessions = {"started": 0, "completed": 0, "failed": 0}
+        
+        async def virtual_user(user_index: int):
+            nonlocal request_counter
+            user = f"{base_user}-vu{user_index}"
+            # 会话只在创建它的目标上有效，每个虚拟用户固定使用一个目标
+            backend = self.backends[user_index % len(self.backends)]
+            while time.perf_counter() < deadline:
+                sessions["started"] += 1
+                session_turns = rng.randint(min_turns, max_turns)
+                conversation_id = ""
+                # 计划发出时刻：首轮为会话开始时刻，之后为上一轮结束时刻加思考时间，
+                # 事件循环繁忙导致醒来或组装请求晚了的部分计入send_delay
+                intended_start = time.perf_counter()
+                for turn in range(1, session_turns + 1):
+                    if turn > 1:
+                        pause = think.sample(rng)
+                        intended_start = time.perf_counter() + pause
+                        await asyncio.sleep(pause)
+                        if time.perf_counter() >= deadline:
+                            return
+                    files = self.next_attachments(backend)
+                    body, question_category, input_length = self.next_body(backend, user=user,
+                                                                           conversation_id=conversation_id, files=files)
+                    request_counter += 1
+                    result = await self.send_request(session, request_counter, body, question_category, input_length,
+                                                     intended_start=intended_start, backend=backend,
+                                                     attachments=None if files is None else len(files))
+                    result['turn'] = turn
+                    self.record_result(result)
+                    if not result['success'] or not result['conversation_id']:
+                        # 拿不到会话ID就无法继续追问，放弃本会话
+                        sessions["failed"] += 1
+                        break
+                    conversation_id = result['conversation_id']
+                else:
+                    sessions["completed"] += 1
+        
+        async with self.open_session(max(users, 1), report) as session:
+            start_time = time.perf_counter()
+            deadline = start_time + duration
+            tasks = [asyncio.create_task(virtual_user(i)) for i in range(users)]
+            outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+            self.record_exceptions(outcomes)
+            total_time = time.perf_counter() - start_time
+        
+        await self.end_run()
+        if report:
+            self.print_results(total_time)
+            self.print_session_stats(sessions["started"], sessions["completed"], sessions["failed"])
+        return {"total_time": total_time, "sessions": sessions["started"],
+                "sessions_completed": sessions["completed"], "sessions_failed": sessions["failed"]}
+
+    def print_stage_stats(self, profile: LoadProfile):
+        """按阶段打印统计，便于观察延迟随负载变化的拐点"""
+        print(f"\n🪜 分阶段统计:")
+        stage_groups = self.stats.groups.get("stage", {})
+        for index, stage in enumerate(profile.stages):
+            from_users, to_users = profile.stage_range(index)
+            stage_stats = stage_groups.get(stage.name)
+            
+            print(f"\n[{stage.name}] {from_users}→{to_users}用户，{stage.duration}秒")
+            if stage_stats is None or not stage_stats.total:
+                print("无请求")
+                continue
+            print(f"请求数: {stage_stats.total} | 成功率: {stage_stats.success/stage_stats.total*100:.2f}% | "
+                  f"吞吐: {stage_stats.total/stage.duration:.2f}请求/秒")
+            self.print_percentiles("响应时间", stage_stats.histogram("response_time"))
+            self.print_percentiles("首字延迟TTFT", stage_stats.histogram("ttft"))
+
+    def print_group_stats(self, field: str, title: str,
+                          metrics: Sequence[Tuple[str, str]] = (("响应时间", "response_time"), ("首字延迟TTFT", "ttft"))):
+        """按结果字段分组打印统计，metrics为要打印的(名称, 指标)"""
+        groups = self.stats.groups.get(field)
+        if not groups:
+            return
+        order = self.GROUP_ORDERS.get(field)
+        keys = [key for key in order if key in groups] if order else list(groups)
+        print(f"\n{title}:")
+        for key in keys:
+            group_stats = groups[key]
+            print(f"\n[{key}] 请求数: {group_stats.total} | 成功率: {group_stats.success/group_stats.total*100:.2f}%")
+            for label, name in metrics:
+                unit, precision = ("token/秒", 1) if name == "tokens_per_second" else ("秒", 3)
+                self.print_percentiles(label, group_stats.histogram(name), unit=unit, precision=precision)
+
+    def print_session_stats(self, started: int, completed: int, failed: int):
+        """打印多轮会话的完成情况和各轮次的延迟"""
+        print(f"\n💬 多轮会话统计:")
+        print(f"开启会话: {started} | 完成全部轮次: {completed} | 中途失败: {failed} | 压测结束时未完成: "
+              f"{started - completed - failed}")
+        self.print_group_stats("turn", "💬 分轮次统计")
+
+    def print_arrival_stats(self, target_rate: float, duration: float, issued: int, dropped: int,
+                            send_lags: LatencyHistogram):
+        """打印开环模式下目标速率与实际速率的对比"""
+        achieved_rate = issued / duration
+        
+        print(f"\n📈 开环负载统计:")
+        print(f"目标速率: {target_rate:.2f}请求/秒")
+        print(f"实际发送速率: {achieved_rate:.2f}请求/秒 ({achieved_rate/target_rate*100:.1f}%)")
+        print(f"已发送请求: {issued}")
+        if dropped:
+            print(f"因在途上限丢弃: {dropped}")
+        self.print_percentiles("发送延后", send_lags)
+
+    def print_replay_stats(self, speed: float, issued: int, loops: int, replay_span: float,
+                           send_lags: LatencyHistogram):
+        """打印流量回放的节奏还原情况"""
+        print(f"\n🎞️  流量回放统计:")
+        print(f"回放倍速: {speed}x")
+        print(f"已回放请求: {issued}")
+        print(f"完整回放遍数: {loops}")
+        print(f"回放时间跨度: {replay_span:.2f}秒 (对应原始轨迹 {replay_span*speed:.2f}秒)")
+        if replay_span > 0:
+            print(f"平均发送速率: {issued/replay_span:.2f}请求/秒")
+        self.print_percentiles("发送延后", send_lags)
+
     def print_results(self, total_time: float):
         """打印压测结果"""
-        successful_requests = [r for r in self.results if isinstance(r, dict) and r['success']]
-        failed_requests = [r for r in self.results if isinstance(r, dict) and not r['success']]
-        exception_requests = [r for r in self.results if not isinstance(r, dict)]
-        
-        total_requests = len(self.results)
-        success_count = len(successful_requests)
-        failed_count = len(failed_requests)
-        exception_count = len(exception_requests)
+        stats = self.stats
+        total_requests = stats.total
+        success_count = stats.success
+        failed_count = stats.failed
+        exception_count = stats.exceptions
         
         print(f"\n📊 压测结果统计:")
         print(f"{'='*50}")
         print(f"总请求数: {total_requests}")
+        if total_requests == 0:
+            return
         print(f"成功请求: {success_count}")
         print(f"失败请求: {failed_count}")
         print(f"异常请求: {exception_count}")
@@ -124,40 +974,163 @@ class APIStressTester:
         print(f"总耗时: {total_time:.2f}秒")
         print(f"平均QPS: {total_requests/total_time:.2f}")
         
-        if successful_requests:
-            response_times = [r['response_time'] for r in successful_requests]
-            response_times.sort()
-            
+        response_times = stats.histogram("response_time")
+        if response_times.count:
             print(f"\n⏱️  响应时间统计:")
-            print(f"平均响应时间: {sum(response_times)/len(response_times):.3f}秒")
-            print(f"最快响应时间: {min(response_times):.3f}秒")
-            print(f"最慢响应时间: {max(response_times):.3f}秒")
-            print(f"50%响应时间: {response_times[len(response_times)//2]:.3f}秒")
-            print(f"95%响应时间: {response_times[int(len(response_times)*0.95)]:.3f}秒")
-            print(f"99%响应时间: {response_times[int(len(response_times)*0.99)]:.3f}秒")
-        
-        if failed_requests:
+            print(f"平均响应时间: {response_times.mean():.3f}秒")
+            print(f"最快响应时间: {response_times.min:.3f}秒")
+            print(f"最慢响应时间: {response_times.max:.3f}秒")
+            print(f"50%响应时间: {response_times.percentile(0.50):.3f}秒")
+            print(f"95%响应时间: {response_times.percentile(0.95):.3f}秒")
+            print(f"99%响应时间: {response_times.percentile(0.99):.3f}秒")
+        
+        if success_count:
+            self.print_stream_stats(stats)
+        
+        self.print_http_phase_stats(stats)
+        self.print_loop_lag_stats(stats)
+        self.print_corrected_stats(stats)
+        
+        if failed_count:
             print(f"\n❌ 失败请求详情:")
-            status_codes = {}
-            for req in failed_requests:
-                status_code = req['status_code']
-                if status_code in status_codes:
-                    status_codes[status_code] += 1
-                else:
-                    status_codes[status_code] = 1
-            
-            for status_code, count in status_codes.items():
+            for status_code, count in stats.status_codes.items():
                 print(f"状态码 {status_code}: {count}次")
+            if stats.failure_types:
+                print("失败原因:")
+                for failure_type, count in sorted(stats.failure_types.items(), key=lambda item: -item[1]):
+                    print(f"   {FAILURE_TYPES.get(failure_type, failure_type)}: {count}次")
         
-        if exception_requests:
+        self.print_abort_stats(stats)
+        
+        if exception_count:
             print(f"\n⚠️  异常请求: {exception_count}次")
         
         # 显示问题类型统计
-        if self.use_random_questions and self.question_stats:
+        if self.question_stats and set(self.question_stats) != {"fixed"}:
             print(f"\n🎯 问题类型分布:")
             for category, count in sorted(self.question_stats.items()):
                 percentage = (count / total_requests) * 100
                 print(f"   {category}: {count}次 ({percentage:.1f}%)")
+        
+        # 多个目标交替承受相同负载时，逐个对比
+        if len(stats.groups.get("backend", {})) > 1:
+            self.print_group_stats("backend", self.GROUP_TITLES["backend"], self.BACKEND_METRICS)
+        
+        # 部分请求附带附件时，分别统计带与不带附件的延迟
+        if len(stats.groups.get("attachments", {})) > 1:
+            self.print_group_stats("attachments", self.GROUP_TITLES["attachments"], self.BACKEND_METRICS)
+        
+        # 问题长度跨越多个分桶时（如合成问题），按输入长度分别统计
+        if len(stats.groups.get("input_bucket", {})) > 1:
+            self.print_group_stats("input_bucket", self.GROUP_TITLES["input_bucket"] + " (字符)")
+        
+        if len(self.results):
+            self.print_result_breakdowns(self.results)
+
+    def print_result_breakdowns(self, store: ResultStore):
+        """从逐请求结果按问题类别、状态码、阶段和时间段分组，打印每组的成功率和响应时间、TTFT的精确分位数"""
+        for key, title in self.BREAKDOWN_TITLES.items():
+            groups = store.group_by(key, ("response_time", "ttft"), time_bucket=self.time_bucket)
+            groups = [group for group in groups if key == "status_code" or group["key"] is not None]
+            if len(groups) < 2:
+                continue
+            print(f"\n{title}:")
+            for group in groups:
+                if key == "time_bucket":
+                    label = f"{group['key']:g}-{group['key'] + self.time_bucket:g}秒"
+                elif key == "status_code":
+                    label = f"状态码 {group['key']}"
+                else:
+                    label = group["key"]
+                parts = [f"[{label}] 请求数 {group['count']}", f"成功率 {group['success']/group['count']*100:.2f}%"]
+                for name, metric in (("响应时间", "response_time"), ("TTFT", "ttft")):
+                    entry = group["metrics"][metric]
+                    if entry["count"]:
+                        parts.append(f"{name} 平均 {entry['mean']:.3f} P50 {entry[0.5]:.3f} P90 {entry[0.9]:.3f} "
+                                     f"P99 {entry[0.99]:.3f}")
+                print(" | ".join(parts))
+
+    def print_percentiles(self, label: str, histogram: LatencyHistogram, unit: str = "秒", precision: int = 3):
+        """打印直方图的平均值及P50/P90/P95/P99"""
+        if not histogram.count:
+            return
+        parts = [f"平均 {histogram.mean():.{precision}f}"]
+        for name, p in (("P50", 0.5), ("P90", 0.9), ("P95", 0.95), ("P99", 0.99)):
+            parts.append(f"{name} {histogram.percentile(p):.{precision}f}")
+        parts.append(f"最大 {histogram.max:.{precision}f}")
+        print(f"{label}({unit}): " + " | ".join(parts))
+
+    def print_abort_stats(self, stats: StatsCollector):
+        """打印主动中断的请求数，调用停止接口时打印从停止到流结束的耗时"""
+        if not stats.aborted:
+            return
+        detail = ""
+        if self.abort_after_chunks:
+            mode = "调用停止生成接口" if self.abort_mode == "stop" else "断开连接"
+            detail = f" (收到{self.abort_after_chunks}块输出后{mode})"
+        print(f"\n✂️  主动中断: {stats.aborted}个请求{detail}")
+        print("   输出被截断，不计入响应时间、生成耗时、输出长度和解码吞吐，只计入首字延迟和字间延迟")
+        self.print_percentiles("停止到流结束", stats.histogram("stop_latency"))
+        if stats.stop_failed:
+            print(f"停止接口调用失败: {stats.stop_failed}次")
+
+    def print_http_phase_stats(self, stats: StatsCollector):
+        """打印HTTP分阶段耗时和连接复用率"""
+        connections = stats.connections_reused + stats.connections_new
+        if not connections:
+            return
+        
+        print(f"\n🌐 HTTP分阶段耗时 (成功和失败的请求均计入):")
+        for name, label in PHASE_FIELDS.items():
+            self.print_percentiles(label, stats.histogram(name))
+        print(f"连接复用率: {stats.connections_reused/connections*100:.1f}% "
+              f"(复用 {stats.connections_reused}次，新建 {stats.connections_new}次)")
+
+    def loop_lag_exceeded(self, stats: Optional[StatsCollector] = None) -> bool:
+        """客户端事件循环延迟的P99是否超过阈值，超过时测得的延迟中可能包含客户端自身的排队"""
+        lags = (stats or self.stats).histogram("loop_lag")
+        return self.loop_lag_threshold is not None and lags.count > 0 and \
+            lags.percentile(0.99) > self.loop_lag_threshold
+
+    def print_loop_lag_stats(self, stats: StatsCollector):
+        """打印客户端事件循环延迟，超过阈值时给出提示"""
+        lags = stats.histogram("loop_lag")
+        if not lags.count:
+            return
+        
+        backend = f" ({self.loop_name})" if self.loop_name else ""
+        print(f"\n🖥️  客户端事件循环延迟{backend}:")
+        self.print_percentiles("调度延迟", lags, precision=4)
+        if self.loop_lag_exceeded(stats):
+            print(f"⚠️  P99调度延迟 {lags.percentile(0.99)*1000:.1f}毫秒，超过阈值 {self.loop_lag_threshold*1000:.0f}毫秒："
+                  f"客户端自身已接近饱和，测得的延迟可能偏高，建议增加进程数(processes)或使用uvloop")
+
+    def print_corrected_stats(self, stats: StatsCollector):
+        """并列打印原始延迟和校正协调遗漏后（从计划发出时刻起算）的延迟"""
+        send_delays = stats.histogram("send_delay")
+        if not send_delays.count or not send_delays.max:
+            return
+        
+        print(f"\n🧭 协调遗漏校正 (校正值从负载计划中的发出时刻起算):")
+        self.print_percentiles("发送滞后", send_delays)
+        for label, name in (("响应时间", "response_time"), ("首字延迟TTFT", "ttft")):
+            self.print_percentiles(f"{label}-原始", stats.histogram(name))
+            self.print_percentiles(f"{label}-校正", stats.histogram("corrected_" + name))
+
+    def print_stream_stats(self, stats: StatsCollector):
+        """打印流式生成相关的统计"""
+        streamed_count = stats.histogram("ttft").count
+        if not streamed_count:
+            return
+        
+        print(f"\n🔤 流式生成统计 ({streamed_count}个流式响应):")
+        self.print_percentiles("响应头到达", stats.histogram("header_time"))
+        self.print_percentiles("首字延迟TTFT", stats.histogram("ttft"))
+        self.print_percentiles("字间延迟ITL", stats.histogram("inter_token_latency"))
+        self.print_percentiles("生成耗时", stats.histogram("generation_time"))
+        self.print_percentiles("输出块数", stats.histogram("chunk_count"), unit="个", precision=0)
+        self.print_percentiles("输出token数", stats.histogram("output_tokens"), unit="个", precision=0)
+        self.print_percentiles("解码吞吐", stats.histogram("tokens_per_second"), unit="token/秒", precision=1)
 
 
 async def main():
@@ -177,17 +1150,11 @@ async def main():
         "query": "What are the specs of the iPhone 13 Pro Max?",
         "response_mode": "streaming",
         "conversation_id": "",
-        "user": "abc-123",
-        "files": [
-            {
-                "type": "image",
-                "transfer_method": "remote_url",
-                "url": "https://cloud.dify.ai/logo/logo-site.png"
-            }
-        ]
+        "user": "abc-123"
     }
     
     # 创建压测实例 (使用随机问题)
+    # 需要附带图片时用upload_files=["图片路径"]预先上传一次，不要在payload中用remote_url让后端每个请求都重新下载
     tester = APIStressTester(url, headers, payload, use_random_questions=True)
     
     # 运行压测
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+基线与回退检测
+把一轮压测的统计（计数器和各指标直方图，含按问题类别的分组）保存为命名基线，
+再把之后的运行与基线比较：对每个指标、每个问题类别给出分位数的变化及其置信区间或秩和检验结果，
+变化超过阈值且统计显著时判定为回退，命令行以非零状态退出，便于无人值守的性能门禁
+
+用法：
+    python baseline.py save nightly-0417 results.jsonl
+    python baseline.py list
+    python baseline.py compare nightly-0417 nightly-0418 --threshold 0.1
+    python baseline.py compare nightly-0417 --logs results.jsonl --method ranksum
+"""
+
+import argparse
+import bisect
+import glob
+import json
+import math
+import os
+import random
+import sys
+import time
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+from latency_histogram import LatencyHistogram
+from stats_collector import StatsCollector
+
+DEFAULT_DIR = "baselines"
+# 默认比较的指标: 指标 → (名称, 单位, 数值越大越差)
+COMPARE_METRICS = {
+    "response_time": ("响应时间", "秒", True),
+    "ttft": ("首字延迟TTFT", "秒", True),
+    "inter_token_latency": ("字间延迟ITL", "秒", True),
+    "tokens_per_second": ("解码吞吐", "token/秒", False),
+}
+COMPARE_PERCENTILES = (("P50", 0.5), ("P90", 0.9), ("P99", 0.99))
+COMPARE_METHODS = ("bootstrap", "ranksum")
+ALL_SCOPE = "全部"
+
+
+def baseline_path(name: str, directory: str = DEFAULT_DIR) -> str:
+    """命名基线对应的文件，name本身是.json文件路径时原样返回"""
+    if name.endswith(".json") or os.sep in name or "/" in name:
+        return name
+    return os.path.join(directory, f"{name}.json")
+
+
+def make_run(stats: StatsCollector, question_stats: Dict[str, int], summary: Optional[Dict[str, Any]] = None,
+             name: str = "当前", metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """把一轮压测的结果整理为可保存、可比较的记录"""
+    return {
+        "name": name,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "stats": stats,
+        "question_stats": dict(question_stats),
+        # 运行摘要中只保留数值项（总耗时、发出请求数等），直方图已包含在统计中
+        "summary": {k: v for k, v in (summary or {}).items() if isinstance(v, (int, float))},
+        "metadata": metadata or {}
+    }
+
+
+def save_baseline(path: str, run: Dict[str, Any]) -> str:
+    """保存基线，同名基线会被覆盖"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(dict(run, stats=run["stats"].to_dict()), f, ensure_ascii=False)
+    return path
+
+
+def load_baseline(path: str) -> Dict[str, Any]:
+    """读取基线"""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    data["stats"] = StatsCollector.from_dict(data["stats"])
+    return data
+
+
+def list_baselines(directory: str = DEFAULT_DIR) -> List[Dict[str, Any]]:
+    """目录中的全部基线，按创建时间排序"""
+    runs = []
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        try:
+            run = load_baseline(path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️  无法读取基线 {path}: {e}")
+            continue
+        run["path"] = path
+        runs.append(run)
+    return sorted(runs, key=lambda run: run.get("created_at", ""))
+
+
+class QuantileSampler:
+    """从直方图的经验分布中抽取自助法分位数，无需保留原始样本
+
+    n个样本重抽样后的第r个次序统计量等于经验分布在U(r)处的逆，U(r)服从Beta(r, n-r+1)，
+    因此直接抽取U(r)再查经验分布，与逐个重抽样n个样本再取分位数的结果同分布
+    """
+
+    def __init__(self, histogram: LatencyHistogram):
+        self.count = histogram.count
+        self.min = histogram.min
+        self.max = histogram.max
+        self.values: List[float] = []
+        self.cumulative: List[int] = []
+        seen = 0
+        for value, bucket_count in histogram.buckets():
+            seen += bucket_count
+            self.values.append(value)
+            self.cumulative.append(seen)
+
+    def quantile_at(self, u: float) -> float:
+        """经验分布在u处的逆（与LatencyHistogram.percentile的取值方式一致）"""
+        rank = max(1, math.ceil(self.count * u))
+        index = min(bisect.bisect_left(self.cumulative, rank), len(self.values) - 1)
+        return min(max(self.values[index], self.min), self.max)
+
+    def sample(self, p: float, rng: random.Random) -> float:
+        """抽取一次重抽样后的第p分位数"""
+        rank = max(1, math.ceil(self.count * p))
+        return self.quantile_at(rng.betavariate(rank, self.count - rank + 1))
+
+
+def bootstrap_difference(baseline: LatencyHistogram, current: LatencyHistogram, p: float, confidence: float,
+                         iterations: int, rng: random.Random) -> Tuple[float, float]:
+    """第p分位数之差（当前-基线）的自助法置信区间"""
+    base_sampler = QuantileSampler(baseline)
+    current_sampler = QuantileSampler(current)
+    differences = sorted(current_sampler.sample(p, rng) - base_sampler.sample(p, rng) for _ in range(iterations))
+    tail = (1 - confidence) / 2
+    low = differences[min(int(tail * iterations), iterations - 1)]
+    high = differences[min(int((1 - tail) * iterations), iterations - 1)]
+    return low, high
+
+
+def rank_sum_test(baseline: LatencyHistogram, current: LatencyHistogram) -> Tuple[float, float]:
+    """Mann-Whitney秩和检验（正态近似，含结值校正），返回(当前大于基线的单侧p值, P(当前>基线))
+
+    同一桶内的值视为结值，两个直方图的分桶参数相同时桶一一对应
+    """
+    n1, n2 = baseline.count, current.count
+    merged: Dict[float, List[int]] = {}
+    for value, bucket_count in baseline.buckets():
+        merged.setdefault(value, [0, 0])[0] += bucket_count
+    for value, bucket_count in current.buckets():
+        merged.setdefault(value, [0, 0])[1] += bucket_count
+
+    seen = 0
+    current_rank_sum = 0.0
+    ties = 0.0
+    for value in sorted(merged):
+        in_baseline, in_current = merged[value]
+        tied = in_baseline + in_current
+        current_rank_sum += in_current * (seen + (tied + 1) / 2)
+        ties += tied ** 3 - tied
+        seen += tied
+
+    u = current_rank_sum - n2 * (n2 + 1) / 2
+    total = n1 + n2
+    variance = n1 * n2 / 12 * ((total + 1) - ties / (total * (total - 1)))
+    if variance <= 0:
+        return 0.5, 0.5
+    z = (u - n1 * n2 / 2) / math.sqrt(variance)
+    return 0.5 * math.erfc(z / math.sqrt(2)), u / (n1 * n2)
+
+
+def proportion_test(base_failed: int, base_total: int, failed: int, total: int) -> float:
+    """两比例z检验：当前错误率高于基线的单侧p值"""
+    pooled = (base_failed + failed) / (base_total + total)
+    variance = pooled * (1 - pooled) * (1 / base_total + 1 / total)
+    if variance <= 0:
+        return 0.5
+    z = (failed / total - base_failed / base_total) / math.sqrt(variance)
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def _scopes(baseline: StatsCollector, current: StatsCollector) -> List[Tuple[str, StatsCollector, StatsCollector]]:
+    """比较范围：整体以及两次运行中都出现的问题类别"""
+    scopes = [(ALL_SCOPE, baseline, current)]
+    base_groups = baseline.groups.get("question_category", {})
+    current_groups = current.groups.get("question_category", {})
+    if len(current_groups) > 1:
+        for category in sorted(set(base_groups) & set(current_groups)):
+            scopes.append((category, base_groups[category], current_groups[category]))
+    return scopes
+
+
+def compare_runs(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.1,
+                 confidence: float = 0.95, method: str = "bootstrap", iterations: int = 2000,
+                 min_samples: int = 30, error_threshold: float = 0.01,
+                 metrics: Sequence[str] = tuple(COMPARE_METRICS), seed: Optional[int] = 0) -> List[Dict[str, Any]]:
+    """逐指标、逐问题类别比较两次运行
+
+    分位数向变差的方向相对变化超过threshold、且在confidence置信度下显著（自助法置信区间不含0，
+    或秩和检验的单侧p值小于1-confidence）时判定为回退；错误率按绝对值error_threshold判定；
+    样本数少于min_samples的指标不参与判定
+    """
+    if method not in COMPARE_METHODS:
+        raise ValueError(f"未知的比较方法: {method}，可选: {', '.join(COMPARE_METHODS)}")
+    rng = random.Random(seed)
+    alpha = 1 - confidence
+    rows = []
+    for scope, base_stats, current_stats in _scopes(baseline["stats"], current["stats"]):
+        if base_stats.total and current_stats.total:
+            base_rate = (base_stats.failed + base_stats.exceptions) / base_stats.total
+            current_rate = (current_stats.failed + current_stats.exceptions) / current_stats.total
+            p_value = proportion_test(base_stats.failed + base_stats.exceptions, base_stats.total,
+                                      current_stats.failed + current_stats.exceptions, current_stats.total)
+            rows.append({
+                "scope": scope, "metric": "error_rate", "label": "错误率", "unit": "", "percentile": None,
+                "baseline": base_rate, "current": current_rate, "change": current_rate - base_rate,
+                "ci": None, "p_value": p_value, "samples": (base_stats.total, current_stats.total),
+                "regression": current_rate - base_rate > error_threshold and p_value < alpha,
+                "improvement": base_rate - current_rate > error_threshold and 1 - p_value < alpha
+            })
+
+        for metric in metrics:
+            label, unit, higher_is_worse = COMPARE_METRICS.get(metric, (metric, "", True))
+            base_histogram = base_stats.histograms.get(metric)
+            current_histogram = current_stats.histograms.get(metric)
+            if base_histogram is None or current_histogram is None or not base_histogram.count \
+                    or not current_histogram.count:
+                continue
+            enough = min(base_histogram.count, current_histogram.count) >= min_samples
+            # 秩和检验比较整个分布，同一指标的各分位数共用一个p值
+            p_larger, superiority = rank_sum_test(base_histogram, current_histogram)
+            p_worse = p_larger if higher_is_worse else 1 - p_larger
+            sign = 1 if higher_is_worse else -1
+            for name, p in COMPARE_PERCENTILES:
+                base_value = base_histogram.percentile(p)
+                current_value = current_histogram.percentile(p)
+                change = (current_value - base_value) / base_value if base_value else 0.0
+                ci = bootstrap_difference(base_histogram, current_histogram, p, confidence, iterations, rng) \
+                    if enough else None
+                if method == "bootstrap":
+                    worse_significant = ci is not None and (ci[0] > 0 if higher_is_worse else ci[1] < 0)
+                    better_significant = ci is not None and (ci[1] < 0 if higher_is_worse else ci[0] > 0)
+                else:
+                    worse_significant = enough and p_worse < alpha
+                    better_significant = enough and 1 - p_worse < alpha
+                rows.append({
+                    "scope": scope, "metric": metric, "label": label, "unit": unit, "percentile": name,
+                    "baseline": base_value, "current": current_value, "change": change, "ci": ci,
+                    "p_value": p_worse, "superiority": superiority,
+                    "samples": (base_histogram.count, current_histogram.count),
+                    "regression": worse_significant and change * sign > threshold,
+                    "improvement": better_significant and -change * sign > threshold
+                })
+    return rows
+
+
+def _format_value(value: float, unit: str) -> str:
+    """按单位格式化数值，无单位的为比例"""
+    if not unit:
+        return f"{value*100:.2f}%"
+    return f"{value:.1f}{unit}" if unit == "token/秒" else f"{value:.3f}{unit}"
+
+
+def print_comparison(baseline: Dict[str, Any], current: Dict[str, Any], rows: List[Dict[str, Any]],
+                     threshold: float, confidence: float, method: str) -> int:
+    """打印比较结果，返回回退项数"""
+    print(f"\n📐 与基线比较: {baseline['name']} ({baseline.get('created_at', '-')}) → "
+          f"{current['name']} ({current.get('created_at', '-')})")
+    print(f"{'='*50}")
+    method_name = "自助法置信区间" if method == "bootstrap" else "秩和检验"
+    print(f"判定方法: {method_name} | 置信度: {confidence*100:.0f}% | 回退阈值: {threshold*100:.0f}%")
+    base_time = baseline["summary"].get("total_time")
+    current_time = current["summary"].get("total_time")
+    if base_time and current_time:
+        # 吞吐随压测模式和时长变化，只作参考，不参与判定
+        print(f"平均QPS: {baseline['stats'].total/base_time:.2f} → {current['stats'].total/current_time:.2f} (仅供参考)")
+
+    # 整体逐项列出，各问题类别只列出有显著变化的项
+    scope = None
+    for row in rows:
+        if row["scope"] != ALL_SCOPE and not (row["regression"] or row["improvement"]):
+            continue
+        if row["scope"] != scope:
+            scope = row["scope"]
+            print(f"\n[{scope}]")
+        name = row["label"] + (f" {row['percentile']}" if row["percentile"] else "")
+        unit = row["unit"]
+        if row["percentile"]:
+            change = f"{row['change']*100:+.1f}%"
+        else:
+            change = f"{row['change']*100:+.2f}个百分点"
+        parts = [f"{name}: {_format_value(row['baseline'], unit)} → {_format_value(row['current'], unit)} ({change})"]
+        if row["ci"] is not None:
+            low, high = row["ci"]
+            parts.append(f"差值{confidence*100:.0f}%CI [{_format_value(low, unit)}, {_format_value(high, unit)}]")
+        elif row["percentile"] and method == "bootstrap":
+            parts.append(f"样本不足({min(row['samples'])})")
+        parts.append(f"变差p={row['p_value']:.4f}")
+        if row["regression"]:
+            parts.append("❌ 回退")
+        elif row["improvement"]:
+            parts.append("✅ 改善")
+        print(" | ".join(parts))
+
+    regressions = [row for row in rows if row["regression"]]
+    if regressions:
+        print(f"\n❌ 发现{len(regressions)}处显著回退:")
+        for row in regressions:
+            name = row["label"] + (f" {row['percentile']}" if row["percentile"] else "")
+            print(f"   [{row['scope']}] {name}: {row['change']*100:+.1f}%")
+    else:
+        print(f"\n✅ 没有超过阈值的显著回退")
+    return len(regressions)
+
+
+def _run_from_logs(paths: Sequence[str], run: Optional[int], name: str) -> Dict[str, Any]:
+    """从结果日志读回一次运行"""
+    from api_stress_test import APIStressTester
+    from result_log import load_stats
+
+    paths = sorted({p for pattern in paths for p in (glob.glob(pattern) or [pattern])})
+    stats, question_stats, total_time = load_stats(paths, 2, APIStressTester.GROUP_FIELDS, run)
+    return make_run(stats, question_stats, {"total_time": total_time}, name, {"logs": paths})
+
+
+def _load_named(name: str, directory: str) -> Dict[str, Any]:
+    path = baseline_path(name, directory)
+    if not os.path.exists(path):
+        raise SystemExit(f"❌ 基线不存在: {path}")
+    return load_baseline(path)
+
+
+def main() -> int:
+    """命令行入口，compare发现回退时返回1"""
+    parser = argparse.ArgumentParser(description="压测基线的保存与回退检测")
+    parser.add_argument("--dir", default=DEFAULT_DIR, help="基线目录")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    save = commands.add_parser("save", help="从结果日志保存命名基线")
+    save.add_argument("name", help="基线名称")
+    save.add_argument("logs", nargs="+", help="结果日志文件（支持通配符）")
+    save.add_argument("--run", type=int, default=None, help="只统计每个文件中的第几轮运行（从1开始）")
+
+    commands.add_parser("list", help="列出已保存的基线")
+
+    compare = commands.add_parser("compare", help="与基线比较，有显著回退时以非零状态退出")
+    compare.add_argument("baseline", help="基线名称或文件")
+    compare.add_argument("current", nargs="?", help="当前运行的基线名称或文件")
+    compare.add_argument("--logs", nargs="+", help="改为从结果日志读取当前运行")
+    compare.add_argument("--run", type=int, default=None, help="与--logs一起使用，只统计第几轮运行")
+    compare.add_argument("--threshold", type=float, default=0.1, help="分位数向变差方向的相对变化阈值")
+    compare.add_argument("--error-threshold", type=float, default=0.01, help="错误率上升的绝对阈值")
+    compare.add_argument("--confidence", type=float, default=0.95, help="置信度")
+    compare.add_argument("--method", choices=COMPARE_METHODS, default="bootstrap", help="显著性判定方法")
+    compare.add_argument("--iterations", type=int, default=2000, help="自助法重抽样次数")
+    compare.add_argument("--min-samples", type=int, default=30, help="参与判定所需的最少样本数")
+    compare.add_argument("--metrics", nargs="+", default=list(COMPARE_METRICS), help="要比较的指标")
+    args = parser.parse_args()
+
+    if args.command == "save":
+        run = _run_from_logs(args.logs, args.run, args.name)
+        path = save_baseline(baseline_path(args.name, args.dir), run)
+        print(f"💾 已保存基线 {args.name}: {path}，共{run['stats'].total}个请求")
+        return 0
+
+    if args.command == "list":
+        runs = list_baselines(args.dir)
+        if not runs:
+            print(f"📂 {args.dir} 中没有基线")
+        for run in runs:
+            print(f"📌 {run['name']} | {run.get('created_at', '-')} | 请求数 {run['stats'].total} | {run['path']}")
+        return 0
+
+    if bool(args.current) == bool(args.logs):
+        parser.error("compare需要指定当前运行的基线名称或--logs之一")
+    baseline = _load_named(args.baseline, args.dir)
+    current = _load_named(args.current, args.dir) if args.current else _run_from_logs(args.logs, args.run, "当前")
+    rows = compare_runs(baseline, current, args.threshold, args.confidence, args.method, args.iterations,
+                        args.min_samples, args.error_threshold, args.metrics)
+    regressions = print_comparison(baseline, current, rows, args.threshold, args.confidence, args.method)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
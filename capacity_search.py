@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+基于SLO的容量搜索
+以一系列短时稳态试验逐步提高并发数或到达速率，每次试验先预热再测量，
+用测量阶段的P95 TTFT和错误率判断是否满足SLO，找出满足SLO的最大负载及对应吞吐，并输出完整的负载-延迟曲线
+
+用法：
+    python capacity_search.py                       # 使用run_test.py中的CONFIG和CONFIG["capacity_search"]
+    python capacity_search.py --strategy binary --dimension rate --start 5 --max 200
+"""
+
+import argparse
+import json
+from typing import Dict, Any, List, Optional, Tuple
+
+from api_stress_test import APIStressTester
+from load_profiles import LoadProfile, Stage
+from loop_monitor import run_event_loop
+from stats_collector import StatsCollector
+
+DIMENSIONS = ("concurrency", "rate")
+STRATEGIES = ("step", "binary")
+
+
+class SLO:
+    """服务等级目标：P95 TTFT、P95响应时间（可选）和错误率上限"""
+
+    def __init__(self, ttft_p95: Optional[float] = 2.0, error_rate: float = 0.01,
+                 response_time_p95: Optional[float] = None):
+        self.ttft_p95 = ttft_p95
+        self.error_rate = error_rate
+        self.response_time_p95 = response_time_p95
+
+    def describe(self) -> str:
+        """SLO的文字描述"""
+        parts = []
+        if self.ttft_p95 is not None:
+            parts.append(f"P95 TTFT < {self.ttft_p95}秒")
+        if self.response_time_p95 is not None:
+            parts.append(f"P95响应时间 < {self.response_time_p95}秒")
+        parts.append(f"错误率 < {self.error_rate*100:g}%")
+        return "，".join(parts)
+
+    def check(self, trial: Dict[str, Any]) -> List[str]:
+        """返回违反的SLO条目，空列表表示满足"""
+        violations = []
+        if trial["requests"] == 0:
+            return ["测量阶段没有完成的请求"]
+        if trial["error_rate"] >= self.error_rate:
+            violations.append(f"错误率 {trial['error_rate']*100:.2f}%")
+        if self.ttft_p95 is not None:
+            if trial["ttft_p95"] is None:
+                violations.append("没有流式响应，无法计算TTFT")
+            elif trial["ttft_p95"] >= self.ttft_p95:
+                violations.append(f"P95 TTFT {trial['ttft_p95']:.3f}秒")
+        if self.response_time_p95 is not None:
+            if trial["response_time_p95"] is None:
+                violations.append("没有成功的请求，无法计算响应时间")
+            elif trial["response_time_p95"] >= self.response_time_p95:
+                violations.append(f"P95响应时间 {trial['response_time_p95']:.3f}秒")
+        return violations
+
+
+class CapacitySearch:
+    """按并发数（闭环）或到达速率（开环）搜索满足SLO的最大负载"""
+
+    def __init__(self, tester: APIStressTester, slo: SLO, dimension: str = "concurrency",
+                 strategy: str = "step", start: float = 10, max_load: float = 1000,
+                 step: Optional[float] = None, growth: float = 1.5, resolution: float = 0.05,
+                 trial_duration: float = 60.0, warmup: float = 15.0):
+        if dimension not in DIMENSIONS:
+            raise ValueError(f"未知的搜索维度: {dimension}，可选: {', '.join(DIMENSIONS)}")
+        if strategy not in STRATEGIES:
+            raise ValueError(f"未知的搜索策略: {strategy}，可选: {', '.join(STRATEGIES)}")
+        if growth <= 1 and step is None:
+            raise ValueError("growth必须大于1")
+        if warmup < 0:
+            raise ValueError("warmup不能为负数")
+        self.tester = tester
+        self.slo = slo
+        self.dimension = dimension
+        self.strategy = strategy
+        self.start = start
+        self.max_load = max_load
+        self.step = step                      # 固定步长，None表示按growth倍数递增
+        self.growth = growth
+        self.resolution = resolution          # 二分搜索的停止精度（相对值）
+        self.trial_duration = trial_duration  # 每次试验的测量时长（秒）
+        self.warmup = warmup                  # 每次试验测量前的预热时长（秒），0表示不预热
+        self.trials: List[Dict[str, Any]] = []
+
+    def _normalize(self, load: float) -> float:
+        """并发数取整，速率保留两位小数"""
+        load = min(load, self.max_load)
+        return max(int(round(load)), 1) if self.dimension == "concurrency" else round(load, 2)
+
+    def _next_load(self, load: float) -> float:
+        """逐步搜索时的下一个负载"""
+        return self._normalize(load + self.step if self.step else load * self.growth)
+
+    async def run_trial(self, load: float) -> Dict[str, Any]:
+        """在给定负载下运行一次预热+测量，返回测量阶段的指标"""
+        tester = self.tester
+        if self.dimension == "concurrency":
+            stages = [Stage(self.trial_duration, load, ramp=False, name="measure")]
+            if self.warmup > 0:
+                stages.insert(0, Stage(self.warmup, load, ramp=False, name="warmup"))
+            await tester.run_load_profile(LoadProfile(stages, start_users=load), tick=0.2, report=False)
+        else:
+            await tester.run_open_loop_test(load, self.warmup + self.trial_duration, distribution="poisson",
+                                            warmup=self.warmup, report=False)
+
+        if self.warmup > 0:
+            measured = tester.stats.groups.get("stage", {}).get("measure") or \
+                StatsCollector(tester.histogram_precision)
+        else:
+            # 不预热时开环模式不按阶段分组，整轮请求都是测量阶段的
+            measured = tester.stats
+        ttft = measured.histogram("ttft")
+        response_time = measured.histogram("response_time")
+        requests = measured.total
+        trial = {
+            "load": load,
+            "requests": requests,
+            "throughput": requests / self.trial_duration,
+            "goodput": measured.success / self.trial_duration,
+            "error_rate": (measured.failed + measured.exceptions) / requests if requests else 0.0,
+            "ttft_p50": ttft.percentile(0.5) if ttft.count else None,
+            "ttft_p95": ttft.percentile(0.95) if ttft.count else None,
+            "response_time_p95": response_time.percentile(0.95) if response_time.count else None,
+            "tokens_per_second_p50": measured.histogram("tokens_per_second").percentile(0.5)
+        }
+        # 客户端事件循环饱和时测得的延迟偏高，该试验的结论不可靠
+        trial["client_saturated"] = tester.loop_lag_exceeded()
+        trial["violations"] = self.slo.check(trial)
+        trial["passed"] = not trial["violations"]
+        self.trials.append(trial)
+        self.print_trial(trial)
+        return trial
+
+    async def run(self) -> Dict[str, Any]:
+        """执行搜索，返回满足SLO的最大负载及全部试验结果"""
+        unit = "并发" if self.dimension == "concurrency" else "请求/秒"
+        print(f"🔎 容量搜索: 按{'并发数' if self.dimension == 'concurrency' else '到达速率'}"
+              f"{'二分' if self.strategy == 'binary' else '逐步'}搜索，起点 {self.start}{unit}，上限 {self.max_load}{unit}")
+        print(f"🎯 SLO: {self.slo.describe()}")
+        print(f"⏳ 每次试验: 预热{self.warmup}秒 + 测量{self.trial_duration}秒")
+        print(f"📡 目标API: {self.tester.url}")
+        print("-" * 50)
+
+        best, failed_load = await self._grow()
+        if self.strategy == "binary" and best is not None and failed_load is not None:
+            best = await self._bisect(best, failed_load)
+
+        self.print_summary(best)
+        return {"best": best, "trials": self.trials, "slo": vars(self.slo),
+                "dimension": self.dimension, "strategy": self.strategy}
+
+    async def _grow(self) -> Tuple[Optional[Dict[str, Any]], Optional[float]]:
+        """从起点开始递增负载直到违反SLO或达到上限，返回(最后一次通过的试验, 首个失败的负载)"""
+        best = None
+        load = self._normalize(self.start)
+        while True:
+            trial = await self.run_trial(load)
+            if not trial["passed"]:
+                return best, load
+            best = trial
+            next_load = self._next_load(load)
+            if next_load <= load:
+                return best, None
+            load = next_load
+
+    async def _bisect(self, best: Dict[str, Any], failed_load: float) -> Dict[str, Any]:
+        """在最后一次通过和首次失败的负载之间二分"""
+        low, high = best["load"], failed_load
+        while (high - low) > max(low * self.resolution, 1 if self.dimension == "concurrency" else 0.01):
+            load = self._normalize((low + high) / 2)
+            if load in (low, high):
+                break
+            trial = await self.run_trial(load)
+            if trial["passed"]:
+                low, best = load, trial
+            else:
+                high = load
+        return best
+
+    def print_trial(self, trial: Dict[str, Any]):
+        """打印单次试验结果"""
+        mark = "✅" if trial["passed"] else "❌"
+        ttft = f"{trial['ttft_p95']:.3f}" if trial["ttft_p95"] is not None else "-"
+        line = (f"{mark} 负载 {trial['load']:>8} | 吞吐 {trial['throughput']:.2f}请求/秒 | "
+                f"有效吞吐 {trial['goodput']:.2f}请求/秒 | P95 TTFT {ttft}秒 | 错误率 {trial['error_rate']*100:.2f}%")
+        if trial["violations"]:
+            line += f" | 违反: {', '.join(trial['violations'])}"
+        if trial.get("client_saturated"):
+            line += " | ⚠️ 客户端事件循环延迟超过阈值"
+        print(line)
+
+    def print_summary(self, best: Optional[Dict[str, Any]]):
+        """打印负载-延迟曲线和搜索结论"""
+        print(f"\n📈 负载-延迟曲线 (按负载排序):")
+        print(f"{'负载':>8} | {'吞吐':>8} | {'有效吞吐':>8} | {'P50 TTFT':>9} | {'P95 TTFT':>9} | {'P95响应':>8} | {'错误率':>7} | SLO")
+        for trial in sorted(self.trials, key=lambda t: t["load"]):
+            ttft50 = f"{trial['ttft_p50']:.3f}" if trial["ttft_p50"] is not None else "-"
+            ttft95 = f"{trial['ttft_p95']:.3f}" if trial["ttft_p95"] is not None else "-"
+            rt95 = f"{trial['response_time_p95']:.3f}" if trial["response_time_p95"] is not None else "-"
+            print(f"{trial['load']:>8} | {trial['throughput']:>8.2f} | {trial['goodput']:>8.2f} | {ttft50:>9} | "
+                  f"{ttft95:>9} | {rt95:>8} | {trial['error_rate']*100:>6.2f}% | {'✅' if trial['passed'] else '❌'}")
+
+        print(f"\n🏁 搜索结论:")
+        unit = "并发" if self.dimension == "concurrency" else "请求/秒"
+        if best is None:
+            print(f"起点负载 {self._normalize(self.start)}{unit} 已不满足SLO，请降低start后重试")
+            return
+        print(f"满足SLO的最大负载: {best['load']}{unit}")
+        ttft = f"P95 TTFT {best['ttft_p95']:.3f}秒，" if best["ttft_p95"] is not None else ""
+        print(f"对应的最大可持续吞吐: {best['goodput']:.2f}请求/秒 ({ttft}错误率 {best['error_rate']*100:.2f}%)")
+        if best["load"] >= self.max_load:
+            print(f"⚠️  已达到搜索上限{self.max_load}{unit}，实际容量可能更高")
+
+
+def main():
+    """命令行入口：参数默认取自run_test.py中的CONFIG["capacity_search"]"""
+    from run_test import CONFIG, build_tester_kwargs
+
+    settings = dict(CONFIG.get("capacity_search") or {})
+    parser = argparse.ArgumentParser(description="基于SLO的容量搜索")
+    parser.add_argument("--dimension", choices=DIMENSIONS, default=settings.get("dimension", "concurrency"))
+    parser.add_argument("--strategy", choices=STRATEGIES, default=settings.get("strategy", "step"))
+    parser.add_argument("--start", type=float, default=settings.get("start", 10))
+    parser.add_argument("--max", type=float, default=settings.get("max_load", 1000), dest="max_load")
+    parser.add_argument("--step", type=float, default=settings.get("step"), help="固定步长，不设置时按--growth倍数递增")
+    parser.add_argument("--growth", type=float, default=settings.get("growth", 1.5))
+    parser.add_argument("--trial-duration", type=float, default=settings.get("trial_duration", 60))
+    parser.add_argument("--warmup", type=float, default=settings.get("warmup", 15), help="每次试验的预热时长（秒），0表示不预热")
+    parser.add_argument("--ttft-p95", type=float, default=settings.get("ttft_p95", 2.0))
+    parser.add_argument("--error-rate", type=float, default=settings.get("error_rate", 0.01))
+    parser.add_argument("--response-time-p95", type=float, default=settings.get("response_time_p95"))
+    parser.add_argument("--output", default=settings.get("output"), help="把搜索结果和曲线写入JSON文件")
+    args = parser.parse_args()
+
+    tester = APIStressTester(**build_tester_kwargs())
+    search = CapacitySearch(
+        tester, SLO(args.ttft_p95, args.error_rate, args.response_time_p95),
+        dimension=args.dimension, strategy=args.strategy, start=args.start, max_load=args.max_load,
+        step=args.step, growth=args.growth, trial_duration=args.trial_duration, warmup=args.warmup
+    )
+    result = run_event_loop(search.run(), CONFIG["loop_backend"])
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 搜索结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+分布式压测
+协调器通过TCP驱动多台机器上的压测代理：下发压测计划和问题库随机种子，
+约定统一的开始时刻，定期收集各代理的阶段性统计，最后合并成一份报告。
+
+协议：每条消息是一行JSON
+    代理 -> 协调器: {"type": "hello", "agent": 名称}
+    协调器 -> 代理: {"type": "plan", "tester": 构造参数, "plan": 分到的计划, "seed": 种子,
+                     "start_at": 开始时刻(Unix时间), "report_interval": 上报间隔}
+    代理 -> 协调器: {"type": "progress", "stats": 统计快照}
+    代理 -> 协调器: {"type": "done", "stats": 统计, "question_stats": 问题类型计数, "summary": 运行摘要, "loop": 事件循环实现}
+    代理 -> 协调器: {"type": "error", "error": 错误信息}
+
+用法：
+    python distributed.py coordinator --agents 3 --port 9400
+    python distributed.py agent --host 10.0.0.1 --port 9400
+    python distributed.py local --agents 3        # 在本机启动协调器和3个代理进程
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import socket
+import time
+from typing import Dict, Any, List, Optional
+
+from api_stress_test import APIStressTester
+from stats_collector import StatsCollector
+from result_log import shard_log_path
+from loop_monitor import LOOP_BACKENDS, run_event_loop
+from run_plan import split_plan, execute_plan_at, merge_summaries, merge_question_stats, print_plan_report
+
+DEFAULT_PORT = 9400
+# 单条消息的最大长度，统计快照中包含直方图，需要比asyncio默认的64KB更大
+MESSAGE_LIMIT = 64 * 1024 * 1024
+# 全部代理收到计划后统一开始的缓冲时间（秒），多台机器之间需要先做好时钟同步
+START_DELAY = 3.0
+
+
+async def send_message(writer: asyncio.StreamWriter, message: Dict[str, Any]):
+    """发送一条消息"""
+    writer.write(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+    await writer.drain()
+
+
+async def receive_message(reader: asyncio.StreamReader) -> Dict[str, Any]:
+    """接收一条消息，连接关闭时抛出ConnectionError"""
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("连接已关闭")
+    return json.loads(line)
+
+
+async def wait_disconnected(reader: asyncio.StreamReader):
+    """等待对端断开（或发来一行消息）后返回"""
+    try:
+        await reader.readline()
+    except (ConnectionError, ValueError):
+        pass
+
+
+class AgentConnection:
+    """协调器侧的单个代理连接"""
+
+    def __init__(self, name: str, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.name = name
+        self.reader = reader
+        self.writer = writer
+        self.plan_sent = asyncio.get_running_loop().create_future()
+        self.snapshot: Optional[Dict[str, Any]] = None
+        self.final: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+
+
+class Coordinator:
+    """分布式压测协调器"""
+
+    def __init__(self, tester_kwargs: Dict[str, Any], plan: Dict[str, Any], agents: int,
+                 host: str = "0.0.0.0", port: int = DEFAULT_PORT, report_interval: float = 5.0,
+                 seed: Optional[int] = None):
+        self.tester_kwargs = tester_kwargs
+        self.plan = plan
+        self.agents = agents
+        self.host = host
+        self.port = port
+        self.report_interval = report_interval
+        if seed is None:
+            seed = tester_kwargs.get("question_seed")
+        self.seed = seed if seed is not None else random.randrange(2 ** 31)
+        self.connections: List[AgentConnection] = []
+        self._all_connected: Optional[asyncio.Event] = None
+        self._all_finished: Optional[asyncio.Event] = None
+        self._dispatching = False  # 开始下发计划后不再替换断开的代理
+
+    async def _handle_agent(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """处理一个代理连接：登记、等待下发计划、接收上报"""
+        try:
+            hello = await receive_message(reader)
+        except (ConnectionError, ValueError):
+            writer.close()
+            return
+        if hello.get("type") != "hello" or len(self.connections) >= self.agents:
+            writer.close()
+            return
+
+        connection = AgentConnection(hello.get("agent", "agent"), reader, writer)
+        self.connections.append(connection)
+        print(f"🤝 代理已连接: {connection.name} ({len(self.connections)}/{self.agents})")
+        if len(self.connections) == self.agents:
+            self._all_connected.set()
+
+        # 下发计划前断开的代理让出名额，由新连接的代理顶替，避免把分到的负载发给已断开的连接
+        disconnected = asyncio.ensure_future(wait_disconnected(reader))
+        await asyncio.wait({connection.plan_sent, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+        if not connection.plan_sent.done() and not self._dispatching:
+            self.connections.remove(connection)
+            self._all_connected.clear()
+            writer.close()
+            print(f"👋 代理{connection.name}在下发计划前断开 ({len(self.connections)}/{self.agents})")
+            return
+        disconnected.cancel()
+        await asyncio.gather(disconnected, return_exceptions=True)  # 等取消完成后才能继续读
+        await connection.plan_sent
+        try:
+            while connection.final is None:
+                message = await receive_message(reader)
+                if message["type"] == "progress":
+                    connection.snapshot = message["stats"]
+                elif message["type"] == "done":
+                    connection.final = message
+                elif message["type"] == "error":
+                    connection.error = message["error"]
+                    break
+        except (ConnectionError, ValueError) as e:
+            connection.error = connection.error or f"连接中断: {e}"
+        finally:
+            writer.close()
+            if all(c.final is not None or c.error is not None for c in self.connections):
+                self._all_finished.set()
+
+    def _print_progress(self, elapsed: float):
+        """合并各代理最新的统计快照并打印进度"""
+        merged = StatsCollector(self.tester_kwargs.get("histogram_precision", 2))
+        for connection in self.connections:
+            data = connection.final["stats"] if connection.final else connection.snapshot
+            if data:
+                merged.merge(StatsCollector.from_dict(data))
+        if not merged.total:
+            print(f"⏳ {elapsed:.0f}秒: 暂无完成的请求")
+            return
+        response_times = merged.histogram("response_time")
+        print(f"⏳ {elapsed:.0f}秒: 已完成{merged.total}个请求 | 成功率 {merged.success/merged.total*100:.2f}% | "
+              f"P95响应时间 {response_times.percentile(0.95):.3f}秒")
+
+    async def run(self) -> APIStressTester:
+        """等待代理连接、下发计划、汇总结果，返回持有合并统计的APIStressTester"""
+        self._all_connected = asyncio.Event()
+        self._all_finished = asyncio.Event()
+        if self.tester_kwargs.get("upload_files"):
+            # 附件由协调器上传一次，文件ID随构造参数下发，代理不再重复上传，也不需要在本机存有这些文件
+            attachments = await APIStressTester(**self.tester_kwargs).prepare_attachments()
+            self.tester_kwargs = dict(self.tester_kwargs, uploaded_attachments=attachments)
+        server = await asyncio.start_server(self._handle_agent, self.host, self.port, limit=MESSAGE_LIMIT)
+
+        print(f"🛰️  协调器监听 {self.host}:{self.port}，等待{self.agents}个代理连接...")
+        async with server:
+            # 事件置位后、本协程恢复前仍可能有代理断开并被移除
+            while len(self.connections) < self.agents:
+                await self._all_connected.wait()
+            self._dispatching = True
+
+            start_at = time.time() + START_DELAY
+            for index, (connection, share) in enumerate(zip(self.connections, split_plan(self.plan, self.agents))):
+                try:
+                    await send_message(connection.writer, {
+                        "type": "plan",
+                        "tester": self.tester_kwargs,
+                        "plan": share,
+                        "seed": self.seed + index,
+                        "start_at": start_at,
+                        "report_interval": self.report_interval
+                    })
+                except ConnectionError as e:
+                    connection.error = f"下发计划失败: {e}"
+                connection.plan_sent.set_result(True)
+            print(f"🚀 已向{self.agents}个代理下发计划，{START_DELAY:.0f}秒后同时开始 (种子: {self.seed})")
+            print("-" * 50)
+
+            while not self._all_finished.is_set():
+                try:
+                    await asyncio.wait_for(self._all_finished.wait(), timeout=self.report_interval)
+                except asyncio.TimeoutError:
+                    if time.time() >= start_at:
+                        self._print_progress(time.time() - start_at)
+
+        return self._print_merged_report()
+
+    def _print_merged_report(self) -> APIStressTester:
+        """合并所有代理的最终结果并打印报告"""
+        tester = APIStressTester(**self.tester_kwargs)
+        tester.stats = StatsCollector(tester.histogram_precision, tester.GROUP_FIELDS)
+        summaries = []
+        loops = set()
+        for connection in self.connections:
+            if connection.final is None:
+                print(f"⚠️  代理{connection.name}未完成: {connection.error}")
+                continue
+            tester.stats.merge(StatsCollector.from_dict(connection.final["stats"]))
+            merge_question_stats(tester.question_stats, connection.final["question_stats"])
+            summaries.append(connection.final["summary"])
+            loops.add(connection.final.get("loop") or "asyncio")
+        # 各代理可以使用不同的事件循环实现
+        tester.loop_name = "/".join(sorted(loops)) or None
+
+        if not summaries:
+            print("❌ 没有可用的代理结果")
+            return tester
+        tester.last_summary = merge_summaries(summaries)
+        print_plan_report(tester, self.plan, tester.last_summary,
+                          title=f"🛰️  {len(summaries)}个代理的合并结果")
+        return tester
+
+
+async def _report_progress(tester: APIStressTester, writer: asyncio.StreamWriter, interval: float):
+    """定期向协调器上报当前统计快照"""
+    while True:
+        await asyncio.sleep(interval)
+        await send_message(writer, {"type": "progress", "stats": tester.stats.to_dict()})
+
+
+async def run_agent(host: str, port: int = DEFAULT_PORT, name: Optional[str] = None):
+    """连接协调器，执行分到的压测计划并上报结果"""
+    name = name or f"{socket.gethostname()}-{os.getpid()}"
+    reader, writer = await asyncio.open_connection(host, port, limit=MESSAGE_LIMIT)
+    await send_message(writer, {"type": "hello", "agent": name})
+    print(f"🤝 代理{name}已连接协调器 {host}:{port}")
+
+    try:
+        message = await receive_message(reader)
+        # 按协调器分配的种子抽样问题，便于复现
+        tester_kwargs = dict(message["tester"], keep_results=False, question_seed=message["seed"])
+        if tester_kwargs.get("result_log_path"):
+            # 同一台机器上可能运行多个代理，结果日志按代理名区分
+            tester_kwargs["result_log_path"] = shard_log_path(tester_kwargs["result_log_path"], name)
+        tester = APIStressTester(**tester_kwargs)
+        reporter = asyncio.create_task(_report_progress(tester, writer, message["report_interval"]))
+        try:
+            summary = await execute_plan_at(tester, message["plan"], message["start_at"])
+        finally:
+            reporter.cancel()
+        await send_message(writer, {
+            "type": "done",
+            "stats": tester.stats.to_dict(),
+            "question_stats": tester.question_stats,
+            "summary": summary,
+            "loop": tester.loop_name
+        })
+        print(f"✅ 代理{name}完成，共{tester.stats.total}个请求")
+    except Exception as e:
+        await send_message(writer, {"type": "error", "error": repr(e)})
+        raise
+    finally:
+        writer.close()
+
+
+def _agent_process_main(host: str, port: int, name: str, loop_backend: str = "asyncio"):
+    """本地模式下的代理进程入口"""
+    run_event_loop(run_agent(host, port, name), loop_backend)
+
+
+def run_local(tester_kwargs: Dict[str, Any], plan: Dict[str, Any], agents: int,
+              port: int = DEFAULT_PORT, report_interval: float = 5.0,
+              seed: Optional[int] = None, loop_backend: str = "asyncio") -> APIStressTester:
+    """在本机启动协调器和多个代理进程，用于测试分布式模式"""
+    coordinator = Coordinator(tester_kwargs, plan, agents, "127.0.0.1", port, report_interval, seed)
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=_agent_process_main, args=("127.0.0.1", port, f"local-{index + 1}", loop_backend))
+        for index in range(agents)
+    ]
+
+    async def start():
+        task = asyncio.create_task(coordinator.run())
+        # 等协调器开始监听后再启动代理进程
+        await asyncio.sleep(0.5)
+        for process in processes:
+            process.start()
+        return await task
+
+    try:
+        return asyncio.run(start())
+    finally:
+        for process in processes:
+            process.join(timeout=10)
+
+
+def main():
+    """命令行入口，压测参数取自run_test.py中的CONFIG"""
+    parser = argparse.ArgumentParser(description="分布式压测：协调器/代理")
+    parser.add_argument("role", choices=("coordinator", "agent", "local"))
+    parser.add_argument("--host", default=None, help="协调器监听地址或代理要连接的协调器地址")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--agents", type=int, default=2, help="协调器等待的代理数量")
+    parser.add_argument("--interval", type=float, default=5.0, help="阶段性统计上报间隔（秒）")
+    parser.add_argument("--seed", type=int, default=None, help="问题库随机种子")
+    parser.add_argument("--name", default=None, help="代理名称")
+    parser.add_argument("--loop", choices=LOOP_BACKENDS, default=None,
+                        help="代理使用的事件循环实现，默认取run_test.py中的loop_backend")
+    args = parser.parse_args()
+
+    from run_test import CONFIG, build_tester_kwargs
+    loop_backend = args.loop or CONFIG["loop_backend"]
+    if args.role == "agent":
+        run_event_loop(run_agent(args.host or "127.0.0.1", args.port, args.name), loop_backend)
+        return
+
+    from run_plan import plan_from_config
+    tester_kwargs = build_tester_kwargs()
+    plan = plan_from_config(CONFIG)
+
+    if args.role == "local":
+        run_local(tester_kwargs, plan, args.agents, args.port, args.interval, args.seed, loop_backend)
+    else:
+        coordinator = Coordinator(tester_kwargs, plan, args.agents, args.host or "0.0.0.0",
+                                  args.port, args.interval, args.seed)
+        asyncio.run(coordinator.run())
+
+
+if __name__ == "__main__":
+    main()
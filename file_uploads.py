@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+附件预上传
+压测开始前把本地的图片、文档等文件通过Dify的文件上传接口（/v1/files/upload）各上传一次，
+得到的文件ID在整轮压测中缓存复用，请求以local_file方式引用，
+避免remote_url方式下后端每个请求都要重新拉取一次远程文件，使测得的延迟混入下载耗时
+"""
+
+import mimetypes
+import os
+from typing import Dict, Any, List, Optional
+
+import aiohttp
+
+# Dify的文件类型及对应的扩展名，其他扩展名归为custom
+FILE_TYPES = {
+    "image": ("jpg", "jpeg", "png", "gif", "webp", "svg"),
+    "document": ("txt", "md", "markdown", "pdf", "html", "xlsx", "xls", "docx", "csv", "eml", "msg", "pptx", "ppt",
+                 "xml", "epub"),
+    "audio": ("mp3", "m4a", "wav", "webm", "amr"),
+    "video": ("mp4", "mov", "mpeg", "mpga"),
+}
+
+
+def file_type(path: str) -> str:
+    """按扩展名判断Dify的文件类型"""
+    extension = os.path.splitext(path)[1].lstrip(".").lower()
+    for name, extensions in FILE_TYPES.items():
+        if extension in extensions:
+            return name
+    return "custom"
+
+
+def local_file(upload_file_id: str, path: str) -> Dict[str, Any]:
+    """请求体files字段中引用已上传文件的一项"""
+    return {"type": file_type(path), "transfer_method": "local_file", "upload_file_id": upload_file_id}
+
+
+async def upload_file(session: aiohttp.ClientSession, url: str, headers: Dict[str, str], path: str, user: str,
+                      timeout: Optional[aiohttp.ClientTimeout] = None) -> Dict[str, Any]:
+    """上传一个本地文件，返回可放入files字段的local_file引用，上传失败时抛出RuntimeError"""
+    with open(path, "rb") as f:
+        content = f.read()
+    form = aiohttp.FormData()
+    form.add_field("file", content, filename=os.path.basename(path),
+                   content_type=mimetypes.guess_type(path)[0] or "application/octet-stream")
+    form.add_field("user", user)
+    # 请求体为multipart，去掉JSON请求用的Content-Type
+    headers = {key: value for key, value in headers.items() if key.lower() != "content-type"}
+    async with session.post(url, headers=headers, data=form, timeout=timeout) as response:
+        text = await response.text()
+        if response.status >= 300:
+            raise RuntimeError(f"上传{path}失败: HTTP {response.status} {text[:200]}")
+        try:
+            upload_file_id = (await response.json(content_type=None))["id"]
+        except (ValueError, KeyError, TypeError):
+            raise RuntimeError(f"上传{path}失败: 响应中没有文件ID {text[:200]}")
+    return local_file(upload_file_id, path)
+
+
+async def upload_files(session: aiohttp.ClientSession, url: str, headers: Dict[str, str], paths: List[str],
+                       user: str, timeout: Optional[aiohttp.ClientTimeout] = None) -> List[Dict[str, Any]]:
+    """依次上传多个文件，返回与paths顺序一致的local_file引用"""
+    return [await upload_file(session, url, headers, path, user, timeout) for path in paths]
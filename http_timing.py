@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+HTTP分阶段计时
+通过aiohttp的TraceConfig钩子记录每个请求的DNS解析、从连接池获取连接的排队、新建连接（含TCP和TLS握手）、
+请求发送完成等时刻，换算为各阶段耗时，用于判断延迟升高发生在连接建立、网关排队还是模型本身
+"""
+
+import time
+from types import SimpleNamespace
+from typing import Dict, Any, Optional
+
+import aiohttp
+
+# 各阶段耗时字段及其在报告中的名称
+PHASE_FIELDS = {
+    "dns_time": "DNS解析",
+    "pool_wait_time": "等待连接池",
+    "connect_time": "新建连接(TCP+TLS)",
+    "send_time": "请求发送",
+    "wait_time": "发送完成到响应头",
+    "first_byte_time": "首个响应字节",
+}
+
+
+def _marker(name: str):
+    """生成在trace_request_ctx中记录当前时刻的回调"""
+    async def callback(session: aiohttp.ClientSession, context: SimpleNamespace, params: Any):
+        marks = context.trace_request_ctx
+        if marks is not None:
+            marks[name] = time.perf_counter()
+    return callback
+
+
+def create_trace_config() -> aiohttp.TraceConfig:
+    """创建记录各阶段时刻的TraceConfig，请求时以trace_request_ctx传入一个字典接收时刻"""
+    config = aiohttp.TraceConfig()
+    config.on_connection_queued_start.append(_marker("queued_start"))
+    config.on_connection_queued_end.append(_marker("queued_end"))
+    config.on_connection_create_start.append(_marker("create_start"))
+    config.on_connection_create_end.append(_marker("create_end"))
+    config.on_connection_reuseconn.append(_marker("reused"))
+    config.on_dns_resolvehost_start.append(_marker("dns_start"))
+    config.on_dns_resolvehost_end.append(_marker("dns_end"))
+    config.on_request_headers_sent.append(_marker("headers_sent"))
+    config.on_request_chunk_sent.append(_marker("body_sent"))
+    return config
+
+
+def _span(marks: Dict[str, float], start: str, end: str) -> Optional[float]:
+    """两个时刻之差，任一时刻缺失时返回None"""
+    if start in marks and end in marks:
+        return max(marks[end] - marks[start], 0.0)
+    return None
+
+
+def phase_timings(marks: Dict[str, float], header_time: Optional[float], start_time: float) -> Dict[str, Any]:
+    """把记录的时刻换算为各阶段耗时及连接是否复用"""
+    timings: Dict[str, Any] = {
+        "dns_time": _span(marks, "dns_start", "dns_end"),
+        "pool_wait_time": _span(marks, "queued_start", "queued_end"),
+        "connect_time": _span(marks, "create_start", "create_end"),
+        "connection_reused": None,
+        "send_time": None,
+        "wait_time": None,
+    }
+    if "reused" in marks:
+        timings["connection_reused"] = True
+        connected = marks["reused"]
+    elif "create_end" in marks:
+        timings["connection_reused"] = False
+        connected = marks["create_end"]
+    else:
+        return timings
+
+    # 请求体在发送完请求头之后写出，取两者中较晚的时刻作为请求发送完成
+    sent = max(marks.get("headers_sent", 0.0), marks.get("body_sent", 0.0))
+    if sent:
+        timings["send_time"] = max(sent - connected, 0.0)
+        if header_time is not None:
+            timings["wait_time"] = max(start_time + header_time - sent, 0.0)
+    return timings
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+定长内存的延迟直方图
+HDR风格的对数分桶，记录O(1)，可合并，用于长时间压测的分位数统计
+"""
+
+import math
+from array import array
+from typing import Dict, Any, Iterator, Optional, Tuple
+
+
+class LatencyHistogram:
+    """对数分桶直方图：相对误差由significant_digits决定，内存与记录数量无关"""
+
+    def __init__(self, lowest: float = 1e-4, highest: float = 3600.0, significant_digits: int = 2):
+        if lowest <= 0 or highest <= lowest:
+            raise ValueError("需要满足 0 < lowest < highest")
+        if not 1 <= significant_digits <= 4:
+            raise ValueError("significant_digits取值范围为1~4")
+        self.lowest = lowest
+        self.highest = highest
+        self.significant_digits = significant_digits
+
+        # 相邻桶边界之比为1+10^-d，即每个桶的相对宽度为10^-d
+        self._log_base = math.log1p(10 ** -significant_digits)
+        self._bucket_count = int(math.log(highest / lowest) / self._log_base) + 2
+        self._counts = array("Q", bytes(8 * self._bucket_count))
+
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def _index(self, value: float) -> int:
+        """计算数值所在的桶序号"""
+        if value <= self.lowest:
+            return 0
+        index = int(math.log(value / self.lowest) / self._log_base) + 1
+        return min(index, self._bucket_count - 1)
+
+    def _bucket_value(self, index: int) -> float:
+        """桶的代表值（取桶区间的几何中点）"""
+        if index == 0:
+            return self.lowest
+        return self.lowest * math.exp((index - 0.5) * self._log_base)
+
+    def record(self, value: float, count: int = 1):
+        """记录一个数值"""
+        self._counts[self._index(value)] += count
+        self.count += count
+        self.total += value * count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def mean(self) -> float:
+        """平均值"""
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, p: float) -> float:
+        """返回第p分位数，p取值0~1"""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(self.count * p))
+        seen = 0
+        for index, bucket_count in enumerate(self._counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(max(self._bucket_value(index), self.min), self.max)
+        return self.max
+
+    def buckets(self) -> Iterator[Tuple[float, int]]:
+        """按数值从小到大遍历非空的桶，返回(桶代表值, 计数)，分桶参数相同的直方图代表值一一对应"""
+        for index, bucket_count in enumerate(self._counts):
+            if bucket_count:
+                yield self._bucket_value(index), bucket_count
+
+    def is_compatible(self, other: "LatencyHistogram") -> bool:
+        """两个直方图的分桶方式是否一致"""
+        return (self.lowest, self.highest, self.significant_digits) == \
+            (other.lowest, other.highest, other.significant_digits)
+
+    def merge(self, other: "LatencyHistogram"):
+        """把另一个直方图合并进来"""
+        if not self.is_compatible(other):
+            raise ValueError("直方图的分桶参数不一致，无法合并")
+        for index, bucket_count in enumerate(other._counts):
+            if bucket_count:
+                self._counts[index] += bucket_count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        """导出为可JSON序列化的字典，只保存非空的桶"""
+        return {
+            "lowest": self.lowest,
+            "highest": self.highest,
+            "significant_digits": self.significant_digits,
+            "count": self.count,
+            "total": self.total,
+            "min": self.min,
+            "max": self.max,
+            "buckets": {str(i): c for i, c in enumerate(self._counts) if c}
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LatencyHistogram":
+        """从to_dict的结果还原"""
+        histogram = cls(data["lowest"], data["highest"], data["significant_digits"])
+        for index, bucket_count in data["buckets"].items():
+            histogram._counts[int(index)] = bucket_count
+        histogram.count = data["count"]
+        histogram.total = data["total"]
+        histogram.min = data["min"]
+        histogram.max = data["max"]
+        return histogram
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+压测过程中的实时指标
+按秒分槽的滑动窗口统计吞吐、错误率和延迟/TTFT分位数，
+定期在控制台刷新，并可通过本地HTTP的/metrics接口以Prometheus文本格式暴露，便于在Grafana中与服务端指标叠加
+"""
+
+import asyncio
+import time
+from typing import Dict, Any, List, Optional
+
+from aiohttp import web
+
+from latency_histogram import LatencyHistogram
+from stats_collector import METRIC_RANGES, TRUNCATED_METRICS
+
+METRIC_PREFIX = "dify_stress"
+WINDOW_METRICS = ("response_time", "ttft")
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class _WindowSlot:
+    """滑动窗口中一秒内完成的请求"""
+
+    def __init__(self, second: int, significant_digits: int):
+        self.second = second
+        self.completed = 0
+        self.errors = 0
+        self.histograms = {
+            name: LatencyHistogram(*METRIC_RANGES[name], significant_digits) for name in WINDOW_METRICS
+        }
+
+
+class LiveMetrics:
+    """滑动窗口实时指标 + 累计计数器"""
+
+    def __init__(self, window: float = 30.0, significant_digits: int = 2):
+        self.window = max(int(window), 1)  # 窗口长度（秒）
+        self.significant_digits = significant_digits
+        self._slots: List[Optional[_WindowSlot]] = [None] * self.window
+        self.started_at = time.monotonic()
+        self.in_flight = 0
+        # 累计值，对应Prometheus的counter和summary的_sum/_count
+        self.totals = {"success": 0, "failed": 0, "exception": 0}
+        self.sums = {name: 0.0 for name in WINDOW_METRICS}
+        self.counts = {name: 0 for name in WINDOW_METRICS}
+
+    def _slot(self) -> _WindowSlot:
+        """当前这一秒的槽，过期的槽直接覆盖"""
+        second = int(time.monotonic())
+        index = second % self.window
+        slot = self._slots[index]
+        if slot is None or slot.second != second:
+            slot = _WindowSlot(second, self.significant_digits)
+            self._slots[index] = slot
+        return slot
+
+    def request_started(self):
+        """请求发出"""
+        self.in_flight += 1
+
+    def request_finished(self, result: Dict[str, Any]):
+        """请求完成（成功或失败）"""
+        self.in_flight -= 1
+        slot = self._slot()
+        slot.completed += 1
+        if not result['success']:
+            slot.errors += 1
+            self.totals["failed"] += 1
+            return
+        self.totals["success"] += 1
+        for name in WINDOW_METRICS:
+            if result.get('aborted') and name in TRUNCATED_METRICS:
+                continue
+            value = result.get(name)
+            if value is not None:
+                slot.histograms[name].record(value)
+                self.sums[name] += value
+                self.counts[name] += 1
+
+    def request_raised(self):
+        """请求抛出了未被捕获的异常"""
+        self.in_flight -= 1
+        self.totals["exception"] += 1
+        slot = self._slot()
+        slot.completed += 1
+        slot.errors += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前窗口内的吞吐、错误率和分位数"""
+        now = int(time.monotonic())
+        slots = [s for s in self._slots if s is not None and now - s.second < self.window]
+        # 刚开始运行时窗口还没填满，按实际经过的时间计算速率
+        span = min(self.window, max(time.monotonic() - self.started_at, 1.0))
+        completed = sum(s.completed for s in slots)
+        errors = sum(s.errors for s in slots)
+
+        quantiles = {}
+        for name in WINDOW_METRICS:
+            merged = LatencyHistogram(*METRIC_RANGES[name], self.significant_digits)
+            for slot in slots:
+                if slot.histograms[name].count:
+                    merged.merge(slot.histograms[name])
+            quantiles[name] = {q: merged.percentile(q) for q in QUANTILES} if merged.count else {}
+
+        return {
+            "elapsed": time.monotonic() - self.started_at,
+            "in_flight": self.in_flight,
+            "throughput": completed / span,
+            "error_rate": errors / completed if completed else 0.0,
+            "quantiles": quantiles
+        }
+
+    def console_line(self) -> str:
+        """一行控制台摘要"""
+        snapshot = self.snapshot()
+        parts = [
+            f"吞吐 {snapshot['throughput']:.2f}请求/秒",
+            f"在途 {snapshot['in_flight']}",
+            f"错误率 {snapshot['error_rate']*100:.1f}%"
+        ]
+        for name, label in (("response_time", "响应时间"), ("ttft", "TTFT")):
+            values = snapshot["quantiles"][name]
+            if values:
+                parts.append(f"{label} P50/P95/P99 " + "/".join(f"{values[q]:.3f}" for q in QUANTILES) + "秒")
+        return f"⏱️  [{snapshot['elapsed']:>6.0f}s] " + " | ".join(parts)
+
+    def prometheus_text(self) -> str:
+        """Prometheus文本格式（0.0.4）的指标"""
+        snapshot = self.snapshot()
+        lines = [
+            f"# HELP {METRIC_PREFIX}_requests_total 已完成的请求数",
+            f"# TYPE {METRIC_PREFIX}_requests_total counter"
+        ]
+        for outcome, count in self.totals.items():
+            lines.append(f'{METRIC_PREFIX}_requests_total{{outcome="{outcome}"}} {count}')
+        lines += [
+            f"# HELP {METRIC_PREFIX}_in_flight 在途请求数",
+            f"# TYPE {METRIC_PREFIX}_in_flight gauge",
+            f"{METRIC_PREFIX}_in_flight {snapshot['in_flight']}",
+            f"# HELP {METRIC_PREFIX}_window_throughput 滑动窗口内每秒完成的请求数",
+            f"# TYPE {METRIC_PREFIX}_window_throughput gauge",
+            f"{METRIC_PREFIX}_window_throughput {snapshot['throughput']:.6f}",
+            f"# HELP {METRIC_PREFIX}_window_error_ratio 滑动窗口内的错误率",
+            f"# TYPE {METRIC_PREFIX}_window_error_ratio gauge",
+            f"{METRIC_PREFIX}_window_error_ratio {snapshot['error_rate']:.6f}"
+        ]
+        for name in WINDOW_METRICS:
+            metric = f"{METRIC_PREFIX}_{name}_seconds"
+            lines.append(f"# HELP {metric} 成功请求的{name}，分位数取最近{self.window}秒")
+            lines.append(f"# TYPE {metric} summary")
+            for q, value in snapshot["quantiles"][name].items():
+                lines.append(f'{metric}{{quantile="{q}"}} {value:.6f}')
+            lines.append(f"{metric}_sum {self.sums[name]:.6f}")
+            lines.append(f"{metric}_count {self.counts[name]}")
+        return "\n".join(lines) + "\n"
+
+
+class LiveReporter:
+    """定期打印实时指标，并可选地提供/metrics接口"""
+
+    def __init__(self, metrics: LiveMetrics, interval: Optional[float] = None,
+                 port: Optional[int] = None, host: str = "0.0.0.0"):
+        self.metrics = metrics
+        self.interval = interval  # 控制台刷新间隔（秒），None表示不打印
+        self.host = host
+        self.port = port          # /metrics端口，None表示不启动HTTP服务
+        self._task: Optional[asyncio.Task] = None
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self):
+        """开始刷新控制台并启动HTTP服务"""
+        if self.interval:
+            self._task = asyncio.get_running_loop().create_task(self._print_loop())
+        if self.port is not None:
+            app = web.Application()
+            app.router.add_get("/metrics", self.handle_metrics)
+            self._runner = web.AppRunner(app, access_log=None)
+            await self._runner.setup()
+            try:
+                await web.TCPSite(self._runner, self.host, self.port, reuse_address=True).start()
+            except OSError as e:
+                # 端口被占用（如同一台机器上的多个代理）时不影响压测本身
+                print(f"⚠️  无法在端口{self.port}上提供/metrics: {e}")
+                await self._runner.cleanup()
+                self._runner = None
+
+    async def stop(self):
+        """停止刷新和HTTP服务"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        """Prometheus抓取接口"""
+        return web.Response(text=self.metrics.prometheus_text(), content_type="text/plain",
+                            headers={"X-Content-Type-Options": "nosniff"}, charset="utf-8")
+
+    async def _print_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            print(self.metrics.console_line())
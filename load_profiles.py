@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+负载模型
+定义开环到达速率、分阶段爬坡、思考时间分布等压测负载形态
+"""
+
+import math
+import random
+from typing import Iterator, Optional, List, Dict, Any, Tuple
+
+
+class ArrivalSchedule:
+    """开环到达时间表，按目标速率生成每个请求的计划发送时刻"""
+
+    DISTRIBUTIONS = ("constant", "poisson")
+
+    def __init__(self, rate: float, duration: float, distribution: str = "constant", seed: Optional[int] = None,
+                 start_offset: float = 0.0):
+        if rate <= 0:
+            raise ValueError("rate必须大于0")
+        if duration <= 0:
+            raise ValueError("duration必须大于0")
+        if distribution not in self.DISTRIBUTIONS:
+            raise ValueError(f"未知的到达分布: {distribution}，可选: {', '.join(self.DISTRIBUTIONS)}")
+        self.rate = rate
+        self.duration = duration
+        self.distribution = distribution
+        self.seed = seed
+        # 第一个请求的发送时刻，多个进程分担同一个constant速率时各自错开，合起来仍是均匀间隔
+        self.start_offset = start_offset
+
+    def __iter__(self) -> Iterator[float]:
+        """依次产出相对于压测开始的发送时刻（秒）"""
+        rng = random.Random(self.seed)
+        if self.distribution == "poisson":
+            offset = self.start_offset + rng.expovariate(self.rate)
+            while offset < self.duration:
+                yield offset
+                offset += rng.expovariate(self.rate)
+        else:
+            index = 0
+            offset = self.start_offset
+            while offset < self.duration:
+                yield offset
+                index += 1
+                # 取整到纳秒，避免错开后的浮点误差使最后一个请求落在duration之前
+                offset = round(self.start_offset + index / self.rate, 9)
+
+    def expected_requests(self) -> int:
+        """按目标速率应发出的请求数"""
+        return int(self.rate * self.duration)
+
+
+class Stage:
+    """负载阶段：在duration秒内把虚拟用户数调整到users"""
+
+    def __init__(self, duration: float, users: int, ramp: bool = True, name: Optional[str] = None):
+        if duration <= 0:
+            raise ValueError("阶段duration必须大于0")
+        if users < 0:
+            raise ValueError("阶段users不能为负数")
+        self.duration = duration
+        self.users = users
+        self.ramp = ramp  # True=线性爬坡到users，False=阶段开始时直接跳到users
+        self.name = name
+
+
+class LoadProfile:
+    """由多个阶段组成的闭环负载曲线"""
+
+    def __init__(self, stages: List[Stage], start_users: int = 0):
+        if not stages:
+            raise ValueError("负载曲线至少需要一个阶段")
+        self.stages = stages
+        self.start_users = start_users
+
+        # 预先计算每个阶段的起止时间和起始用户数
+        self._boundaries = []
+        begin = 0.0
+        users = start_users
+        for index, stage in enumerate(stages):
+            if stage.name is None:
+                stage.name = f"阶段{index + 1}"
+            self._boundaries.append((begin, begin + stage.duration, users))
+            begin += stage.duration
+            users = stage.users
+        self.total_duration = begin
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "LoadProfile":
+        """从配置字典创建，格式: {"start_users": 10, "stages": [{"duration": 300, "users": 300}, ...]}"""
+        stages = [
+            Stage(
+                duration=item["duration"],
+                users=item["users"],
+                ramp=item.get("ramp", True),
+                name=item.get("name")
+            )
+            for item in config["stages"]
+        ]
+        return cls(stages, start_users=config.get("start_users", 0))
+
+    def stage_index_at(self, elapsed: float) -> int:
+        """返回elapsed秒时所处的阶段序号"""
+        for index, (_, end, _) in enumerate(self._boundaries):
+            if elapsed < end:
+                return index
+        return len(self.stages) - 1
+
+    def users_at(self, elapsed: float) -> int:
+        """返回elapsed秒时应保持的在途请求数"""
+        index = self.stage_index_at(elapsed)
+        stage = self.stages[index]
+        begin, end, from_users = self._boundaries[index]
+        if not stage.ramp:
+            return stage.users
+        progress = min(max((elapsed - begin) / (end - begin), 0.0), 1.0)
+        return round(from_users + (stage.users - from_users) * progress)
+
+    def stage_range(self, index: int) -> Tuple[int, int]:
+        """返回阶段的起止用户数"""
+        return self._boundaries[index][2], self.stages[index].users
+
+    def max_users(self) -> int:
+        """整个曲线中的最大用户数"""
+        return max([self.start_users] + [stage.users for stage in self.stages])
+
+
+class Distribution:
+    """延迟、思考时间等非负数值的分布，由"名称:参数"形式的字符串描述
+
+    constant:0.5          固定值
+    uniform:0.2,0.8       均匀分布
+    lognormal:0.5,0.4     对数正态分布（中位数, sigma）
+    exponential:0.5       指数分布（均值）
+    """
+
+    KINDS = ("constant", "uniform", "lognormal", "exponential")
+
+    def __init__(self, spec: str):
+        kind, _, params = spec.partition(":")
+        if kind not in self.KINDS:
+            raise ValueError(f"未知的分布: {kind}，可选: {', '.join(self.KINDS)}")
+        self.kind = kind
+        self.params = [float(p) for p in params.split(",")] if params else [0.0]
+        self.spec = spec
+
+    def sample(self, rng: random.Random) -> float:
+        """抽取一个非负样本"""
+        if self.kind == "constant":
+            return self.params[0]
+        if self.kind == "uniform":
+            return rng.uniform(self.params[0], self.params[1])
+        if self.kind == "lognormal":
+            median, sigma = self.params[0], self.params[1]
+            return rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+        mean = self.params[0]
+        return rng.expovariate(1.0 / mean) if mean > 0 else 0.0
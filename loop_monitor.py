@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+事件循环延迟监控与事件循环实现的选择
+周期性地sleep，记录实际被唤醒的时刻比预期晚了多少，用来判断压测客户端自身的事件循环是否已经饱和；
+uvloop为可选依赖，未安装时回退到标准asyncio事件循环
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from latency_histogram import LatencyHistogram
+from stats_collector import METRIC_RANGES
+
+
+class LoopLagMonitor:
+    """事件循环调度延迟采样器"""
+
+    def __init__(self, interval: float = 0.01, significant_digits: int = 2):
+        self.interval = interval
+        self.lags = LatencyHistogram(*METRIC_RANGES["loop_lag"], significant_digits)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """在当前事件循环中开始采样"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """停止采样"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lags.record(max(time.perf_counter() - expected, 0.0))
+
+
+LOOP_BACKENDS = ("asyncio", "uvloop")
+
+
+def loop_factory(backend: str = "asyncio") -> Optional[Callable[[], asyncio.AbstractEventLoop]]:
+    """返回创建指定事件循环的函数，None表示使用标准asyncio事件循环"""
+    if backend not in LOOP_BACKENDS:
+        raise ValueError(f"未知的事件循环实现: {backend}，可选: {', '.join(LOOP_BACKENDS)}")
+    if backend == "uvloop":
+        try:
+            import uvloop
+        except ImportError:
+            print("⚠️  未安装uvloop（pip install uvloop），使用标准asyncio事件循环")
+            return None
+        return uvloop.new_event_loop
+    return None
+
+
+def run_event_loop(main: Awaitable[Any], backend: str = "asyncio") -> Any:
+    """在指定实现的事件循环中运行协程，相当于asyncio.run"""
+    factory = loop_factory(backend)
+    if factory is None:
+        return asyncio.run(main)
+    if hasattr(asyncio, "Runner"):
+        with asyncio.Runner(loop_factory=factory) as runner:
+            return runner.run(main)
+    # Python 3.10及以下没有asyncio.Runner
+    loop = factory()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(main)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+def loop_name() -> str:
+    """当前运行中的事件循环实现名称"""
+    return type(asyncio.get_running_loop()).__module__.split(".")[0]
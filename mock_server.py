@@ -0,0 +1,554 @@
+#!/usr/bin/env python3
+"""
+本地Dify模拟服务
+实现Dify /v1/chat-messages、/v1/completion-messages、/v1/workflows/run 以及OpenAI兼容的
+/v1/chat/completions 接口的blocking和streaming两种模式，以及Dify的停止生成和文件上传接口，
+可配置首字延迟分布、逐token延迟、回答长度、并发上限与排队行为，并可注入429/5xx错误和连接重置，
+用于在没有真实后端的情况下验证和基准测试压测工具本身
+
+用法：
+    python mock_server.py --port 8080 --ttft lognormal:0.5,0.4 --token-delay 0.02 --tokens 50:200
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import random
+import time
+import uuid
+from typing import Dict, Any, List, Optional
+
+from aiohttp import web
+
+from load_profiles import Distribution
+from protocols import PROTOCOLS
+
+DEFAULT_PORT = 8080
+# 最多记住的会话数，超出后淘汰最早创建的会话，避免长时间运行时内存持续增长
+MAX_CONVERSATIONS = 100000
+# 各协议对应的接口路径
+PROTOCOL_PATHS = {name: adapter.path for name, adapter in PROTOCOLS.items()}
+# 停止生成接口的路径
+STOP_PATHS = [adapter.stop_path for adapter in PROTOCOLS.values() if adapter.stop_path]
+# 文件上传接口的路径
+UPLOAD_PATHS = sorted({adapter.upload_path for adapter in PROTOCOLS.values() if adapter.upload_path})
+# 请求体大小上限（aiohttp默认为1MB，上传的图片、文档可能更大）
+MAX_REQUEST_SIZE = 64 * 1024 * 1024
+
+
+class MockConfig:
+    """模拟服务的行为配置"""
+
+    def __init__(self,
+                 ttft: str = "constant:0.2",
+                 token_delay: str = "constant:0.02",
+                 min_tokens: int = 50,
+                 max_tokens: int = 200,
+                 max_concurrency: int = 0,
+                 queue_size: int = 0,
+                 queue_timeout: float = 30.0,
+                 error_429_rate: float = 0.0,
+                 error_500_rate: float = 0.0,
+                 error_503_rate: float = 0.0,
+                 stream_error_rate: float = 0.0,
+                 reset_rate: float = 0.0,
+                 ping_interval: float = 10.0,
+                 history_ttft: float = 0.0,
+                 file_ttft: float = 0.0,
+                 remote_fetch_delay: float = 0.0,
+                 seed: Optional[int] = None):
+        self.ttft = Distribution(ttft)
+        self.token_delay = Distribution(token_delay)
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.max_concurrency = max_concurrency  # 同时处理的请求上限，0表示不限
+        self.queue_size = queue_size            # 达到上限后最多排队的请求数，0表示不排队直接返回429
+        self.queue_timeout = queue_timeout      # 排队超时后返回503
+        self.error_429_rate = error_429_rate
+        self.error_500_rate = error_500_rate
+        self.error_503_rate = error_503_rate
+        self.stream_error_rate = stream_error_rate  # 流式输出途中发送error事件的概率
+        self.reset_rate = reset_rate                # 流式输出途中直接断开连接的概率
+        self.ping_interval = ping_interval
+        self.history_ttft = history_ttft            # 同一会话中之前每一轮额外增加的首字延迟，模拟历史变长后的prefill开销
+        self.file_ttft = file_ttft                  # 每个附件额外增加的首字延迟，模拟多模态输入的处理开销
+        self.remote_fetch_delay = remote_fetch_delay  # 每个remote_url附件额外增加的延迟，模拟每次拉取远程文件
+        self.seed = seed
+
+
+class MockDifyServer:
+    """Dify chat-messages、completion-messages、workflows/run接口及OpenAI兼容chat/completions接口的模拟实现"""
+
+    def __init__(self, config: Optional[MockConfig] = None, host: str = "127.0.0.1", port: int = DEFAULT_PORT):
+        self.config = config or MockConfig()
+        self.host = host
+        self.port = port
+        self.rng = random.Random(self.config.seed)
+        self.app = web.Application(client_max_size=MAX_REQUEST_SIZE)
+        for protocol, path in PROTOCOL_PATHS.items():
+            self.app.router.add_post(path, functools.partial(self.handle_generate, protocol=protocol))
+        for path in STOP_PATHS:
+            self.app.router.add_post(path, self.handle_stop)
+        for path in UPLOAD_PATHS:
+            self.app.router.add_post(path, self.handle_upload)
+        self.app.router.add_get("/mock/stats", self.handle_stats)
+        self._runner: Optional[web.AppRunner] = None
+        self._active = 0
+        self._waiting = 0
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._conversations: Dict[str, int] = {}  # 会话ID → 已回答的轮数
+        self._tasks: Dict[str, bool] = {}          # 正在流式输出的任务ID → 是否已被要求停止
+        self._files: Dict[str, int] = {}           # 已上传的文件ID → 文件大小
+        self.stats = {
+            "received": 0,
+            "completed": 0,
+            "rejected_429": 0,
+            "queue_timeout_503": 0,
+            "injected_errors": 0,
+            "stream_errors": 0,
+            "resets": 0,
+            "stopped": 0,
+            "client_aborts": 0,
+            "uploads": 0,
+            "max_active": 0
+        }
+
+    @property
+    def url(self) -> str:
+        """chat-messages接口的完整地址"""
+        return self.url_for("dify-chat")
+
+    def url_for(self, protocol: str) -> str:
+        """指定协议对应接口的完整地址"""
+        return f"http://{self.host}:{self.port}{PROTOCOL_PATHS[protocol]}"
+
+    async def start(self):
+        """启动服务，port为0时自动分配端口"""
+        if self.config.max_concurrency:
+            self._slots = asyncio.Semaphore(self.config.max_concurrency)
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        if self.port == 0:
+            self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """停止服务"""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> "MockDifyServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    @staticmethod
+    def error_response(status: int, code: str, message: str, protocol: str = "dify-chat") -> web.Response:
+        """Dify或OpenAI格式的错误响应"""
+        if protocol == "openai-chat":
+            return web.json_response({"error": {"message": message, "type": code, "code": status}}, status=status)
+        return web.json_response({"code": code, "message": message, "status": status}, status=status)
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        """返回模拟服务自身的计数，便于和压测结果对照"""
+        return web.json_response(dict(self.stats, active=self._active, waiting=self._waiting,
+                                      conversations=len(self._conversations)))
+
+    async def handle_stop(self, request: web.Request) -> web.Response:
+        """停止生成：正在输出的任务在下一个token前结束，与Dify一样对未知的任务也返回成功"""
+        task_id = request.match_info["task_id"]
+        if self._tasks.get(task_id) is False:
+            self._tasks[task_id] = True
+            self.stats["stopped"] += 1
+        return web.json_response({"result": "success"})
+
+    async def handle_upload(self, request: web.Request) -> web.Response:
+        """文件上传：multipart中的file字段为文件内容，user字段必填，返回文件ID"""
+        try:
+            form = await request.post()
+        except ValueError:
+            return self.error_response(400, "invalid_param", "Request body is not valid multipart form data")
+        upload = form.get("file")
+        if not isinstance(upload, web.FileField):
+            return self.error_response(400, "no_file_uploaded", "Please upload your file.")
+        if not form.get("user"):
+            return self.error_response(400, "invalid_param", "user is required")
+        size = len(upload.file.read())
+        file_id = str(uuid.uuid4())
+        self._files[file_id] = size
+        self.stats["uploads"] += 1
+        name = upload.filename or "file"
+        return web.json_response({"id": file_id, "name": name, "size": size,
+                                  "extension": name.rpartition(".")[2] if "." in name else "",
+                                  "mime_type": upload.content_type, "created_by": form["user"],
+                                  "created_at": int(time.time())}, status=201)
+
+    def _validate_files(self, body: Dict[str, Any]) -> Optional[web.Response]:
+        """检查files字段：local_file须引用已上传的文件，remote_url须带url"""
+        files = body.get("files") or []
+        if not isinstance(files, list):
+            return self.error_response(400, "invalid_param", "files must be a list")
+        for item in files:
+            method = item.get("transfer_method") if isinstance(item, dict) else None
+            if method == "local_file":
+                if item.get("upload_file_id") not in self._files:
+                    return self.error_response(400, "invalid_param", "Invalid upload file id.")
+            elif method == "remote_url":
+                if not item.get("url"):
+                    return self.error_response(400, "invalid_param", "url is required for remote_url files")
+            else:
+                return self.error_response(400, "invalid_param", f"Invalid transfer method: {method}")
+        return None
+
+    def _validate(self, protocol: str, body: Dict[str, Any]) -> Optional[web.Response]:
+        """按协议检查必填字段，不合法时返回错误响应"""
+        if protocol == "dify-chat":
+            if not body.get("query"):
+                return self.error_response(400, "invalid_param", "query is required")
+            if body.get("conversation_id") and body["conversation_id"] not in self._conversations:
+                return self.error_response(404, "not_found", "Conversation Not Exists.")
+        elif protocol == "openai-chat":
+            if not isinstance(body.get("messages"), list) or not body["messages"]:
+                return self.error_response(400, "invalid_request_error", "messages is required", protocol)
+        elif not isinstance(body.get("inputs"), dict) or not body["inputs"]:
+            return self.error_response(400, "invalid_param", "inputs is required")
+        if protocol != "openai-chat":
+            return self._validate_files(body)
+        return None
+
+    async def handle_generate(self, request: web.Request, protocol: str = "dify-chat") -> web.StreamResponse:
+        """处理生成请求"""
+        self.stats["received"] += 1
+        try:
+            body = await request.json()
+        except ValueError:
+            return self.error_response(400, "invalid_param", "Request body is not valid JSON", protocol)
+        if not isinstance(body, dict):
+            return self.error_response(400, "invalid_param", "Request body must be a JSON object", protocol)
+        invalid = self._validate(protocol, body)
+        if invalid is not None:
+            return invalid
+
+        error = self._inject_error(protocol)
+        if error is not None:
+            return error
+
+        # 并发上限与排队
+        if self._slots is not None:
+            if self._active + self._waiting >= self.config.max_concurrency + self.config.queue_size:
+                self.stats["rejected_429"] += 1
+                return self.error_response(429, "too_many_requests", "Server is busy, please retry later", protocol)
+            self._waiting += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), timeout=self.config.queue_timeout)
+            except asyncio.TimeoutError:
+                self.stats["queue_timeout_503"] += 1
+                return self.error_response(503, "queue_timeout", "Request timed out in queue", protocol)
+            finally:
+                self._waiting -= 1
+
+        self._active += 1
+        self.stats["max_active"] = max(self.stats["max_active"], self._active)
+        try:
+            streaming = body.get("stream") if protocol == "openai-chat" else body.get("response_mode") != "blocking"
+            if not streaming:
+                return await self._respond_blocking(body, protocol)
+            return await self._respond_streaming(request, body, protocol)
+        finally:
+            self._active -= 1
+            if self._slots is not None:
+                self._slots.release()
+
+    def _inject_error(self, protocol: str) -> Optional[web.Response]:
+        """按配置的概率返回429/500/503错误"""
+        roll = self.rng.random()
+        for status, rate, code in ((429, self.config.error_429_rate, "too_many_requests"),
+                                   (500, self.config.error_500_rate, "internal_server_error"),
+                                   (503, self.config.error_503_rate, "service_unavailable")):
+            if roll < rate:
+                self.stats["injected_errors"] += 1
+                return self.error_response(status, code, "Injected error from mock server", protocol)
+            roll -= rate
+        return None
+
+    def _new_message(self, body: Dict[str, Any], protocol: str) -> Dict[str, Any]:
+        """生成一次回答的公共字段，chat-messages没有conversation_id时创建新会话"""
+        message = {
+            "task_id": str(uuid.uuid4()),
+            "message_id": str(uuid.uuid4()),
+            "created_at": int(time.time())
+        }
+        if protocol == "dify-chat":
+            conversation_id = body.get("conversation_id") or str(uuid.uuid4())
+            if conversation_id not in self._conversations and len(self._conversations) >= MAX_CONVERSATIONS:
+                del self._conversations[next(iter(self._conversations))]
+            self._conversations[conversation_id] = self._conversations.get(conversation_id, 0) + 1
+            message["conversation_id"] = conversation_id
+        return message
+
+    def _first_token_delay(self, body: Dict[str, Any]) -> float:
+        """首字延迟：基础分布加上按会话历史轮数增长的部分，以及附件的处理和拉取开销"""
+        history = self._conversations.get(body.get("conversation_id") or "", 0)
+        files = body.get("files") or []
+        remote = sum(1 for item in files if isinstance(item, dict) and item.get("transfer_method") == "remote_url")
+        return self.config.ttft.sample(self.rng) + self.config.history_ttft * history + \
+            self.config.file_ttft * len(files) + self.config.remote_fetch_delay * remote
+
+    @staticmethod
+    def _prompt_length(body: Dict[str, Any], protocol: str) -> int:
+        """请求中问题的字符数"""
+        if protocol == "dify-chat":
+            return len(str(body.get("query", "")))
+        if protocol == "openai-chat":
+            return sum(len(str(message.get("content", ""))) for message in body["messages"])
+        return sum(len(str(value)) for value in body["inputs"].values())
+
+    def _usage(self, body: Dict[str, Any], protocol: str, completion_tokens: int, latency: float) -> Dict[str, Any]:
+        """usage字段，prompt_tokens按字符数粗略估算"""
+        prompt_tokens = max(1, self._prompt_length(body, protocol) // 2)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+        if protocol != "openai-chat":
+            usage["latency"] = latency
+        return usage
+
+    @staticmethod
+    def _token_text(index: int) -> str:
+        """第index个输出token的文本"""
+        return f"tok{index} "
+
+    def _token_event(self, protocol: str, body: Dict[str, Any], message: Dict[str, Any], text: str) -> Dict[str, Any]:
+        """一个输出块对应的流式事件"""
+        if protocol == "openai-chat":
+            return self._openai_chunk(body, message, {"content": text}, None)
+        if protocol == "dify-workflow":
+            return {"event": "text_chunk", "task_id": message["task_id"], "workflow_run_id": message["message_id"],
+                    "data": {"text": text, "from_variable_selector": ["llm", "text"]}}
+        return dict(message, event="message", id=message["message_id"], answer=text)
+
+    def _error_event(self, protocol: str, message: Dict[str, Any]) -> Dict[str, Any]:
+        """流式输出途中的错误事件"""
+        if protocol == "openai-chat":
+            return {"error": {"message": "Injected stream error", "type": "internal_server_error", "code": 500}}
+        return {"event": "error", "task_id": message["task_id"], "message_id": message["message_id"],
+                "status": 500, "code": "internal_server_error", "message": "Injected stream error"}
+
+    def _end_events(self, protocol: str, body: Dict[str, Any], message: Dict[str, Any],
+                    tokens: int, latency: float, stopped: bool = False) -> List[Any]:
+        """输出结束时的事件，字符串表示原样发送的data；stopped表示被停止接口提前结束"""
+        usage = self._usage(body, protocol, tokens, latency)
+        if protocol == "openai-chat":
+            events: List[Any] = [self._openai_chunk(body, message, {}, "stop")]
+            if (body.get("stream_options") or {}).get("include_usage"):
+                events.append(dict(self._openai_chunk(body, message, {}, None), choices=[], usage=usage))
+            return events + ["[DONE]"]
+        if protocol == "dify-workflow":
+            answer = "".join(self._token_text(i) for i in range(tokens))
+            return [{"event": "workflow_finished", "task_id": message["task_id"],
+                     "workflow_run_id": message["message_id"],
+                     "data": {"id": message["message_id"], "status": "stopped" if stopped else "succeeded",
+                              "outputs": {"text": answer}, "elapsed_time": latency,
+                              "total_tokens": usage["total_tokens"]}}]
+        end = {"event": "message_end", "task_id": message["task_id"], "id": message["message_id"],
+               "message_id": message["message_id"], "metadata": {"usage": usage}}
+        if "conversation_id" in message:
+            end["conversation_id"] = message["conversation_id"]
+        return [end]
+
+    @staticmethod
+    def _openai_chunk(body: Dict[str, Any], message: Dict[str, Any], delta: Dict[str, Any],
+                      finish_reason: Optional[str]) -> Dict[str, Any]:
+        """OpenAI chat.completion.chunk"""
+        return {"id": f"chatcmpl-{message['message_id']}", "object": "chat.completion.chunk",
+                "created": message["created_at"], "model": body.get("model", "mock"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+
+    async def _respond_blocking(self, body: Dict[str, Any], protocol: str) -> web.Response:
+        """blocking模式：生成完毕后一次性返回"""
+        start = time.perf_counter()
+        tokens = self.rng.randint(self.config.min_tokens, self.config.max_tokens)
+        delay = self._first_token_delay(body)
+        delay += sum(self.config.token_delay.sample(self.rng) for _ in range(tokens - 1))
+        await asyncio.sleep(delay)
+
+        message = self._new_message(body, protocol)
+        answer = "".join(self._token_text(i) for i in range(tokens))
+        usage = self._usage(body, protocol, tokens, time.perf_counter() - start)
+        if protocol == "openai-chat":
+            response = {"id": f"chatcmpl-{message['message_id']}", "object": "chat.completion",
+                        "created": message["created_at"], "model": body.get("model", "mock"),
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": answer},
+                                     "finish_reason": "stop"}],
+                        "usage": usage}
+        elif protocol == "dify-workflow":
+            response = {"task_id": message["task_id"], "workflow_run_id": message["message_id"],
+                        "data": {"id": message["message_id"], "status": "succeeded", "outputs": {"text": answer},
+                                 "elapsed_time": usage["latency"], "total_tokens": usage["total_tokens"]}}
+        else:
+            response = dict(message, event="message", id=message["message_id"],
+                            mode="chat" if protocol == "dify-chat" else "completion",
+                            answer=answer, metadata={"usage": usage})
+        self.stats["completed"] += 1
+        return web.json_response(response)
+
+    async def _respond_streaming(self, request: web.Request, body: Dict[str, Any],
+                                 protocol: str) -> web.StreamResponse:
+        """streaming模式：按SSE逐token输出"""
+        start = time.perf_counter()
+        tokens = self.rng.randint(self.config.min_tokens, self.config.max_tokens)
+        reset_at = self.rng.randrange(tokens) if self.rng.random() < self.config.reset_rate else None
+        error_at = self.rng.randrange(tokens) if self.rng.random() < self.config.stream_error_rate else None
+
+        response = web.StreamResponse(headers={
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache"
+        })
+        await response.prepare(request)
+        first_token_delay = self._first_token_delay(body)
+        message = self._new_message(body, protocol)
+        last_write = time.perf_counter()
+
+        async def wait(delay: float):
+            # 等待期间超过ping_interval时发送ping保活（OpenAI格式使用SSE注释行）
+            nonlocal last_write
+            deadline = time.perf_counter() + delay
+            while True:
+                remaining = deadline - time.perf_counter()
+                until_ping = last_write + self.config.ping_interval - time.perf_counter()
+                if self.config.ping_interval <= 0 or remaining <= until_ping:
+                    if remaining > 0:
+                        await asyncio.sleep(remaining)
+                    return
+                await asyncio.sleep(max(until_ping, 0))
+                await response.write(b": ping\n\n" if protocol == "openai-chat" else b"event: ping\n\n")
+                last_write = time.perf_counter()
+
+        async def send(event: Any):
+            nonlocal last_write
+            data = event if isinstance(event, str) else json.dumps(event, ensure_ascii=False)
+            await response.write(b"data: " + data.encode("utf-8") + b"\n\n")
+            last_write = time.perf_counter()
+
+        task_id = message["task_id"]
+        self._tasks[task_id] = False
+        try:
+            if protocol == "dify-workflow":
+                await send({"event": "workflow_started", "task_id": task_id,
+                            "workflow_run_id": message["message_id"],
+                            "data": {"id": message["message_id"], "created_at": message["created_at"]}})
+            elif protocol == "openai-chat":
+                await send(self._openai_chunk(body, message, {"role": "assistant", "content": ""}, None))
+            await wait(first_token_delay)
+            produced = tokens
+            for index in range(tokens):
+                if index:
+                    await wait(self.config.token_delay.sample(self.rng))
+                if self._tasks[task_id]:
+                    produced = index
+                    break
+                if index == reset_at:
+                    self.stats["resets"] += 1
+                    request.transport.abort()
+                    return response
+                if index == error_at:
+                    self.stats["stream_errors"] += 1
+                    await send(self._error_event(protocol, message))
+                    await response.write_eof()
+                    return response
+                await send(self._token_event(protocol, body, message, self._token_text(index)))
+
+            for event in self._end_events(protocol, body, message, produced, time.perf_counter() - start,
+                                          stopped=self._tasks[task_id]):
+                await send(event)
+            await response.write_eof()
+        except ConnectionResetError:
+            # 客户端中途断开连接（例如主动中断流式输出）
+            self.stats["client_aborts"] += 1
+            return response
+        finally:
+            del self._tasks[task_id]
+        self.stats["completed"] += 1
+        return response
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    """命令行参数"""
+    parser = argparse.ArgumentParser(description="本地Dify/OpenAI兼容接口模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--ttft", default="constant:0.2", help="首字延迟分布，例如 lognormal:0.5,0.4")
+    parser.add_argument("--token-delay", default="constant:0.02", help="逐token延迟分布")
+    parser.add_argument("--tokens", default="50:200", help="回答token数范围 最小:最大")
+    parser.add_argument("--max-concurrency", type=int, default=0, help="同时处理的请求上限，0表示不限")
+    parser.add_argument("--queue-size", type=int, default=0, help="达到上限后的排队长度，0表示直接返回429")
+    parser.add_argument("--queue-timeout", type=float, default=30.0, help="排队超时时间（秒），超时返回503")
+    parser.add_argument("--error-429", type=float, default=0.0, help="注入429错误的概率")
+    parser.add_argument("--error-500", type=float, default=0.0, help="注入500错误的概率")
+    parser.add_argument("--error-503", type=float, default=0.0, help="注入503错误的概率")
+    parser.add_argument("--stream-error", type=float, default=0.0, help="流式输出途中发送error事件的概率")
+    parser.add_argument("--reset", type=float, default=0.0, help="流式输出途中断开连接的概率")
+    parser.add_argument("--history-ttft", type=float, default=0.0, help="同一会话中每多一轮历史增加的首字延迟（秒）")
+    parser.add_argument("--file-ttft", type=float, default=0.0, help="每个附件增加的首字延迟（秒）")
+    parser.add_argument("--remote-fetch-delay", type=float, default=0.0, help="每个remote_url附件增加的拉取耗时（秒）")
+    parser.add_argument("--seed", type=int, default=None)
+    return parser
+
+
+def config_from_args(args: argparse.Namespace) -> MockConfig:
+    """把命令行参数转换为MockConfig"""
+    min_tokens, _, max_tokens = args.tokens.partition(":")
+    return MockConfig(
+        ttft=args.ttft,
+        token_delay=args.token_delay,
+        min_tokens=int(min_tokens),
+        max_tokens=int(max_tokens or min_tokens),
+        max_concurrency=args.max_concurrency,
+        queue_size=args.queue_size,
+        queue_timeout=args.queue_timeout,
+        error_429_rate=args.error_429,
+        error_500_rate=args.error_500,
+        error_503_rate=args.error_503,
+        stream_error_rate=args.stream_error,
+        reset_rate=args.reset,
+        history_ttft=args.history_ttft,
+        file_ttft=args.file_ttft,
+        remote_fetch_delay=args.remote_fetch_delay,
+        seed=args.seed
+    )
+
+
+async def serve_forever(server: MockDifyServer):
+    """启动服务并一直运行"""
+    await server.start()
+    config = server.config
+    print("🧪 Dify模拟服务已启动")
+    print("=" * 50)
+    for protocol in PROTOCOL_PATHS:
+        print(f"📡 {protocol}: {server.url_for(protocol)}")
+    for path in UPLOAD_PATHS:
+        print(f"📎 文件上传: http://{server.host}:{server.port}{path}")
+    print(f"⏱️  首字延迟: {config.ttft.spec} | 逐token延迟: {config.token_delay.spec}")
+    print(f"🔤 回答长度: {config.min_tokens}~{config.max_tokens}个token")
+    if config.max_concurrency:
+        print(f"🔒 并发上限: {config.max_concurrency} | 排队长度: {config.queue_size}")
+    try:
+        while True:
+            await asyncio.sleep(3600)
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    arguments = build_arg_parser().parse_args()
+    try:
+        asyncio.run(serve_forever(MockDifyServer(config_from_args(arguments), arguments.host, arguments.port)))
+    except KeyboardInterrupt:
+        pass
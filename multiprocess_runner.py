@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+多进程压测
+每个CPU核心启动一个工作进程，各自运行独立的事件循环和aiohttp会话，
+分担目标速率或并发数，最后在父进程中合并统计并输出一份报告
+"""
+
+import multiprocessing
+import os
+import queue
+import time
+from typing import Dict, Any, Optional
+
+from api_stress_test import APIStressTester
+from stats_collector import StatsCollector
+from result_log import shard_log_path
+from loop_monitor import run_event_loop
+from run_plan import split_plan, execute_plan_at, merge_summaries, merge_question_stats, print_plan_report
+
+# 所有工作进程就绪后统一开始的缓冲时间（秒），避免先启动的进程提前施压
+START_DELAY = 2.0
+
+
+def _worker_main(worker_index: int, tester_kwargs: Dict[str, Any], plan: Dict[str, Any],
+                 start_at: float, result_queue, loop_backend: str = "asyncio"):
+    """工作进程入口"""
+    try:
+        # 实时指标只在单进程或分布式代理中提供，避免多个进程交错打印、争用同一端口
+        kwargs = dict(tester_kwargs, keep_results=False, live_interval=None, metrics_port=None)
+        if kwargs.get("question_seed") is not None:
+            # 每个进程使用不同的种子，整体仍可复现
+            kwargs["question_seed"] += worker_index
+        if kwargs.get("result_log_path"):
+            # 每个进程写自己的结果日志，避免多个进程交错写同一文件
+            kwargs["result_log_path"] = shard_log_path(kwargs["result_log_path"], worker_index)
+        tester = APIStressTester(**kwargs)
+        summary = run_event_loop(execute_plan_at(tester, plan, start_at), loop_backend)
+        result_queue.put({
+            "worker": worker_index,
+            "stats": tester.stats.to_dict(),
+            "question_stats": tester.question_stats,
+            "loop": tester.loop_name,
+            "summary": summary
+        })
+    except Exception as e:
+        result_queue.put({"worker": worker_index, "error": repr(e)})
+
+
+def run_multiprocess(tester_kwargs: Dict[str, Any], plan: Dict[str, Any],
+                     processes: Optional[int] = None, loop_backend: str = "asyncio") -> APIStressTester:
+    """按plan启动多进程压测，打印合并后的报告，并返回持有合并统计的APIStressTester"""
+    processes = processes or os.cpu_count() or 1
+    shares = split_plan(plan, processes)
+
+    print(f"🧵 多进程压测: {processes}个工作进程")
+    print(f"📡 目标API: {tester_kwargs['url']}")
+    print("-" * 50)
+
+    if tester_kwargs.get("upload_files"):
+        # 附件在父进程中上传一次，文件ID随构造参数交给各工作进程，避免每个进程重复上传
+        uploader = APIStressTester(**tester_kwargs)
+        attachments = run_event_loop(uploader.prepare_attachments(), loop_backend)
+        tester_kwargs = dict(tester_kwargs, uploaded_attachments=attachments)
+
+    # 使用spawn方式启动，保证在Windows和Linux上行为一致
+    context = multiprocessing.get_context("spawn")
+    result_queue = context.Queue()
+    start_at = time.time() + START_DELAY
+    workers = [
+        context.Process(target=_worker_main, args=(index, tester_kwargs, share, start_at, result_queue,
+                                                         loop_backend))
+        for index, share in enumerate(shares)
+    ]
+    for worker in workers:
+        worker.start()
+
+    # 先收取结果再join，避免工作进程因队列未被读取而阻塞退出
+    outputs = []
+    while len(outputs) < len(workers):
+        try:
+            outputs.append(result_queue.get(timeout=1.0))
+        except queue.Empty:
+            if not any(worker.is_alive() for worker in workers):
+                break
+    for worker in workers:
+        worker.join()
+
+    tester = APIStressTester(**tester_kwargs)
+    tester.stats = StatsCollector(tester.histogram_precision, tester.GROUP_FIELDS)
+    summaries = []
+    for output in sorted(outputs, key=lambda o: o["worker"]):
+        if "error" in output:
+            print(f"⚠️  工作进程{output['worker']}异常退出: {output['error']}")
+            continue
+        tester.stats.merge(StatsCollector.from_dict(output["stats"]))
+        merge_question_stats(tester.question_stats, output["question_stats"])
+        tester.loop_name = output.get("loop")
+        summaries.append(output["summary"])
+
+    missing = len(workers) - len(outputs)
+    if missing:
+        print(f"⚠️  {missing}个工作进程未返回结果")
+    if not summaries:
+        print("❌ 没有可用的工作进程结果")
+        return tester
+
+    tester.last_summary = merge_summaries(summaries)
+    print_plan_report(tester, plan, tester.last_summary, title=f"🧵 {len(summaries)}个工作进程的合并结果")
+    return tester
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+大规模问题语料
+以内存映射方式读取JSONL格式的问题语料（每行一个JSON对象，包含问题和类别），
+首次加载时建立按类别分组的行偏移索引并保存在语料旁边，之后只在抽到某行时才解码该行，
+启动时间和内存占用与语料规模无关
+"""
+
+import bisect
+import json
+import mmap
+import os
+import random
+import struct
+from array import array
+from typing import List, Dict, Tuple, Optional
+
+from question_bank import AliasTable
+
+INDEX_SUFFIX = ".idx"
+INDEX_MAGIC = b"PCIDX1\n"
+DEFAULT_CATEGORY = "uncategorized"
+
+
+class PromptCorpus:
+    """内存映射的JSONL问题语料"""
+
+    def __init__(self, path: str, prompt_field: str = "query", category_field: str = "category"):
+        self.path = path
+        self.index_path = path + INDEX_SUFFIX
+        self.prompt_field = prompt_field
+        self.category_field = category_field
+
+        if not self._index_is_fresh():
+            self.build_index()
+        self._open()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _source_signature(self) -> Tuple[int, int]:
+        """语料文件的大小和修改时间，用于判断索引是否过期"""
+        stat = os.stat(self.path)
+        return stat.st_size, stat.st_mtime_ns
+
+    def _read_index_header(self) -> Optional[Dict]:
+        """读取索引文件头，文件不存在或格式不对时返回None"""
+        try:
+            with open(self.index_path, "rb") as f:
+                if f.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+                    return None
+                (header_length,) = struct.unpack("<I", f.read(4))
+                return json.loads(f.read(header_length))
+        except (OSError, ValueError, struct.error):
+            return None
+
+    def _index_is_fresh(self) -> bool:
+        """索引存在且与当前语料文件、字段配置一致"""
+        header = self._read_index_header()
+        if header is None:
+            return False
+        size, mtime_ns = self._source_signature()
+        return (header["source_size"], header["source_mtime_ns"], header["prompt_field"], header["category_field"]) == \
+            (size, mtime_ns, self.prompt_field, self.category_field)
+
+    def build_index(self):
+        """扫描一遍语料，生成按类别分组的行偏移索引"""
+        offsets_by_category: Dict[str, array] = {}
+        skipped = 0
+        with open(self.path, "rb") as f:
+            offset = 0
+            for line in f:
+                line_offset = offset
+                offset += len(line)
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                    if not isinstance(record, dict) or not record.get(self.prompt_field):
+                        raise ValueError("缺少问题字段")
+                except ValueError:
+                    skipped += 1
+                    continue
+                category = str(record.get(self.category_field) or DEFAULT_CATEGORY)
+                offsets_by_category.setdefault(category, array("Q")).append(line_offset)
+
+        categories = []
+        start = 0
+        for name in sorted(offsets_by_category):
+            end = start + len(offsets_by_category[name])
+            categories.append([name, start, end])
+            start = end
+
+        size, mtime_ns = self._source_signature()
+        header = json.dumps({
+            "source_size": size,
+            "source_mtime_ns": mtime_ns,
+            "prompt_field": self.prompt_field,
+            "category_field": self.category_field,
+            "count": start,
+            "skipped": skipped,
+            "categories": categories
+        }, ensure_ascii=False).encode("utf-8")
+        # 偏移数组按8字节对齐，便于直接以memoryview读取
+        padding = -(len(INDEX_MAGIC) + 4 + len(header)) % 8
+
+        # 先写临时文件再替换，避免多个进程同时建索引时读到半个文件
+        temp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(INDEX_MAGIC)
+            f.write(struct.pack("<I", len(header) + padding))
+            f.write(header + b" " * padding)
+            for name, _, _ in categories:
+                offsets_by_category[name].tofile(f)
+        os.replace(temp_path, self.index_path)
+
+    def _open(self):
+        """映射语料和索引文件"""
+        header = self._read_index_header()
+        self.count = header["count"]
+        self.skipped = header["skipped"]
+        self.categories: List[str] = [name for name, _, _ in header["categories"]]
+        self.category_ranges: List[Tuple[int, int]] = [(start, end) for _, start, end in header["categories"]]
+        self._category_starts = [start for start, _ in self.category_ranges]
+
+        with open(self.path, "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.count else b""
+        with open(self.index_path, "rb") as f:
+            self._index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # 按随机顺序访问，关闭预读，避免每次抽样都把相邻的大段文件读入内存
+        for mapped in (self._data, self._index):
+            if isinstance(mapped, mmap.mmap) and hasattr(mapped, "madvise") and hasattr(mmap, "MADV_RANDOM"):
+                mapped.madvise(mmap.MADV_RANDOM)
+        (header_length,) = struct.unpack_from("<I", self._index, len(INDEX_MAGIC))
+        data_start = len(INDEX_MAGIC) + 4 + header_length
+        self._offsets = memoryview(self._index)[data_start:data_start + 8 * self.count].cast("Q")
+
+    def close(self):
+        """释放内存映射"""
+        self._offsets.release()
+        self._index.close()
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+
+    def category_of(self, index: int) -> str:
+        """第index个问题的类别"""
+        return self.categories[bisect.bisect_right(self._category_starts, index) - 1]
+
+    def get(self, index: int) -> Tuple[str, str]:
+        """解码第index个问题，返回(问题, 类别)"""
+        offset = self._offsets[index]
+        end = self._data.find(b"\n", offset)
+        if end < 0:
+            end = len(self._data)
+        record = json.loads(self._data[offset:end])
+        return record[self.prompt_field], self.category_of(index)
+
+    def category_counts(self) -> Dict[str, int]:
+        """各类别的问题数量"""
+        return {name: end - start for name, (start, end) in zip(self.categories, self.category_ranges)}
+
+    def sampler(self, category_weights: Optional[Dict[str, float]] = None, seed: Optional[int] = None) -> "CorpusSampler":
+        """创建抽样器：先按类别权重选类别，再在类别内等概率选一行"""
+        if not self.count:
+            raise ValueError(f"语料中没有可用的问题: {self.path}")
+        if category_weights is None:
+            # 未给权重时每个问题等概率，即类别权重与其问题数成正比
+            weights = [end - start for start, end in self.category_ranges]
+        else:
+            unknown = set(category_weights) - set(self.categories)
+            if unknown:
+                raise ValueError(f"语料中没有这些类别: {', '.join(sorted(unknown))}")
+            weights = [category_weights.get(name, 0.0) for name in self.categories]
+        return CorpusSampler(AliasTable(weights), self.category_ranges, seed)
+
+
+class CorpusSampler:
+    """语料抽样器，接口与QuestionSampler一致"""
+
+    BATCH_SIZE = 1024
+
+    def __init__(self, table: AliasTable, category_ranges: List[Tuple[int, int]], seed: Optional[int] = None):
+        self.table = table
+        self.category_ranges = category_ranges
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self._buffer: List[int] = []
+        self._position = 0
+
+    def sample(self, n: int) -> List[int]:
+        """批量抽取n个问题序号"""
+        draw = self.table.draw
+        rng = self.rng
+        ranges = self.category_ranges
+        indices = []
+        for _ in range(n):
+            start, end = ranges[draw(rng)]
+            indices.append(start + int(rng.random() * (end - start)))
+        return indices
+
+    def next_index(self) -> int:
+        """取下一个问题序号"""
+        if self._position >= len(self._buffer):
+            self._buffer = self.sample(self.BATCH_SIZE)
+            self._position = 0
+        index = self._buffer[self._position]
+        self._position += 1
+        return index
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+合成问题生成
+按目标输入长度分布（固定、均匀、对数正态）生成问题，每个问题开头的一部分取自所有问题共享的系统提示前缀，
+其余部分由问题库中的问题拼接而成；问题在压测开始前一次性生成到缓冲区中，发送时不再有生成开销
+
+长度以字符计，对中文问题约等于token数
+"""
+
+import bisect
+import random
+from typing import List, Optional
+
+from load_profiles import Distribution
+from question_bank import question_bank
+
+# 输入长度分桶的上边界（字符），用于按输入长度分组统计延迟
+INPUT_LENGTH_BOUNDS = [128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768]
+SHARED_PREFIX_HEADER = "你是一个专业、耐心的智能助手。请先阅读以下参考资料，再回答用户最后提出的问题。\n参考资料：\n"
+
+
+def input_length_buckets() -> List[str]:
+    """按从短到长排列的全部分桶名称"""
+    labels = []
+    lower = 0
+    for upper in INPUT_LENGTH_BOUNDS:
+        labels.append(f"{lower}-{upper}")
+        lower = upper
+    labels.append(f"{lower}+")
+    return labels
+
+
+_BUCKET_LABELS = input_length_buckets()
+
+
+def input_length_bucket(length: int) -> str:
+    """输入长度所在的分桶名称"""
+    return _BUCKET_LABELS[bisect.bisect_left(INPUT_LENGTH_BOUNDS, length)]
+
+
+class PromptSynthesizer:
+    """按长度分布和共享前缀比例预先生成一批问题"""
+
+    def __init__(self, length: str = "lognormal:1000,0.5", shared_prefix_ratio: float = 0.0,
+                 pool_size: int = 1024, seed: Optional[int] = None,
+                 min_length: int = 16, max_length: int = 32768, questions: Optional[List[str]] = None):
+        if not 0.0 <= shared_prefix_ratio < 1.0:
+            raise ValueError("shared_prefix_ratio取值范围为[0, 1)")
+        if pool_size < 1:
+            raise ValueError("pool_size必须大于0")
+        self.length = Distribution(length)       # 输入长度分布（字符）
+        self.shared_prefix_ratio = shared_prefix_ratio  # 每个问题中共享前缀所占的比例
+        self.pool_size = pool_size
+        self.seed = seed
+        self.min_length = min_length
+        self.max_length = max_length
+        self.questions = questions or question_bank.prompts
+
+        rng = random.Random(seed)
+        # 共享前缀只生成一次，各问题按自身长度截取其开头部分，前缀缓存可以命中
+        self.shared_prefix = SHARED_PREFIX_HEADER + self._stitch(max_length, rng)
+        self.prompts: List[str] = [self._generate(index, rng) for index in range(pool_size)]
+
+    def _stitch(self, length: int, rng: random.Random) -> str:
+        """随机拼接问题库中的问题，直到达到length个字符"""
+        pieces = []
+        total = 0
+        while total < length:
+            question = self.questions[rng.randrange(len(self.questions))]
+            pieces.append(question)
+            total += len(question) + 1
+        return "\n".join(pieces)[:length]
+
+    def _generate(self, index: int, rng: random.Random) -> str:
+        """生成一个问题：共享前缀 + 编号 + 拼接的问题"""
+        length = int(round(self.length.sample(rng)))
+        length = min(max(length, self.min_length), self.max_length)
+        prefix = self.shared_prefix[:int(length * self.shared_prefix_ratio)]
+        # 编号保证各问题在前缀之后立即不同，避免整段命中缓存
+        unique = f"\n[{index}] " + self._stitch(length, rng)
+        return (prefix + unique)[:length]
+
+    def lengths(self) -> List[int]:
+        """缓冲区中每个问题的长度"""
+        return [len(prompt) for prompt in self.prompts]
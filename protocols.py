@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+协议适配器
+压测引擎与具体接口格式解耦：每个适配器负责把问题填入请求体、从流式事件和blocking响应中取出输出文本、token数和错误，
+目前支持Dify chat-messages、completion-messages、workflows/run以及OpenAI兼容的/v1/chat/completions；
+Backend把一个压测目标的地址、请求头、请求模板和适配器组合在一起，同一轮压测可以在多个Backend之间交替发送
+"""
+
+from typing import Dict, Any, List, Optional, Tuple
+
+from request_body_cache import RequestBodyCache
+
+# 解析结果：(输出文本, 输出token数, 错误信息)，不适用的项为None
+Parsed = Tuple[Optional[str], Optional[int], Optional[str]]
+_NOTHING: Parsed = (None, None, None)
+# 工作流结束时不视为错误的状态（stopped为调用停止接口后的正常结束）
+_WORKFLOW_OK_STATUSES = (None, 'succeeded', 'stopped', 'partial-succeeded')
+# Dify的文件上传接口，上传后以local_file方式在files字段中引用
+DIFY_UPLOAD_PATH = "/v1/files/upload"
+
+
+def _dify_completion_tokens(data: Any) -> Optional[int]:
+    """从message_end或blocking响应的metadata中取出输出token数"""
+    if not isinstance(data, dict):
+        return None
+    usage = (data.get('metadata') or {}).get('usage') or {}
+    tokens = usage.get('completion_tokens')
+    return tokens if isinstance(tokens, int) and tokens > 0 else None
+
+
+def _error_message(data: Any) -> str:
+    """错误事件中的错误信息"""
+    return data.get('message') if isinstance(data, dict) else data
+
+
+def _parse_dify_message_event(event: Dict[str, Any]) -> Parsed:
+    """chat-messages和completion-messages共用的流式事件格式"""
+    name = event['event']
+    data = event['data']
+    if name in ('message', 'agent_message'):
+        if isinstance(data, dict) and data.get('answer'):
+            return data['answer'], None, None
+    elif name == 'message_end':
+        return None, _dify_completion_tokens(data), None
+    elif name == 'error':
+        return None, None, _error_message(data)
+    # ping及其他事件只用于保活，不计入统计
+    return _NOTHING
+
+
+def _parse_dify_message_blocking(data: Any) -> Parsed:
+    """chat-messages和completion-messages共用的blocking响应格式"""
+    if not isinstance(data, dict):
+        return _NOTHING
+    return data.get('answer') or None, _dify_completion_tokens(data), None
+
+
+class ProtocolAdapter:
+    """协议适配器基类"""
+
+    name = ""
+    path = ""                       # 接口路径，用于文档和模拟服务
+    prompt_fields: Tuple[str, ...] = ()             # 请求体中随问题变化的顶层字段
+    session_fields: Tuple[str, ...] = ("user",)     # 可逐请求拼接替换的会话相关字段
+    supports_conversations = False  # 是否支持通过conversation_id进行多轮会话
+    stop_path: Optional[str] = None  # 停止生成接口的路径模板，{task_id}为流式事件中的任务ID，None表示不支持
+    upload_path: Optional[str] = None  # 文件上传接口的路径，None表示不支持附件
+
+    def __init__(self, input_field: str = "query"):
+        self.input_field = input_field  # 问题填入inputs中的变量名
+
+    def fill(self, prompt: str) -> Dict[str, Any]:
+        """问题对应的请求体字段"""
+        return {"inputs": {self.input_field: prompt}}
+
+    def prompt_of(self, payload: Dict[str, Any]) -> str:
+        """请求模板中已有的问题，用于固定问题模式"""
+        return str((payload.get("inputs") or {}).get(self.input_field) or "")
+
+    def parse_event(self, event: Dict[str, Any]) -> Parsed:
+        """解析一个SSE事件"""
+        raise NotImplementedError
+
+    def parse_blocking(self, data: Any) -> Parsed:
+        """解析blocking模式的JSON响应"""
+        raise NotImplementedError
+
+    def conversation_id(self, data: Any) -> Optional[str]:
+        """响应中返回的会话ID"""
+        return None
+
+    def task_id(self, data: Any) -> Optional[str]:
+        """流式事件中的任务ID，用于调用停止生成接口"""
+        return (data.get('task_id') or None) if isinstance(data, dict) and self.stop_path else None
+
+
+class DifyChatAdapter(ProtocolAdapter):
+    """Dify /v1/chat-messages（聊天助手、Agent、Chatflow）"""
+
+    name = "dify-chat"
+    path = "/v1/chat-messages"
+    prompt_fields = ("inputs", "query")
+    session_fields = ("user", "conversation_id")
+    supports_conversations = True
+    stop_path = "/v1/chat-messages/{task_id}/stop"
+    upload_path = DIFY_UPLOAD_PATH
+
+    def __init__(self, input_field: Optional[str] = "content"):
+        # 问题同时作为query和inputs中的变量传入，input_field为None时inputs保持为空
+        super().__init__(input_field)
+
+    def fill(self, prompt: str) -> Dict[str, Any]:
+        return {"inputs": {self.input_field: prompt} if self.input_field else {}, "query": prompt}
+
+    def prompt_of(self, payload: Dict[str, Any]) -> str:
+        return str(payload.get("query") or "")
+
+    def parse_event(self, event: Dict[str, Any]) -> Parsed:
+        return _parse_dify_message_event(event)
+
+    def parse_blocking(self, data: Any) -> Parsed:
+        return _parse_dify_message_blocking(data)
+
+    def conversation_id(self, data: Any) -> Optional[str]:
+        return (data.get('conversation_id') or None) if isinstance(data, dict) else None
+
+
+class DifyCompletionAdapter(ProtocolAdapter):
+    """Dify /v1/completion-messages（文本生成应用），问题作为inputs中的变量传入"""
+
+    name = "dify-completion"
+    path = "/v1/completion-messages"
+    prompt_fields = ("inputs",)
+    stop_path = "/v1/completion-messages/{task_id}/stop"
+    upload_path = DIFY_UPLOAD_PATH
+
+    def parse_event(self, event: Dict[str, Any]) -> Parsed:
+        return _parse_dify_message_event(event)
+
+    def parse_blocking(self, data: Any) -> Parsed:
+        return _parse_dify_message_blocking(data)
+
+
+class DifyWorkflowAdapter(ProtocolAdapter):
+    """Dify /v1/workflows/run（工作流应用），流式输出来自text_chunk事件"""
+
+    name = "dify-workflow"
+    path = "/v1/workflows/run"
+    prompt_fields = ("inputs",)
+    stop_path = "/v1/workflows/tasks/{task_id}/stop"
+    upload_path = DIFY_UPLOAD_PATH
+
+    def parse_event(self, event: Dict[str, Any]) -> Parsed:
+        name = event['event']
+        data = event['data']
+        inner = data.get('data') if isinstance(data, dict) else None
+        if name == 'text_chunk':
+            if isinstance(inner, dict) and inner.get('text'):
+                return inner['text'], None, None
+        elif name == 'workflow_finished':
+            if isinstance(inner, dict) and inner.get('status') not in _WORKFLOW_OK_STATUSES:
+                return None, None, f"workflow {inner.get('status')}: {inner.get('error')}"
+        elif name == 'error':
+            return None, None, _error_message(data)
+        # 工作流的total_tokens包含输入，输出token数按text_chunk块数计
+        return _NOTHING
+
+    def parse_blocking(self, data: Any) -> Parsed:
+        inner = data.get('data') if isinstance(data, dict) else None
+        if not isinstance(inner, dict):
+            return _NOTHING
+        if inner.get('status') not in _WORKFLOW_OK_STATUSES:
+            return None, None, f"workflow {inner.get('status')}: {inner.get('error')}"
+        outputs = inner.get('outputs') or {}
+        return "".join(str(value) for value in outputs.values()) or None, None, None
+
+
+class OpenAIChatAdapter(ProtocolAdapter):
+    """OpenAI兼容的/v1/chat/completions（vLLM、SGLang、各类模型网关），stream=True时逐块解析delta"""
+
+    name = "openai-chat"
+    path = "/v1/chat/completions"
+    prompt_fields = ("messages",)
+
+    def __init__(self, system_prompt: Optional[str] = None):
+        super().__init__()
+        self.system_prompt = system_prompt
+
+    def fill(self, prompt: str) -> Dict[str, Any]:
+        messages = [{"role": "system", "content": self.system_prompt}] if self.system_prompt else []
+        messages.append({"role": "user", "content": prompt})
+        return {"messages": messages}
+
+    def prompt_of(self, payload: Dict[str, Any]) -> str:
+        messages = payload.get("messages") or [{}]
+        return str(messages[-1].get("content") or "")
+
+    @staticmethod
+    def _usage_tokens(data: Dict[str, Any]) -> Optional[int]:
+        tokens = (data.get('usage') or {}).get('completion_tokens')
+        return tokens if isinstance(tokens, int) and tokens > 0 else None
+
+    def parse_event(self, event: Dict[str, Any]) -> Parsed:
+        data = event['data']
+        # 流以data: [DONE]结束
+        if not isinstance(data, dict):
+            return _NOTHING
+        if data.get('error'):
+            return None, None, _error_message(data['error'])
+        choices = data.get('choices') or [{}]
+        text = (choices[0].get('delta') or {}).get('content') or None
+        return text, self._usage_tokens(data), None
+
+    def parse_blocking(self, data: Any) -> Parsed:
+        if not isinstance(data, dict):
+            return _NOTHING
+        if data.get('error'):
+            return None, None, _error_message(data['error'])
+        choices = data.get('choices') or [{}]
+        text = (choices[0].get('message') or {}).get('content') or None
+        return text, self._usage_tokens(data), None
+
+
+PROTOCOLS = {adapter.name: adapter for adapter in
+             (DifyChatAdapter, DifyCompletionAdapter, DifyWorkflowAdapter, OpenAIChatAdapter)}
+
+
+def create_adapter(protocol: str = "dify-chat", **options: Any) -> ProtocolAdapter:
+    """按名称创建协议适配器，options为适配器的构造参数"""
+    adapter = PROTOCOLS.get(protocol)
+    if adapter is None:
+        raise ValueError(f"未知的协议: {protocol}，可选: {', '.join(PROTOCOLS)}")
+    return adapter(**options)
+
+
+class Backend:
+    """一个压测目标：地址、请求头、请求模板和协议适配器，以及预编码的请求体"""
+
+    def __init__(self, url: str, headers: Dict[str, str], payload: Dict[str, Any], protocol: str = "dify-chat",
+                 protocol_options: Optional[Dict[str, Any]] = None, name: Optional[str] = None,
+                 attach_files: bool = False):
+        self.name = name or protocol
+        self.url = url
+        self.adapter = create_adapter(protocol, **(protocol_options or {}))
+        # 附件：协议支持文件上传时，files字段逐请求以拼接方式替换为预先上传的文件，模板中原有的files不再发送
+        self.attach_files = attach_files and self.adapter.upload_path is not None
+        self.splice_fields = self.adapter.session_fields
+        if self.attach_files:
+            payload = dict(payload, files=[])
+            self.splice_fields += ("files",)
+        # 只有模板中存在的字段才能拼接，缺少的问题字段以空问题补上
+        self.payload = dict(self.adapter.fill(""), **payload)
+        self.request_headers = dict(headers, **{"Content-Type": "application/json"})
+        # 只预编码模板的请求体，用于语料、流量回放等无法预先枚举问题的场景
+        self.template_cache = RequestBodyCache(self.payload, splice_fields=self.adapter.prompt_fields +
+                                               self.splice_fields)
+        self.template_cache.add({})
+        self.body_cache = self.template_cache
+
+    def stop_url(self, task_id: str) -> Optional[str]:
+        """停止生成接口的地址，url不以协议的接口路径结尾时无法推断，返回None"""
+        adapter = self.adapter
+        if adapter.stop_path is None or not self.url.endswith(adapter.path):
+            return None
+        return self.url[:-len(adapter.path)] + adapter.stop_path.format(task_id=task_id)
+
+    def upload_url(self) -> Optional[str]:
+        """文件上传接口的地址，协议不支持或url不以协议的接口路径结尾时返回None"""
+        adapter = self.adapter
+        if adapter.upload_path is None or not self.url.endswith(adapter.path):
+            return None
+        return self.url[:-len(adapter.path)] + adapter.upload_path
+
+    def build_body_cache(self, prompts: Optional[List[str]]):
+        """把每个问题对应的请求体预先序列化，prompts为None时只编码模板本身（固定问题）"""
+        cache = RequestBodyCache(self.payload, splice_fields=self.splice_fields)
+        if prompts is None:
+            cache.add({})
+        else:
+            for prompt in prompts:
+                cache.add(self.adapter.fill(prompt))
+        self.body_cache = cache
+
+    def build_body(self, prompt: str, **fields: Any) -> bytes:
+        """以拼接方式把任意问题（及user、conversation_id等字段）填入请求模板"""
+        fields.update(self.adapter.fill(prompt))
+        splice_fields = self.template_cache.splice_fields
+        return self.template_cache.body(0, **{k: v for k, v in fields.items() if k in splice_fields})
+
+    def body(self, index: int, **fields: Any) -> bytes:
+        """预编码的第index个请求体，fields中的会话字段以拼接方式替换"""
+        splice_fields = self.body_cache.splice_fields
+        return self.body_cache.body(index, **{k: v for k, v in fields.items() if k in splice_fields})
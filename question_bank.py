@@ -5,7 +5,67 @@
 """
 
 import random
-from typing import List, Dict
+from typing import List, Dict, Tuple, Optional
+
+class AliasTable:
+    """Vose别名表：预处理O(n)，之后每次按权重抽样O(1)"""
+    
+    def __init__(self, weights: List[float]):
+        total = sum(weights)
+        if not weights or total <= 0:
+            raise ValueError("权重之和必须大于0")
+        n = len(weights)
+        self.size = n
+        self.probability = [0.0] * n
+        self.alias = list(range(n))
+        
+        scaled = [w * n / total for w in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.probability[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        for i in small + large:
+            self.probability[i] = 1.0
+    
+    def draw(self, rng: random.Random) -> int:
+        """抽取一个序号"""
+        u = rng.random() * self.size
+        index = int(u)
+        return index if u - index < self.probability[index] else self.alias[index]
+
+
+class QuestionSampler:
+    """在问题库的扁平数组上按类别权重抽样，每个压测实例持有独立的随机状态"""
+    
+    # 预取的序号数量，热路径上只需从缓冲区取一个整数
+    BATCH_SIZE = 1024
+    
+    def __init__(self, table: AliasTable, seed: Optional[int] = None):
+        self.table = table
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self._buffer: List[int] = []
+        self._position = 0
+    
+    def sample(self, n: int) -> List[int]:
+        """批量抽取n个问题序号"""
+        draw = self.table.draw
+        rng = self.rng
+        return [draw(rng) for _ in range(n)]
+    
+    def next_index(self) -> int:
+        """取下一个问题序号"""
+        if self._position >= len(self._buffer):
+            self._buffer = self.sample(self.BATCH_SIZE)
+            self._position = 0
+        index = self._buffer[self._position]
+        self._position += 1
+        return index
+
 
 class QuestionBank:
     """问题库类"""
@@ -124,17 +184,60 @@ class QuestionBank:
                 "如何应对工作压力？"
             ]
         }
+        
+        # 扁平数组：prompts[i]为第i个问题，prompt_categories[i]为其类别
+        self.prompts: List[str] = []
+        self.prompt_categories: List[str] = []
+        for category, questions in self.questions.items():
+            self.prompts.extend(questions)
+            self.prompt_categories.extend([category] * len(questions))
+        self._default_sampler = self.sampler()
+        self.corpora = {}  # 已加载的外部语料: {路径: PromptCorpus}
+    
+    def load_corpus(self, path: str, prompt_field: str = "query", category_field: str = "category"):
+        """以内存映射方式加载外部JSONL语料，首次加载时在语料旁生成行偏移索引"""
+        from prompt_corpus import PromptCorpus
+        key = (path, prompt_field, category_field)
+        if key not in self.corpora:
+            self.corpora[key] = PromptCorpus(path, prompt_field, category_field)
+        return self.corpora[key]
+    
+    def build_alias_table(self, category_weights: Optional[Dict[str, float]] = None) -> AliasTable:
+        """按类别权重构建别名表，未给出权重时各类别等概率；类别内的问题等概率"""
+        if category_weights is None:
+            category_weights = {category: 1.0 for category in self.questions}
+        unknown = set(category_weights) - set(self.questions)
+        if unknown:
+            raise ValueError(f"未知的问题类别: {', '.join(sorted(unknown))}")
+        
+        weights = []
+        for category, questions in self.questions.items():
+            weight = category_weights.get(category, 0.0)
+            weights.extend([weight / len(questions)] * len(questions))
+        return AliasTable(weights)
+    
+    def sampler(self, category_weights: Optional[Dict[str, float]] = None, seed: Optional[int] = None) -> QuestionSampler:
+        """创建一个独立的抽样器，相同的权重和种子产生相同的问题序列"""
+        return QuestionSampler(self.build_alias_table(category_weights), seed)
     
     def get_random_question(self) -> Dict[str, str]:
         """获取随机问题"""
-        category = random.choice(list(self.questions.keys()))
-        question = random.choice(self.questions[category])
+        index = self._default_sampler.next_index()
+        question = self.prompts[index]
         return {
-            "category": category,
+            "category": self.prompt_categories[index],
             "question": question,
             "content": question  # 用于API请求的content字段
         }
     
+    def get_flat_questions(self) -> List[Tuple[str, str]]:
+        """按固定顺序展开所有问题，返回(类别, 问题)列表"""
+        return list(zip(self.prompt_categories, self.prompts))
+    
+    def get_random_index(self) -> int:
+        """获取随机问题在get_flat_questions()中的序号"""
+        return self._default_sampler.next_index()
+    
     def get_questions_by_category(self, category: str) -> List[str]:
         """根据类别获取问题"""
         return self.questions.get(category, [])
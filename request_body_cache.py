@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+预编码请求体缓存
+启动时把每个问题对应的请求体一次性序列化为bytes，发送时直接复用，
+需要逐请求变化的字段（如user、conversation_id）以拼接字节片段的方式替换，无需重新序列化整个JSON
+"""
+
+import json
+from typing import Dict, Any, List, Tuple, Iterable
+
+# 序列化时为可拼接字段占位的标记
+SPLICE_MARKER = "__splice_{}__"
+
+
+class RequestBodyCache:
+    """按序号保存预序列化的请求体"""
+
+    def __init__(self, template: Dict[str, Any], splice_fields: Iterable[str] = ("user", "conversation_id")):
+        self.template = template
+        # 只有模板顶层存在的字段才能拼接，按在模板中出现的顺序排列
+        keys = list(template)
+        self.splice_fields = tuple(sorted((f for f in splice_fields if f in template), key=keys.index))
+        self._default_values = [json.dumps(template[f]).encode("utf-8") for f in self.splice_fields]
+        self._parts: List[Tuple[bytes, ...]] = []
+        self._bodies: List[bytes] = []
+
+    def __len__(self) -> int:
+        return len(self._bodies)
+
+    def add(self, fields: Dict[str, Any]) -> int:
+        """以模板为基础覆盖fields后序列化，返回该请求体的序号"""
+        payload = dict(self.template, **fields)
+        marked = dict(payload)
+        for field in self.splice_fields:
+            marked[field] = SPLICE_MARKER.format(field)
+
+        # 按占位标记把序列化结果切成若干片段
+        rest = json.dumps(marked).encode("utf-8")
+        parts = []
+        for field in self.splice_fields:
+            marker = json.dumps(SPLICE_MARKER.format(field)).encode("utf-8")
+            before, found, rest = rest.partition(marker)
+            if not found:
+                raise ValueError(f"无法定位可拼接字段: {field}")
+            parts.append(before)
+        parts.append(rest)
+
+        self._parts.append(tuple(parts))
+        self._bodies.append(json.dumps(payload).encode("utf-8"))
+        return len(self._bodies) - 1
+
+    def body(self, index: int, **overrides: Any) -> bytes:
+        """取出序号为index的请求体，overrides中的字段以拼接方式替换"""
+        if not overrides:
+            return self._bodies[index]
+
+        unknown = set(overrides) - set(self.splice_fields)
+        if unknown:
+            raise ValueError(f"字段不可拼接: {', '.join(sorted(unknown))}，可拼接字段: {', '.join(self.splice_fields)}")
+
+        parts = self._parts[index]
+        pieces = [parts[0]]
+        for position, field in enumerate(self.splice_fields):
+            value = overrides.get(field)
+            pieces.append(self._default_values[position] if value is None else json.dumps(value).encode("utf-8"))
+            pieces.append(parts[position + 1])
+        return b"".join(pieces)
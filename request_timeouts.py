@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+分阶段超时与失败分类
+把单一的总超时拆分为连接、首字、输出间隔和总耗时四个预算：连接和总耗时交给aiohttp的ClientTimeout，
+首字和输出间隔由StreamWatchdog在事件循环上计时，到期时取消请求所在的任务；
+每个失败的请求按原因归入FAILURE_TYPES中的一类
+"""
+
+import asyncio
+from typing import Optional
+
+import aiohttp
+
+# 失败类型及其在报告中的名称
+FAILURE_TYPES = {
+    "connect_timeout": "连接超时",
+    "ttft_timeout": "首字超时",
+    "idle_timeout": "输出间隔超时",
+    "total_timeout": "总耗时超时",
+    "http_error": "HTTP错误状态码",
+    "response_error": "响应中的错误事件",
+    "connection_error": "连接错误",
+}
+
+
+def client_timeout(total: Optional[float], connect: Optional[float] = None) -> aiohttp.ClientTimeout:
+    """aiohttp的超时设置：connect只计新建连接（TCP+TLS），不含在连接池中排队的时间"""
+    return aiohttp.ClientTimeout(total=total, sock_connect=connect)
+
+
+def classify_exception(exception: BaseException) -> str:
+    """请求过程中抛出的异常对应的失败类型"""
+    if isinstance(exception, aiohttp.ConnectionTimeoutError):
+        return "connect_timeout"
+    if isinstance(exception, asyncio.TimeoutError):
+        return "total_timeout"
+    return "connection_error"
+
+
+class StreamWatchdog:
+    """首字与输出间隔计时器
+
+    只保留一个定时器，到期时按最新的时刻重新计算截止时间，未真正超时则顺延，
+    因此每收到一块数据只需更新时刻，不必重设定时器；真正超时时取消请求所在的任务，fired记录超时类型
+    """
+
+    def __init__(self, ttft_timeout: Optional[float], idle_timeout: Optional[float]):
+        self.ttft_timeout = ttft_timeout
+        self.idle_timeout = idle_timeout
+        self.fired: Optional[str] = None
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.current_task()
+        self._start = self._loop.time()
+        self._first_output: Optional[float] = None  # 收到第一段输出后才计算输出间隔，此前的等待由首字超时负责
+        self._last_received = self._start
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._schedule()
+
+    def _deadline(self):
+        """最近的截止时刻及其超时类型"""
+        deadlines = []
+        if self.ttft_timeout and self._first_output is None:
+            deadlines.append((self._start + self.ttft_timeout, "ttft_timeout"))
+        if self.idle_timeout and self._first_output is not None:
+            deadlines.append((self._last_received + self.idle_timeout, "idle_timeout"))
+        return min(deadlines) if deadlines else (None, None)
+
+    def _schedule(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        deadline, _ = self._deadline()
+        if deadline is not None and self.fired is None:
+            self._handle = self._loop.call_at(deadline, self._check)
+
+    def _check(self):
+        self._handle = None
+        deadline, kind = self._deadline()
+        if deadline is None:
+            return
+        if self._loop.time() >= deadline:
+            self.fired = kind
+            self._task.cancel()
+        else:
+            self._handle = self._loop.call_at(deadline, self._check)
+
+    def received(self):
+        """收到一块数据"""
+        self._last_received = self._loop.time()
+
+    def first_output(self):
+        """收到第一段输出（blocking模式为收到响应头）"""
+        if self._first_output is None:
+            self._first_output = self._last_received = self._loop.time()
+            self._schedule()
+
+    def stop(self) -> Optional[str]:
+        """停止计时，返回已经触发的超时类型"""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self.ttft_timeout = self.idle_timeout = None
+        return self.fired
+
+    def absorb_cancel(self):
+        """捕获到由本计时器发出的取消后调用，恢复任务的取消计数（Python 3.11+）"""
+        uncancel = getattr(self._task, "uncancel", None)
+        if uncancel is not None:
+            uncancel()
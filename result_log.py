@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+逐请求结果日志
+压测过程中把每个请求的结果（各阶段耗时、状态码、大小、类别、错误）追加写入JSONL文件，
+序列化和文件写入都在后台线程中批量进行，不阻塞事件循环；
+压测结束后可以把日志读回统计代码，离线重新生成报告
+
+用法：
+    python result_log.py results.jsonl
+    python result_log.py results.*.jsonl.gz --run 2
+"""
+
+import argparse
+import glob
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+
+from result_store import ResultStore
+from stats_collector import StatsCollector
+
+# 时间类字段保留到微秒，缩小日志体积
+TIME_FIELDS = ("timestamp", "response_time", "header_time", "ttft", "generation_time", "dns_time", "pool_wait_time",
+               "connect_time", "send_time", "wait_time", "first_byte_time", "send_delay", "intended_timestamp",
+               "stop_latency")
+_STOP = object()
+
+
+def open_log(path: str, mode: str):
+    """以文本方式打开日志，.gz结尾的文件自动压缩（追加时每轮写入一个新的gzip成员）"""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def shard_log_path(path: str, shard: Any) -> str:
+    """多进程或多代理时每个分片写自己的文件，如results.jsonl → results.3.jsonl"""
+    base, ext = os.path.splitext(path)
+    if ext == ".gz":
+        base, inner = os.path.splitext(base)
+        ext = inner + ext
+    return f"{base}.{shard}{ext}"
+
+
+def compact_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """去掉多余精度后的结果"""
+    record = dict(result)
+    for field in TIME_FIELDS:
+        if isinstance(record.get(field), float):
+            record[field] = round(record[field], 6)
+    if record.get("inter_token_latencies"):
+        record["inter_token_latencies"] = [round(x, 6) for x in record["inter_token_latencies"]]
+    if isinstance(record.get("tokens_per_second"), float):
+        record["tokens_per_second"] = round(record["tokens_per_second"], 3)
+    return record
+
+
+class ResultLogWriter:
+    """后台线程批量追加写入结果日志"""
+
+    def __init__(self, path: str, batch_size: int = 1024, flush_interval: float = 0.5):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval  # 最长多久落盘一次（秒）
+        self.written = 0
+        self.error: Optional[BaseException] = None
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        # 每轮压测以一行运行头开始，离线读取时据此区分不同的运行
+        self._queue.put({"run_started": time.time()})
+        self._thread = threading.Thread(target=self._run, name="result-log-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, result: Dict[str, Any]):
+        """提交一条请求结果，只入队，不做任何I/O"""
+        self._queue.put(result)
+
+    def write_exception(self, exception: BaseException):
+        """提交一个未被send_request捕获的异常"""
+        self._queue.put({"exception": repr(exception), "timestamp": time.time()})
+
+    def close(self):
+        """等待队列中的结果全部写完"""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        if self.error is not None:
+            print(f"⚠️  结果日志写入失败: {self.error}")
+
+    def _next_batch(self) -> Tuple[List[Dict[str, Any]], bool]:
+        """取出一批待写的结果，返回(批次, 是否收到停止信号)"""
+        batch = []
+        try:
+            item = self._queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return batch, False
+        while True:
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                return batch, False
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return batch, False
+
+    def _run(self):
+        try:
+            with open_log(self.path, "at") as f:
+                stopped = False
+                while not stopped:
+                    batch, stopped = self._next_batch()
+                    if not batch:
+                        continue
+                    f.write("".join(
+                        json.dumps(compact_result(r), ensure_ascii=False, separators=(",", ":")) + "\n"
+                        for r in batch
+                    ))
+                    f.flush()
+                    self.written += len(batch)
+        except Exception as e:
+            self.error = e
+
+
+def iter_records(path: str, run: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """逐行读取日志中的请求结果，run为文件内第几轮运行（从1开始），None表示全部"""
+    current_run = 0
+    with open_log(path, "rt") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # 进程被强制结束时最后一行可能不完整
+                continue
+            if "run_started" in record:
+                current_run += 1
+                continue
+            if run is None or current_run == run:
+                yield record
+
+
+def load_stats(paths: Iterable[str], significant_digits: int = 2, group_fields: Iterable[str] = (),
+               run: Optional[int] = None, store: Optional[ResultStore] = None
+               ) -> Tuple[StatsCollector, Dict[str, int], float]:
+    """把日志读回统计代码，返回(统计, 问题类型分布, 总耗时)；传入store时同时把结果按列存入其中"""
+    stats = StatsCollector(significant_digits, group_fields)
+    question_stats: Dict[str, int] = {}
+    first_start = None
+    last_end = None
+    for path in paths:
+        for record in iter_records(path, run):
+            if "exception" in record:
+                stats.record_exception()
+                if store is not None:
+                    store.record_exception()
+                continue
+            stats.record(record)
+            if store is not None:
+                store.append(record)
+            category = record.get("question_category")
+            question_stats[category] = question_stats.get(category, 0) + 1
+
+            start = record.get("timestamp")
+            if start is not None:
+                end = start + record["response_time"]
+                first_start = start if first_start is None else min(first_start, start)
+                last_end = end if last_end is None else max(last_end, end)
+    total_time = last_end - first_start if first_start is not None else 0.0
+    return stats, question_stats, total_time
+
+
+def main():
+    """命令行入口：离线生成报告"""
+    parser = argparse.ArgumentParser(description="从结果日志离线生成压测报告")
+    parser.add_argument("paths", nargs="+", help="结果日志文件（支持通配符）")
+    parser.add_argument("--run", type=int, default=None, help="只统计每个文件中的第几轮运行（从1开始）")
+    parser.add_argument("--precision", type=int, default=2, help="直方图有效数字位数")
+    parser.add_argument("--time-bucket", type=float, default=10.0, help="按时间段细分时每段的秒数")
+    args = parser.parse_args()
+
+    # 报告格式复用APIStressTester的打印方法
+    from api_stress_test import APIStressTester
+
+    paths = sorted({p for pattern in args.paths for p in (glob.glob(pattern) or [pattern])})
+    tester = APIStressTester("", {}, {}, use_random_questions=False, histogram_precision=args.precision,
+                             time_bucket=args.time_bucket)
+    tester.stats, tester.question_stats, total_time = load_stats(
+        paths, args.precision, tester.GROUP_FIELDS, args.run, tester.results
+    )
+
+    print(f"📂 结果日志: {', '.join(paths)}")
+    tester.print_results(total_time)
+    for field, title in tester.GROUP_TITLES.items():
+        # 输入长度、后端和附件数分组由print_results在多于一组时打印
+        if field not in ("input_bucket", "backend", "attachments"):
+            tester.print_group_stats(field, title)
+
+
+if __name__ == "__main__":
+    main()
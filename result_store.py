@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+列式结果存储
+逐请求结果按字段存入定类型的数组（浮点、整数、字典编码的类别），数组按固定行数分块增长，
+不必为每个请求保留一个字典；统计时整列参与计算，安装了NumPy时用向量化的排序和计数完成分组与分位数，
+未安装时退回纯Python实现，结果相同
+"""
+
+import math
+from array import array
+from typing import Dict, Any, Callable, Iterable, List, Optional, Sequence, Tuple
+
+from stats_collector import TRUNCATED_METRICS
+
+try:
+    import numpy as np
+except ImportError:  # NumPy是可选依赖
+    np = None
+
+# 浮点列，None存为NaN
+FLOAT_COLUMNS = ("timestamp", "response_time", "header_time", "ttft", "generation_time", "tokens_per_second",
+                 "send_delay", "stop_latency")
+# 整数列，None存为0
+INT_COLUMNS = ("status_code", "chunk_count", "output_tokens", "response_size")
+# 布尔列
+BOOL_COLUMNS = ("success", "aborted")
+# 类别列：每个不同的取值编一个号，列中只存编号
+CATEGORY_COLUMNS = ("question_category", "stage", "backend", "failure_type", "input_bucket", "turn", "attachments")
+
+# 可用于分组的键，time_bucket为请求开始时刻相对首个请求所在的时间段
+GROUP_KEYS = CATEGORY_COLUMNS + ("status_code", "time_bucket")
+
+_TYPECODES = dict([(name, "d") for name in FLOAT_COLUMNS] + [(name, "q") for name in INT_COLUMNS] +
+                  [(name, "b") for name in BOOL_COLUMNS] + [(name, "i") for name in CATEGORY_COLUMNS])
+
+
+def nearest_rank(sorted_values: Sequence[float], p: float) -> float:
+    """已排序数据的最近秩分位数"""
+    return sorted_values[max(math.ceil(p * len(sorted_values)) - 1, 0)]
+
+
+class ResultStore:
+    """按列存储的请求结果，chunk_rows为每块的行数"""
+
+    def __init__(self, chunk_rows: int = 65536):
+        self.chunk_rows = chunk_rows
+        self.exceptions = 0  # 未被send_request捕获的异常数，不占行
+        self._rows = 0
+        self._chunks: Dict[str, List[array]] = {name: [] for name in _TYPECODES}
+        self._current: Dict[str, array] = {}
+        self._appenders: Dict[str, List[Tuple[str, Callable[[Any], None]]]] = {}  # 当前块各列的append方法
+        self._codes: Dict[str, Dict[Any, int]] = {name: {} for name in CATEGORY_COLUMNS}
+        self._categories: Dict[str, List[Any]] = {name: [] for name in CATEGORY_COLUMNS}
+        self._cache: Dict[str, Tuple[int, Any]] = {}  # 拼接后的整列，行数变化后失效
+        self._new_chunk()
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def _new_chunk(self):
+        """当前块写满后为每列开一个新块，已有的块不再移动"""
+        for name, typecode in _TYPECODES.items():
+            chunk = array(typecode)
+            self._chunks[name].append(chunk)
+            self._current[name] = chunk
+        for kind, names in (("float", FLOAT_COLUMNS), ("int", INT_COLUMNS), ("bool", BOOL_COLUMNS),
+                            ("category", CATEGORY_COLUMNS)):
+            self._appenders[kind] = [(name, self._current[name].append) for name in names]
+
+    def _encode(self, name: str, value: Any) -> int:
+        codes = self._codes[name]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(codes)
+            self._categories[name].append(value)
+        return code
+
+    def append(self, result: Dict[str, Any]):
+        """追加一条请求结果，逐token延迟、错误信息等变长字段不保存"""
+        if len(self._current["timestamp"]) >= self.chunk_rows:
+            self._new_chunk()
+        appenders = self._appenders
+        get = result.get
+        for name, append in appenders["float"]:
+            value = get(name)
+            append(math.nan if value is None else value)
+        for name, append in appenders["int"]:
+            append(get(name) or 0)
+        for name, append in appenders["bool"]:
+            append(1 if get(name) else 0)
+        for name, append in appenders["category"]:
+            value = get(name)
+            code = self._codes[name].get(value)
+            append(self._encode(name, value) if code is None else code)
+        self._rows += 1
+
+    def record_exception(self):
+        """记录一个未被send_request捕获的异常"""
+        self.exceptions += 1
+
+    def column(self, name: str):
+        """整列数据：安装了NumPy时为ndarray，否则为array"""
+        cached = self._cache.get(name)
+        if cached is not None and cached[0] == self._rows:
+            return cached[1]
+        chunks = [chunk for chunk in self._chunks[name] if chunk]
+        if np is not None:
+            typecode = _TYPECODES[name]
+            data = np.concatenate([np.frombuffer(chunk, dtype=typecode) for chunk in chunks]) if chunks else \
+                np.empty(0, dtype=typecode)
+        else:
+            data = array(_TYPECODES[name])
+            for chunk in chunks:
+                data.extend(chunk)
+        self._cache[name] = (self._rows, data)
+        return data
+
+    def categories(self, name: str) -> List[Any]:
+        """类别列中编号对应的取值"""
+        return list(self._categories[name])
+
+    def _group_keys(self, key: Optional[str], time_bucket: float) -> Tuple[Any, Callable[[Any], Any]]:
+        """每行的分组键及把键转换为报告中取值的函数"""
+        if key is None:
+            keys = np.zeros(self._rows, dtype=np.int64) if np is not None else [0] * self._rows
+            return keys, lambda k: None
+        if key in CATEGORY_COLUMNS:
+            categories = self._categories[key]
+            return self.column(key), lambda k: categories[int(k)]
+        if key == "status_code":
+            return self.column(key), int
+        if key == "time_bucket":
+            timestamps = self.column("timestamp")
+            if np is not None:
+                start = timestamps.min() if self._rows else 0.0
+                keys = np.floor((timestamps - start) / time_bucket).astype(np.int64)
+            else:
+                start = min(timestamps) if self._rows else 0.0
+                keys = [int((t - start) // time_bucket) for t in timestamps]
+            return keys, lambda k: int(k) * time_bucket
+        raise ValueError(f"未知的分组键: {key}，可选: {', '.join(GROUP_KEYS)}")
+
+    def group_by(self, key: Optional[str], metrics: Iterable[str] = ("response_time",),
+                 percentiles: Sequence[float] = (0.5, 0.9, 0.99), time_bucket: float = 10.0) -> List[Dict[str, Any]]:
+        """按key分组统计，key为None时不分组
+
+        每组返回{"key", "count", "success", "metrics": {指标: {"count", "mean", 分位数...}}}，按键排序；
+        与直方图一致，延迟类指标只统计成功且有值的请求，TRUNCATED_METRICS中的指标不含主动中断的请求；
+        分位数取最近秩，time_bucket分组的键为时间段的起点（秒）
+        """
+        if not self._rows:
+            return []
+        keys, decode = self._group_keys(key, time_bucket)
+        metrics = tuple(metrics)
+        if np is not None:
+            groups = self._group_by_numpy(keys, metrics, percentiles)
+        else:
+            groups = self._group_by_python(keys, metrics, percentiles)
+        for group in groups:
+            group["key"] = decode(group["key"])
+        # 类别取值可能混有None和不同类型，按字符串排序
+        groups.sort(key=lambda group: (group["key"] is None, group["key"] if key in ("status_code", "time_bucket")
+                                       else str(group["key"])))
+        return groups
+
+    def summary(self, metrics: Iterable[str] = ("response_time",),
+                percentiles: Sequence[float] = (0.5, 0.9, 0.99)) -> Optional[Dict[str, Any]]:
+        """全部请求的统计，没有请求时为None"""
+        groups = self.group_by(None, metrics, percentiles)
+        return groups[0] if groups else None
+
+    def _group_by_numpy(self, keys, metrics: Tuple[str, ...], percentiles: Sequence[float]) -> List[Dict[str, Any]]:
+        """向量化分组：np.unique得到组号，bincount计数求和，按(组号, 值)排序后从每组的起点按秩取分位数"""
+        unique, inverse = np.unique(keys, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        group_count = len(unique)
+        success = self.column("success").astype(bool)
+        counts = np.bincount(inverse, minlength=group_count)
+        successes = np.bincount(inverse, weights=success, minlength=group_count)
+
+        metric_stats = {}
+        for name in metrics:
+            values = self.column(name).astype(np.float64)
+            mask = success & ~np.isnan(values)
+            if name in TRUNCATED_METRICS:
+                mask &= self.column("aborted") == 0
+            group_ids = inverse[mask]
+            values = values[mask]
+            order = np.lexsort((values, group_ids))
+            group_ids, values = group_ids[order], values[order]
+            sizes = np.bincount(group_ids, minlength=group_count)
+            starts = np.cumsum(sizes) - sizes
+            sums = np.bincount(group_ids, weights=values, minlength=group_count)
+            ranks = {}
+            for p in percentiles:
+                index = starts + np.maximum(np.ceil(p * sizes).astype(np.int64) - 1, 0)
+                ranks[p] = values[np.minimum(index, len(values) - 1)] if len(values) else np.zeros(group_count)
+            metric_stats[name] = (sizes, sums, ranks)
+
+        groups = []
+        for i in range(group_count):
+            group = {"key": unique[i].item(), "count": int(counts[i]), "success": int(successes[i]), "metrics": {}}
+            for name, (sizes, sums, ranks) in metric_stats.items():
+                size = int(sizes[i])
+                entry = {"count": size, "mean": float(sums[i] / size) if size else None}
+                for p in percentiles:
+                    entry[p] = float(ranks[p][i]) if size else None
+                group["metrics"][name] = entry
+            groups.append(group)
+        return groups
+
+    def _group_by_python(self, keys, metrics: Tuple[str, ...], percentiles: Sequence[float]) -> List[Dict[str, Any]]:
+        """未安装NumPy时逐行分组"""
+        success = self.column("success")
+        aborted = self.column("aborted")
+        columns = [self.column(name) for name in metrics]
+        truncated = [name in TRUNCATED_METRICS for name in metrics]
+        groups: Dict[Any, Dict[str, Any]] = {}
+        for row, group_key in enumerate(keys):
+            group = groups.get(group_key)
+            if group is None:
+                group = groups[group_key] = {"key": group_key, "count": 0, "success": 0,
+                                             "values": [[] for _ in metrics]}
+            group["count"] += 1
+            if success[row]:
+                group["success"] += 1
+                for values, column, skip_aborted in zip(group["values"], columns, truncated):
+                    value = column[row]
+                    if value == value and not (skip_aborted and aborted[row]):  # 跳过NaN和被截断的值
+                        values.append(value)
+
+        for group in groups.values():
+            group["metrics"] = {}
+            for name, values in zip(metrics, group.pop("values")):
+                values.sort()
+                entry = {"count": len(values), "mean": sum(values) / len(values) if values else None}
+                for p in percentiles:
+                    entry[p] = float(nearest_rank(values, p)) if values else None
+                group["metrics"][name] = entry
+        return list(groups.values())
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+压测计划
+把运行模式及其参数描述为可序列化的字典，便于在多个进程或多台机器之间拆分、执行和汇总
+"""
+
+import asyncio
+import time
+from typing import List, Dict, Any, Optional
+from latency_histogram import LatencyHistogram
+from load_profiles import LoadProfile
+
+PLAN_MODES = ("burst", "open_loop", "profile", "replay", "sessions")
+
+
+def plan_from_config(config: Dict[str, Any]) -> Dict[str, Any]:
+    """从run_test.py风格的CONFIG中提取压测计划"""
+    mode = config.get("mode", "burst")
+    if mode not in PLAN_MODES:
+        raise ValueError(f"未知的压测模式: {mode}，可选: {', '.join(PLAN_MODES)}")
+
+    plan = {"mode": mode}
+    if mode == "burst":
+        plan["concurrent_requests"] = config["concurrent_requests"]
+    elif mode == "open_loop":
+        plan["arrival_rate"] = config["arrival_rate"]
+        plan["duration"] = config["duration"]
+        plan["distribution"] = config.get("arrival_distribution", "constant")
+        plan["seed"] = config.get("seed")
+    elif mode == "profile":
+        plan["load_profile"] = config["load_profile"]
+        plan["pacing"] = config.get("pacing")
+    elif mode == "sessions":
+        plan["users"] = config["session_users"]
+        plan["duration"] = config["duration"]
+        plan["turns"] = config.get("session_turns", 3)
+        plan["think_time"] = config.get("think_time", "constant:0")
+        plan["seed"] = config.get("seed")
+    else:
+        plan["trace_path"] = config["trace_path"]
+        plan["speed"] = config.get("replay_speed", 1.0)
+        plan["loops"] = config.get("replay_loops", 1)
+        plan["duration"] = config.get("replay_duration")
+    return plan
+
+
+def _split_count(total: int, parts: int, index: int) -> int:
+    """把total尽量平均地分成parts份，返回第index份"""
+    return total // parts + (1 if index < total % parts else 0)
+
+
+def split_plan(plan: Dict[str, Any], parts: int) -> List[Dict[str, Any]]:
+    """把压测计划拆分成parts份，每份承担总负载的一部分"""
+    if parts < 1:
+        raise ValueError("parts必须大于0")
+
+    shares = []
+    for index in range(parts):
+        share = dict(plan)
+        if plan["mode"] == "burst":
+            share["concurrent_requests"] = _split_count(plan["concurrent_requests"], parts, index)
+        elif plan["mode"] == "open_loop":
+            # 多个独立泊松过程叠加后仍是泊松过程，总速率保持不变；
+            # constant分布时第index份错开index/总速率秒，各份交错后仍为均匀间隔，而不是每个时刻同时发出parts个请求
+            share["arrival_rate"] = plan["arrival_rate"] / parts
+            if plan.get("distribution", "constant") == "constant":
+                share["start_offset"] = plan.get("start_offset", 0.0) + index / plan["arrival_rate"]
+            if plan.get("seed") is not None:
+                share["seed"] = plan["seed"] + index
+        elif plan["mode"] == "sessions":
+            share["users"] = _split_count(plan["users"], parts, index)
+            if plan.get("seed") is not None:
+                share["seed"] = plan["seed"] + index
+        elif plan["mode"] == "replay":
+            # 按行号轮流分配轨迹记录，每份按整份轨迹的起点计算时刻，保留原始时间线
+            share["shard_index"] = index
+            share["shard_count"] = parts
+        else:
+            profile = plan["load_profile"]
+            share["load_profile"] = {
+                "start_users": _split_count(profile.get("start_users", 0), parts, index),
+                "stages": [
+                    dict(stage, users=_split_count(stage["users"], parts, index))
+                    for stage in profile["stages"]
+                ]
+            }
+        shares.append(share)
+    return shares
+
+
+async def execute_plan(tester, plan: Dict[str, Any], report: bool = True) -> Dict[str, Any]:
+    """用给定的APIStressTester执行压测计划，返回可JSON序列化的运行摘要"""
+    mode = plan["mode"]
+    if mode == "burst":
+        summary = await tester.run_stress_test(plan["concurrent_requests"], report=report)
+    elif mode == "open_loop":
+        summary = await tester.run_open_loop_test(
+            arrival_rate=plan["arrival_rate"],
+            duration=plan["duration"],
+            distribution=plan.get("distribution", "constant"),
+            seed=plan.get("seed"),
+            start_offset=plan.get("start_offset", 0.0),
+            report=report
+        )
+        summary["send_lags"] = summary["send_lags"].to_dict()
+    elif mode == "replay":
+        summary = await tester.run_trace_replay(
+            plan["trace_path"],
+            speed=plan.get("speed", 1.0),
+            loops=plan.get("loops", 1),
+            duration=plan.get("duration"),
+            shard_index=plan.get("shard_index", 0),
+            shard_count=plan.get("shard_count", 1),
+            report=report
+        )
+        summary["send_lags"] = summary["send_lags"].to_dict()
+    elif mode == "sessions":
+        summary = await tester.run_sessions(
+            plan["users"],
+            plan["duration"],
+            turns=plan.get("turns", 3),
+            think_time=plan.get("think_time", "constant:0"),
+            seed=plan.get("seed"),
+            report=report
+        )
+    else:
+        summary = await tester.run_load_profile(LoadProfile.from_config(plan["load_profile"]),
+                                                pacing=plan.get("pacing"), report=report)
+    tester.last_summary = summary
+    return summary
+
+
+async def execute_plan_at(tester, plan: Dict[str, Any], start_at: float) -> Dict[str, Any]:
+    """等到约定的Unix时刻后静默执行压测计划，用于多进程或多机同时开始"""
+    delay = start_at - time.time()
+    if delay > 0:
+        await asyncio.sleep(delay)
+    return await execute_plan(tester, plan, report=False)
+
+
+def merge_summaries(summaries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """合并多份运行摘要：耗时取最大值，计数相加，直方图合并"""
+    merged: Dict[str, Any] = {"total_time": max(s["total_time"] for s in summaries)}
+    for summary in summaries:
+        for key in ("issued", "dropped", "sessions", "sessions_completed", "sessions_failed"):
+            if key in summary:
+                merged[key] = merged.get(key, 0) + summary[key]
+        for key in ("loops", "replay_span"):
+            if key in summary:
+                merged[key] = max(merged.get(key, 0), summary[key])
+        if "send_lags" in summary:
+            lags = LatencyHistogram.from_dict(summary["send_lags"])
+            if "send_lags" in merged:
+                merged["send_lags"].merge(lags)
+            else:
+                merged["send_lags"] = lags
+    return merged
+
+
+def merge_question_stats(target: Dict[str, int], other: Dict[str, int]):
+    """把问题类型计数累加到target中"""
+    for category, count in other.items():
+        target[category] = target.get(category, 0) + count
+
+
+def print_plan_report(tester, plan: Dict[str, Any], summary: Dict[str, Any], title: Optional[str] = None):
+    """用tester当前的统计打印完整报告（用于打印合并后的结果）"""
+    if title:
+        print(f"\n{title}")
+    tester.print_results(summary["total_time"])
+    if plan["mode"] == "open_loop":
+        tester.print_arrival_stats(
+            plan["arrival_rate"], plan["duration"], summary["issued"], summary["dropped"], summary["send_lags"]
+        )
+    elif plan["mode"] == "profile":
+        tester.print_stage_stats(LoadProfile.from_config(plan["load_profile"]))
+    elif plan["mode"] == "sessions":
+        tester.print_session_stats(summary["sessions"], summary["sessions_completed"], summary["sessions_failed"])
+    elif plan["mode"] == "replay":
+        tester.print_replay_stats(
+            plan.get("speed", 1.0), summary["issued"], summary["loops"], summary["replay_span"], summary["send_lags"]
+        )
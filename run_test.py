@@ -4,9 +4,14 @@
 用户可以在这里快速修改参数
 """
 
-import asyncio
+import sys
+
 from api_stress_test import APIStressTester
+from baseline import baseline_path, make_run, save_baseline, load_baseline, compare_runs, print_comparison
+from run_plan import plan_from_config, execute_plan
+from multiprocess_runner import run_multiprocess
 from question_bank import question_bank
+from loop_monitor import run_event_loop
 
 # 压测配置参数
 CONFIG = {
@@ -27,48 +32,285 @@ CONFIG = {
         "query": "What are the specs of the iPhone 13 Pro Max?",
         "response_mode": "streaming",
         "conversation_id": "",
-        "user": "abc-123",
-        "files": [
-            {
-                "type": "image",
-                "transfer_method": "remote_url",
-                "url": "https://cloud.dify.ai/logo/logo-site.png"
-            }
-        ]
+        "user": "abc-123"
     },
     
-    # 并发数
+    # 附件：压测开始前把这些本地文件（图片、文档等）经Dify文件上传接口各上传一次，请求以local_file方式轮换引用，
+    # 每个请求附带attachments_per_request个，attachment_ratio为附带附件的请求比例（小于1时报告中对比带与不带附件的延迟）；
+    # 不要在payload中用remote_url引用文件，否则后端每个请求都要重新下载一次，测得的延迟中会混入下载耗时
+    # 例如 ["images/iphone.png", "docs/spec.pdf"]，None表示不附带附件
+    "upload_files": None,
+    "attachments_per_request": 1,
+    "attachment_ratio": 0.5,
+    
+    # 接口协议："dify-chat"（/v1/chat-messages）、"dify-completion"（/v1/completion-messages）、
+    # "dify-workflow"（/v1/workflows/run）、"openai-chat"（OpenAI兼容的/v1/chat/completions）
+    "protocol": "dify-chat",
+    
+    # 协议适配器参数，例如{"input_field": "content"}（问题填入inputs中的变量名）或{"system_prompt": "..."}（openai-chat）
+    "protocol_options": None,
+    
+    # 多后端对比：列表中每一项可覆盖url、headers、payload、protocol、protocol_options并指定name，
+    # 请求在各后端之间轮流交替发送，报告中按后端分组对比；None表示只压测上面的url
+    # 例如同时压测Dify应用和其背后的模型服务：
+    # "backends": [
+    #     {"name": "dify"},
+    #     {"name": "vllm", "url": "http://10.68.186.131:8000/v1/chat/completions", "protocol": "openai-chat",
+    #      "headers": {"Authorization": "Bearer EMPTY"}, "payload": {"model": "qwen2.5-7b", "stream": True}}
+    # ],
+    "backends": None,
+    
+    # 压测模式："burst"=一次性并发发出concurrent_requests个请求，"open_loop"=按目标速率持续发送，
+    # "profile"=按load_profile分阶段调整在途请求数，"replay"=按trace_path中记录的时间回放生产流量，
+    # "sessions"=多轮会话虚拟用户（持续duration秒）
+    "mode": "burst",
+    
+    # 并发数（burst模式）
     "concurrent_requests": 150,
     
+    # 开环模式参数：目标速率（请求/秒）、持续时间（秒）、到达分布（"constant"或"poisson"）
+    "arrival_rate": 20,
+    "duration": 600,
+    "arrival_distribution": "poisson",
+    
+    # 分阶段负载曲线（profile模式）：每个阶段在duration秒内线性爬坡到users个用户，ramp=False表示直接跳变
+    "load_profile": {
+        "start_users": 10,
+        "stages": [
+            {"duration": 300, "users": 300},
+            {"duration": 300, "users": 300},
+            {"duration": 120, "users": 50, "ramp": False}
+        ]
+    },
+    
+    # profile模式下每个用户的计划请求间隔（秒）：服务变慢时请求不再按计划发出，滞后部分计入协调遗漏校正后的延迟；
+    # None表示每个用户背靠背发送请求（此时无计划可依，校正值与原始值相同）
+    "pacing": None,
+    
+    # 多轮会话参数（sessions模式）：虚拟用户数（每个用户使用不同的user值），每个会话的轮数（整数或[最少, 最多]），
+    # 两轮之间的思考时间分布（constant:秒、uniform:最小,最大、lognormal:中位数,sigma、exponential:均值）
+    "session_users": 50,
+    "session_turns": [2, 5],
+    "think_time": "lognormal:5,0.5",
+    
+    # 流量回放参数（replay模式）：JSONL轨迹文件（每行含timestamp、query、user、conversation_id），
+    # 回放倍速（2=两倍速），回放遍数（0=循环直到replay_duration秒），最长回放时间（None=不限制）
+    "trace_path": "trace.jsonl",
+    "replay_speed": 1.0,
+    "replay_loops": 1,
+    "replay_duration": None,
+    
+    # 容量搜索参数（python capacity_search.py）：按并发数("concurrency")或到达速率("rate")，
+    # 逐步("step")或二分("binary")搜索满足SLO（P95 TTFT、错误率）的最大负载；每次试验先预热warmup秒再测量trial_duration秒
+    "capacity_search": {
+        "dimension": "concurrency",
+        "strategy": "binary",
+        "start": 10,
+        "max_load": 500,
+        "step": None,          # 固定步长，None表示每次乘以growth
+        "growth": 1.5,
+        "warmup": 15,
+        "trial_duration": 60,
+        "ttft_p95": 2.0,
+        "error_rate": 0.01,
+        "response_time_p95": None,
+        "output": "capacity_search.json"
+    },
+    
     # 是否使用随机问题（True=使用随机问题，False=使用固定问题）
-    "use_random_questions": True
+    "use_random_questions": True,
+    
+    # 外部JSONL问题语料路径（每行形如{"query": "...", "category": "..."}），None表示使用内置问题库
+    "corpus_path": None,
+    
+    # 合成问题（设置后代替内置问题库，外部语料优先）：length为输入长度（字符）分布，如"constant:2000"、"uniform:500,4000"、
+    # "lognormal:1500,0.6"；shared_prefix_ratio为每个问题开头取自共享系统提示的比例（用于测试前缀缓存）；
+    # pool_size为预先生成的问题数量；None表示不使用
+    "synthetic_prompts": None,
+    # "synthetic_prompts": {"length": "lognormal:1500,0.6", "shared_prefix_ratio": 0.5, "pool_size": 1024, "seed": 1},
+    
+    # 各问题类别的抽样权重（按生产流量比例填写），None表示各类别等概率
+    "category_weights": None,
+    
+    # 问题抽样随机种子，设置后每次运行的问题序列相同；None表示每次随机
+    "question_seed": None,
+    
+    # 是否在内存中按列保留每个请求的结果，用于按问题类别、状态码、阶段和时间段细分报告（长时间压测建议设为False，统计只依赖直方图）
+    "keep_results": True,
+    
+    # 按时间段细分报告时每段的秒数
+    "time_bucket": 10.0,
+    
+    # 逐请求结果日志路径（JSONL，以.gz结尾时压缩），None表示不写；多进程模式下每个进程写一个带编号的文件
+    # 事后可用 python result_log.py <日志文件> 离线重新生成报告
+    "result_log_path": None,
+    
+    # 实时指标：每隔live_interval秒在控制台打印最近live_window秒的吞吐、在途数、错误率和延迟/TTFT分位数，None表示不打印，例如5
+    "live_interval": None,
+    "live_window": 30,
+    
+    # Prometheus指标端口，设置后可从 http://<本机>:<端口>/metrics 抓取实时指标，None表示不启动
+    "metrics_port": None,
+    
+    # HTTP分阶段计时：记录DNS解析、等待连接池、新建连接(TCP+TLS)、请求发送、首字节等阶段耗时和连接复用率
+    "http_tracing": True,
+    
+    # 计时开始前预先建立的连接数（向目标地址并发发送HEAD请求），0表示不预热，首批请求的延迟中会包含建连耗时
+    "warmup_connections": 0,
+    
+    # 分阶段超时（秒，None表示不限）：timeout为整个请求，connect_timeout为新建连接（TCP+TLS），
+    # ttft_timeout为发出请求到第一段输出（blocking模式为收到响应头），idle_timeout为第一段输出后相邻两块数据的最长间隔；
+    # 报告中按失败原因（连接超时、首字超时、输出间隔超时、总耗时超时、HTTP错误、连接错误等）分别统计
+    "timeout": 60,
+    "connect_timeout": None,
+    "ttft_timeout": None,
+    "idle_timeout": None,
+    
+    # 主动中断流式输出：收到abort_after_chunks块输出后中断（None表示不中断），abort_ratio为参与中断的请求比例；
+    # abort_mode="close"直接断开连接（模拟只关心首字的流量），"stop"调用Dify的停止生成接口（task_id取自流式事件）
+    # 并继续读到流结束，报告中给出从调用停止接口到流结束的耗时，用于观察大量取消时后端多快释放资源
+    "abort_after_chunks": None,
+    "abort_mode": "close",
+    "abort_ratio": 1.0,
+    
+    # 事件循环实现："asyncio"（标准库）或"uvloop"（需pip install uvloop，单核可驱动更高的负载，未安装时回退到asyncio）
+    "loop_backend": "asyncio",
+    
+    # 客户端事件循环调度延迟P99的告警阈值（秒），超过时报告中提示客户端自身已饱和、测得的延迟可能偏高；None表示不提示
+    "loop_lag_threshold": 0.05,
+    
+    # 基线：baseline_name设置后把本轮结果保存为baseline_dir下的命名基线（同名覆盖）；
+    # compare_baseline设置后与该基线逐指标、逐问题类别比较，分位数向变差方向的变化超过regression_threshold
+    # 且统计显著时判定为回退，脚本以非零状态退出（可用于定时压测的性能门禁）
+    "baseline_dir": "baselines",
+    "baseline_name": None,
+    "compare_baseline": None,
+    "regression_threshold": 0.10,
+    
+    # 显著性判定方法："bootstrap"（分位数之差的自助法置信区间）或"ranksum"（秩和检验），以及置信度
+    "regression_method": "bootstrap",
+    "regression_confidence": 0.95,
+    
+    # 直方图有效数字位数（2=约1%相对误差，3=约0.1%）
+    "histogram_precision": 2,
+    
+    # 工作进程数：1=单进程；大于1时每个进程分担一部分速率或并发数；0=每个CPU核心一个进程
+    "processes": 1
 }
 
-async def main():
-    """主函数"""
+def print_banner():
+    """打印压测配置概要"""
     print("🔥 API压测工具 - 大模型版")
     print("=" * 50)
-    print(f"📡 目标API: {CONFIG['url']}")
-    print(f"🚀 并发数: {CONFIG['concurrent_requests']}")
+    if CONFIG["backends"]:
+        for backend in CONFIG["backends"]:
+            print(f"📡 目标API [{backend.get('name', '')}]: {backend.get('url', CONFIG['url'])} "
+                  f"({backend.get('protocol', CONFIG['protocol'])})")
+    else:
+        print(f"📡 目标API: {CONFIG['url']} ({CONFIG['protocol']})")
+    if CONFIG["mode"] == "profile":
+        print(f"🪜 分阶段负载: 起始{CONFIG['load_profile']['start_users']}用户，共{len(CONFIG['load_profile']['stages'])}个阶段")
+    elif CONFIG["mode"] == "open_loop":
+        print(f"📈 目标速率: {CONFIG['arrival_rate']}请求/秒 ({CONFIG['arrival_distribution']})，持续{CONFIG['duration']}秒")
+    elif CONFIG["mode"] == "sessions":
+        print(f"💬 多轮会话: {CONFIG['session_users']}个虚拟用户，每会话{CONFIG['session_turns']}轮，思考时间{CONFIG['think_time']}")
+    elif CONFIG["mode"] == "replay":
+        print(f"🎞️  流量回放: {CONFIG['trace_path']}，倍速{CONFIG['replay_speed']}x")
+    else:
+        print(f"🚀 并发数: {CONFIG['concurrent_requests']}")
     print(f"🎯 使用随机问题: {'是' if CONFIG['use_random_questions'] else '否'}")
+    if CONFIG["upload_files"]:
+        print(f"📎 附件: {len(CONFIG['upload_files'])}个文件预先上传，{CONFIG['attachment_ratio']*100:.0f}%的请求"
+              f"各附带{CONFIG['attachments_per_request']}个")
+    if CONFIG["loop_backend"] != "asyncio":
+        print(f"🔁 事件循环: {CONFIG['loop_backend']}")
+    if CONFIG["abort_after_chunks"]:
+        print(f"✂️  主动中断: {CONFIG['abort_ratio']*100:.0f}%的请求在收到{CONFIG['abort_after_chunks']}块输出后"
+              f"{'调用停止生成接口' if CONFIG['abort_mode'] == 'stop' else '断开连接'}")
     
-    if CONFIG['use_random_questions']:
+    if CONFIG['corpus_path']:
+        # 首次加载时建立索引，多进程模式下各工作进程直接复用
+        corpus = question_bank.load_corpus(CONFIG['corpus_path'])
+        print(f"📚 外部语料: {CONFIG['corpus_path']}，{len(corpus)}个问题")
+        print(f"📋 问题类别: {', '.join(corpus.categories)}")
+    elif CONFIG['synthetic_prompts']:
+        synthetic = CONFIG['synthetic_prompts']
+        print(f"🧬 合成问题: 长度分布{synthetic.get('length', 'lognormal:1000,0.5')}，"
+              f"共享前缀比例{synthetic.get('shared_prefix_ratio', 0.0)}")
+    elif CONFIG['use_random_questions']:
         print(f"📊 问题库统计: {question_bank.get_total_questions_count()}个问题")
         print(f"📋 问题类别: {', '.join(question_bank.get_all_categories())}")
     
     print()
-    
+
+def build_tester_kwargs():
+    """APIStressTester的构造参数"""
+    return {
+        "url": CONFIG["url"],
+        "headers": CONFIG["headers"],
+        "payload": CONFIG["payload"],
+        "use_random_questions": CONFIG["use_random_questions"],
+        "keep_results": CONFIG["keep_results"],
+        "histogram_precision": CONFIG["histogram_precision"],
+        "question_seed": CONFIG["question_seed"],
+        "category_weights": CONFIG["category_weights"],
+        "corpus_path": CONFIG["corpus_path"],
+        "result_log_path": CONFIG["result_log_path"],
+        "live_interval": CONFIG["live_interval"],
+        "live_window": CONFIG["live_window"],
+        "metrics_port": CONFIG["metrics_port"],
+        "synthetic_prompts": CONFIG["synthetic_prompts"],
+        "http_tracing": CONFIG["http_tracing"],
+        "warmup_connections": CONFIG["warmup_connections"],
+        "loop_lag_threshold": CONFIG["loop_lag_threshold"],
+        "protocol": CONFIG["protocol"],
+        "protocol_options": CONFIG["protocol_options"],
+        "backends": CONFIG["backends"],
+        "timeout": CONFIG["timeout"],
+        "connect_timeout": CONFIG["connect_timeout"],
+        "ttft_timeout": CONFIG["ttft_timeout"],
+        "idle_timeout": CONFIG["idle_timeout"],
+        "abort_after_chunks": CONFIG["abort_after_chunks"],
+        "abort_mode": CONFIG["abort_mode"],
+        "abort_ratio": CONFIG["abort_ratio"],
+        "time_bucket": CONFIG["time_bucket"],
+        "upload_files": CONFIG["upload_files"],
+        "attachments_per_request": CONFIG["attachments_per_request"],
+        "attachment_ratio": CONFIG["attachment_ratio"]
+    }
+
+def check_baseline(tester: APIStressTester) -> int:
+    """按配置保存基线并与指定基线比较，返回进程退出码（有回退时为1）"""
+    run = make_run(tester.stats, tester.question_stats, tester.last_summary, CONFIG["baseline_name"] or "当前",
+                   {"plan": plan_from_config(CONFIG), "url": CONFIG["url"], "protocol": CONFIG["protocol"]})
+    if CONFIG["baseline_name"]:
+        path = save_baseline(baseline_path(CONFIG["baseline_name"], CONFIG["baseline_dir"]), run)
+        print(f"\n💾 已保存基线 {CONFIG['baseline_name']}: {path}")
+    if not CONFIG["compare_baseline"]:
+        return 0
+    baseline = load_baseline(baseline_path(CONFIG["compare_baseline"], CONFIG["baseline_dir"]))
+    rows = compare_runs(baseline, run, CONFIG["regression_threshold"], CONFIG["regression_confidence"],
+                        CONFIG["regression_method"])
+    regressions = print_comparison(baseline, run, rows, CONFIG["regression_threshold"],
+                                   CONFIG["regression_confidence"], CONFIG["regression_method"])
+    return 1 if regressions else 0
+
+async def main() -> APIStressTester:
+    """主函数"""
     # 创建压测实例
-    tester = APIStressTester(
-        url=CONFIG["url"],
-        headers=CONFIG["headers"],
-        payload=CONFIG["payload"],
-        use_random_questions=CONFIG["use_random_questions"]
-    )
+    tester = APIStressTester(**build_tester_kwargs())
     
     # 运行压测
-    await tester.run_stress_test(concurrent_requests=CONFIG["concurrent_requests"])
+    await execute_plan(tester, plan_from_config(CONFIG))
+    return tester
 
 if __name__ == "__main__":
+    print_banner()
+    
     # 运行压测
-    asyncio.run(main()) 
\ No newline at end of file
+    if CONFIG["processes"] == 1:
+        tester = run_event_loop(main(), CONFIG["loop_backend"])
+    else:
+        tester = run_multiprocess(build_tester_kwargs(), plan_from_config(CONFIG), CONFIG["processes"] or None,
+                                  CONFIG["loop_backend"])
+    sys.exit(check_baseline(tester))
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+压测工具自身的基准测试
+让APIStressTester对零延迟的本地模拟服务施压，在不同并发数、请求体大小和流式输出长度下
+测量客户端能达到的最大RPS、每个请求消耗的CPU时间、每个在途请求的内存占用以及事件循环延迟，
+结果写入JSON文件，便于发现工具自身的性能回退
+
+用法：
+    python self_benchmark.py --output self_benchmark.json
+    python self_benchmark.py --output new.json --compare old.json --tolerance 0.15
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+from typing import Dict, Any, List, Optional
+
+import aiohttp
+
+from api_stress_test import APIStressTester
+from load_profiles import LoadProfile, Stage
+from loop_monitor import LOOP_BACKENDS, run_event_loop
+from mock_server import MockDifyServer, MockConfig
+
+# 默认场景：每次只改变一个因素，其余因素取基准值
+BASE_CONCURRENCY = 50
+BASE_PAYLOAD_BYTES = 256
+BASE_STREAM_TOKENS = 50
+CONCURRENCY_LEVELS = [1, 10, 50, 100, 200]
+PAYLOAD_SIZES = [256, 4096, 65536]
+STREAM_LENGTHS = [1, 50, 500]
+
+
+def default_scenarios() -> List[Dict[str, int]]:
+    """生成默认的基准场景列表"""
+    scenarios = []
+    for concurrency in CONCURRENCY_LEVELS:
+        scenarios.append({"concurrency": concurrency, "payload_bytes": BASE_PAYLOAD_BYTES,
+                          "stream_tokens": BASE_STREAM_TOKENS})
+    for payload_bytes in PAYLOAD_SIZES:
+        scenarios.append({"concurrency": BASE_CONCURRENCY, "payload_bytes": payload_bytes,
+                          "stream_tokens": BASE_STREAM_TOKENS})
+    for stream_tokens in STREAM_LENGTHS:
+        scenarios.append({"concurrency": BASE_CONCURRENCY, "payload_bytes": BASE_PAYLOAD_BYTES,
+                          "stream_tokens": stream_tokens})
+
+    # 去掉重复的基准组合
+    unique = []
+    for scenario in scenarios:
+        if scenario not in unique:
+            unique.append(scenario)
+    return unique
+
+
+def current_rss() -> Optional[int]:
+    """当前进程的常驻内存（字节），仅Linux可用"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _mock_process_main(stream_tokens: int, port_queue):
+    """在独立进程中运行零延迟模拟服务，避免与被测客户端争抢CPU"""
+    async def serve():
+        config = MockConfig(ttft="constant:0", token_delay="constant:0",
+                            min_tokens=stream_tokens, max_tokens=stream_tokens, ping_interval=0)
+        async with MockDifyServer(config, port=0) as server:
+            port_queue.put(server.port)
+            while True:
+                await asyncio.sleep(3600)
+    asyncio.run(serve())
+
+
+async def _sample_peak_rss(state: Dict[str, Any], interval: float = 0.05):
+    """运行期间定期采样内存，记录峰值"""
+    while True:
+        rss = current_rss()
+        if rss is not None and rss > state["peak_rss"]:
+            state["peak_rss"] = rss
+        await asyncio.sleep(interval)
+
+
+async def measure_scenario(url: str, scenario: Dict[str, int], duration: float) -> Dict[str, Any]:
+    """以闭环方式保持scenario["concurrency"]个在途请求，测量客户端自身的开销"""
+    payload = {
+        "inputs": {},
+        "query": "x" * scenario["payload_bytes"],
+        "response_mode": "streaming",
+        "conversation_id": "",
+        "user": "self-benchmark"
+    }
+    tester = APIStressTester(url, {"Content-Type": "application/json"}, payload,
+                             use_random_questions=False, keep_results=False)
+    profile = LoadProfile([Stage(duration, scenario["concurrency"], ramp=False)],
+                          start_users=scenario["concurrency"])
+
+    baseline_rss = current_rss()
+    memory = {"peak_rss": baseline_rss or 0}
+    sampler = asyncio.create_task(_sample_peak_rss(memory))
+    cpu_start = time.process_time()
+
+    summary = await tester.run_load_profile(profile, tick=0.05, report=False)
+
+    cpu_time = time.process_time() - cpu_start
+    sampler.cancel()
+
+    stats = tester.stats
+    requests = stats.total
+    response_times = stats.histogram("response_time")
+    lags = stats.histogram("loop_lag")  # 由tester在压测期间采样
+    memory_per_request = None
+    if baseline_rss is not None and scenario["concurrency"]:
+        memory_per_request = max(memory["peak_rss"] - baseline_rss, 0) / scenario["concurrency"]
+
+    return dict(
+        scenario,
+        duration=summary["total_time"],
+        requests=requests,
+        errors=stats.failed + stats.exceptions,
+        rps=requests / summary["total_time"] if summary["total_time"] else 0.0,
+        cpu_ms_per_request=cpu_time / requests * 1000 if requests else None,
+        memory_kb_per_inflight=memory_per_request / 1024 if memory_per_request is not None else None,
+        loop_lag_p50_ms=lags.percentile(0.5) * 1000,
+        loop_lag_p99_ms=lags.percentile(0.99) * 1000,
+        loop_lag_max_ms=(lags.max or 0.0) * 1000,
+        latency_p50_ms=response_times.percentile(0.5) * 1000,
+        latency_p99_ms=response_times.percentile(0.99) * 1000
+    )
+
+
+def run_scenario(scenario: Dict[str, int], duration: float, loop_backend: str = "asyncio") -> Dict[str, Any]:
+    """启动独立的模拟服务进程并执行一个场景"""
+    context = multiprocessing.get_context("spawn")
+    port_queue = context.Queue()
+    server = context.Process(target=_mock_process_main, args=(scenario["stream_tokens"], port_queue), daemon=True)
+    server.start()
+    try:
+        port = port_queue.get(timeout=30)
+        url = f"http://127.0.0.1:{port}/v1/chat-messages"
+        return run_event_loop(measure_scenario(url, scenario, duration), loop_backend)
+    finally:
+        server.terminate()
+        server.join()
+
+
+def environment_info() -> Dict[str, Any]:
+    """记录运行环境，便于比较不同机器上的结果"""
+    return {
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "aiohttp": aiohttp.__version__,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")
+    }
+
+
+def print_scenario(result: Dict[str, Any]):
+    """打印单个场景的结果"""
+    cpu = f"{result['cpu_ms_per_request']:.3f}" if result['cpu_ms_per_request'] is not None else "-"
+    memory = f"{result['memory_kb_per_inflight']:.1f}" if result['memory_kb_per_inflight'] is not None else "-"
+    print(f"并发 {result['concurrency']:>4} | 请求体 {result['payload_bytes']:>6}B | 输出 {result['stream_tokens']:>4}token | "
+          f"RPS {result['rps']:>8.1f} | CPU {cpu}ms/请求 | 内存 {memory}KB/在途 | "
+          f"循环延迟P99 {result['loop_lag_p99_ms']:.2f}ms | 错误 {result['errors']}")
+
+
+def scenario_key(result: Dict[str, Any]) -> tuple:
+    """用于在两次结果之间匹配场景"""
+    return result["concurrency"], result["payload_bytes"], result["stream_tokens"]
+
+
+def compare_results(current: List[Dict[str, Any]], previous: List[Dict[str, Any]], tolerance: float) -> List[str]:
+    """与之前的结果比较，返回回退描述列表"""
+    previous_by_key = {scenario_key(r): r for r in previous}
+    regressions = []
+    for result in current:
+        old = previous_by_key.get(scenario_key(result))
+        if old is None:
+            continue
+        label = f"并发{result['concurrency']}/请求体{result['payload_bytes']}B/输出{result['stream_tokens']}token"
+        if old["rps"] and result["rps"] < old["rps"] * (1 - tolerance):
+            regressions.append(f"{label}: RPS {old['rps']:.1f} → {result['rps']:.1f}")
+        if old["cpu_ms_per_request"] and result["cpu_ms_per_request"] and \
+                result["cpu_ms_per_request"] > old["cpu_ms_per_request"] * (1 + tolerance):
+            regressions.append(f"{label}: CPU {old['cpu_ms_per_request']:.3f} → "
+                               f"{result['cpu_ms_per_request']:.3f}ms/请求")
+    return regressions
+
+
+def main() -> int:
+    """命令行入口，有性能回退时返回非零"""
+    parser = argparse.ArgumentParser(description="压测工具自身的基准测试")
+    parser.add_argument("--duration", type=float, default=5.0, help="每个场景的持续时间（秒）")
+    parser.add_argument("--output", default="self_benchmark.json", help="结果输出文件")
+    parser.add_argument("--concurrency", type=int, nargs="*", help="只测这些并发数（其余因素取基准值）")
+    parser.add_argument("--compare", default=None, help="与之前的结果文件比较")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="允许的相对回退幅度")
+    parser.add_argument("--loop", choices=LOOP_BACKENDS, default="asyncio", help="压测客户端使用的事件循环实现")
+    args = parser.parse_args()
+
+    scenarios = default_scenarios()
+    if args.concurrency:
+        scenarios = [{"concurrency": c, "payload_bytes": BASE_PAYLOAD_BYTES, "stream_tokens": BASE_STREAM_TOKENS}
+                     for c in args.concurrency]
+
+    print("🏎️  压测工具自身基准测试")
+    print("=" * 50)
+    print(f"共{len(scenarios)}个场景，每个{args.duration}秒，事件循环: {args.loop}")
+    print("-" * 50)
+
+    results = []
+    for scenario in scenarios:
+        result = run_scenario(scenario, args.duration, args.loop)
+        print_scenario(result)
+        results.append(result)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"environment": dict(environment_info(), loop=args.loop), "duration": args.duration,
+                   "results": results},
+                  f, ensure_ascii=False, indent=2)
+    print(f"\n💾 结果已写入 {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)["results"]
+        regressions = compare_results(results, previous, args.tolerance)
+        if regressions:
+            print(f"\n❌ 发现{len(regressions)}处性能回退 (容差 {args.tolerance*100:.0f}%):")
+            for line in regressions:
+                print(f"   {line}")
+            return 1
+        print(f"\n✅ 与 {args.compare} 相比没有超过容差的回退")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+SSE流式响应解析器
+按字节块增量解析Dify streaming模式返回的事件流
+"""
+
+import json
+from typing import List, Dict, Any, Optional
+
+
+class SSEParser:
+    """增量SSE解析器"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._event_type: Optional[str] = None
+        self._data_lines: List[str] = []
+
+    def feed(self, chunk: bytes) -> List[Dict[str, Any]]:
+        """喂入新到达的字节块，返回其中已完整的事件"""
+        self._buffer.extend(chunk)
+        events = []
+        start = 0
+        while True:
+            end = self._buffer.find(b"\n", start)
+            if end < 0:
+                break
+            line = bytes(self._buffer[start:end])
+            start = end + 1
+            if line.endswith(b"\r"):
+                line = line[:-1]
+            event = self._process_line(line)
+            if event is not None:
+                events.append(event)
+        if start:
+            del self._buffer[:start]
+        return events
+
+    def close(self) -> List[Dict[str, Any]]:
+        """流结束时，输出缓冲区中剩余的事件"""
+        events = []
+        if self._buffer:
+            event = self._process_line(bytes(self._buffer).rstrip(b"\r"))
+            self._buffer.clear()
+            if event is not None:
+                events.append(event)
+        event = self._dispatch()
+        if event is not None:
+            events.append(event)
+        return events
+
+    def _process_line(self, line: bytes) -> Optional[Dict[str, Any]]:
+        """处理单行，遇到空行时分发事件"""
+        if not line:
+            return self._dispatch()
+        if line.startswith(b":"):
+            return None
+
+        field, _, value = line.partition(b":")
+        if value.startswith(b" "):
+            value = value[1:]
+
+        if field == b"data":
+            self._data_lines.append(value.decode("utf-8", errors="replace"))
+        elif field == b"event":
+            self._event_type = value.decode("utf-8", errors="replace")
+        return None
+
+    def _dispatch(self) -> Optional[Dict[str, Any]]:
+        """把累积的字段组装成一个事件"""
+        event_type = self._event_type
+        data_lines = self._data_lines
+        self._event_type = None
+        self._data_lines = []
+
+        if event_type is None and not data_lines:
+            return None
+
+        raw = "\n".join(data_lines)
+        data: Any = raw
+        if raw:
+            try:
+                data = json.loads(raw)
+            except ValueError:
+                pass
+
+        # Dify把事件类型放在data的JSON里，ping等事件则使用SSE的event字段
+        if isinstance(data, dict) and data.get("event"):
+            event_type = data["event"]
+
+        return {
+            "event": event_type or "message",
+            "data": data
+        }
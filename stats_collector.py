@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+压测统计汇总
+请求完成时即把结果计入直方图和计数器，内存占用不随请求数增长
+"""
+
+from typing import Dict, Any, Iterable, Optional
+from latency_histogram import LatencyHistogram
+from http_timing import PHASE_FIELDS
+
+# 各指标的直方图量程: (最小可分辨值, 最大值)
+METRIC_RANGES = {
+    "response_time": (1e-4, 3600.0),
+    "header_time": (1e-4, 3600.0),
+    "ttft": (1e-4, 3600.0),
+    "inter_token_latency": (1e-5, 600.0),
+    "generation_time": (1e-4, 3600.0),
+    "chunk_count": (1.0, 1e6),
+    "output_tokens": (1.0, 1e6),
+    "tokens_per_second": (1e-2, 1e6),
+    "response_size": (1.0, 1e10),
+    "dns_time": (1e-6, 3600.0),
+    "pool_wait_time": (1e-6, 3600.0),
+    "connect_time": (1e-6, 3600.0),
+    "send_time": (1e-6, 3600.0),
+    "wait_time": (1e-4, 3600.0),
+    "first_byte_time": (1e-4, 3600.0),
+    "loop_lag": (1e-6, 600.0),
+    "send_delay": (1e-6, 3600.0),
+    "corrected_response_time": (1e-4, 3600.0),
+    "corrected_ttft": (1e-4, 3600.0),
+    "stop_latency": (1e-4, 3600.0),
+}
+# 主动中断（abort_after_chunks）的请求输出被截断，这些指标不计入统计；首字延迟和已收到部分的字间延迟不受影响
+TRUNCATED_METRICS = ("response_time", "response_size", "generation_time", "chunk_count", "output_tokens",
+                     "tokens_per_second", "corrected_response_time")
+
+
+class StatsCollector:
+    """可合并的压测统计：计数器 + 每个指标一个定长直方图，可按结果字段分组"""
+
+    def __init__(self, significant_digits: int = 2, group_fields: Iterable[str] = ()):
+        self.significant_digits = significant_digits
+        self.group_fields = tuple(group_fields)
+
+        self.total = 0
+        self.success = 0
+        self.failed = 0
+        self.exceptions = 0
+        self.status_codes: Dict[int, int] = {}  # 失败请求的状态码分布
+        self.failure_types: Dict[str, int] = {}  # 失败请求的失败类型分布
+        self.aborted = 0       # 按abort_after_chunks主动中断的请求数
+        self.stop_failed = 0   # 调用停止生成接口失败的次数
+        self.connections_reused = 0  # 复用连接池中已有连接的请求数
+        self.connections_new = 0     # 新建连接的请求数
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        # 分组统计: {字段名: {字段值: StatsCollector}}
+        self.groups: Dict[str, Dict[Any, "StatsCollector"]] = {field: {} for field in self.group_fields}
+
+    def histogram(self, name: str) -> LatencyHistogram:
+        """获取（必要时创建）指定指标的直方图"""
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            lowest, highest = METRIC_RANGES.get(name, (1e-4, 3600.0))
+            histogram = LatencyHistogram(lowest, highest, self.significant_digits)
+            self.histograms[name] = histogram
+        return histogram
+
+    def group(self, field: str, key: Any) -> "StatsCollector":
+        """获取某个分组的子统计"""
+        groups = self.groups.setdefault(field, {})
+        collector = groups.get(key)
+        if collector is None:
+            collector = StatsCollector(self.significant_digits)
+            groups[key] = collector
+        return collector
+
+    def record(self, result: Dict[str, Any]):
+        """记录一条请求结果"""
+        self.total += 1
+        if result['success']:
+            self.success += 1
+            complete = not result.get('aborted')  # 主动中断的请求不计入TRUNCATED_METRICS
+            if complete:
+                self.histogram("response_time").record(result['response_time'])
+                self.histogram("response_size").record(result['response_size'])
+            if result['header_time'] is not None:
+                self.histogram("header_time").record(result['header_time'])
+            if result['ttft'] is not None:
+                self.histogram("ttft").record(result['ttft'])
+                if complete:
+                    self.histogram("generation_time").record(result['generation_time'])
+                    self.histogram("chunk_count").record(result['chunk_count'])
+                    self.histogram("output_tokens").record(result['output_tokens'])
+                    if result['tokens_per_second'] is not None:
+                        self.histogram("tokens_per_second").record(result['tokens_per_second'])
+                itl = self.histogram("inter_token_latency")
+                for latency in result['inter_token_latencies']:
+                    itl.record(latency)
+            # 协调遗漏校正：延迟从负载计划中的发出时刻起算
+            send_delay = result.get('send_delay')
+            if send_delay is not None:
+                self.histogram("send_delay").record(send_delay)
+                if complete:
+                    self.histogram("corrected_response_time").record(result['response_time'] + send_delay)
+                if result['ttft'] is not None:
+                    self.histogram("corrected_ttft").record(result['ttft'] + send_delay)
+        else:
+            self.failed += 1
+            status_code = result['status_code']
+            self.status_codes[status_code] = self.status_codes.get(status_code, 0) + 1
+            failure_type = result.get('failure_type')
+            if failure_type is not None:
+                self.failure_types[failure_type] = self.failure_types.get(failure_type, 0) + 1
+
+        if result.get('aborted'):
+            self.aborted += 1
+            if result.get('stop_latency') is not None:
+                self.histogram("stop_latency").record(result['stop_latency'])
+            stop_status = result.get('stop_status')
+            if stop_status is not None and stop_status != 200:
+                self.stop_failed += 1
+
+        # HTTP分阶段耗时，成功和失败的请求都计入，连接阶段的问题往往表现为失败
+        for name in PHASE_FIELDS:
+            value = result.get(name)
+            if value is not None:
+                self.histogram(name).record(value)
+        reused = result.get('connection_reused')
+        if reused is not None:
+            if reused:
+                self.connections_reused += 1
+            else:
+                self.connections_new += 1
+
+        for field in self.group_fields:
+            key = result.get(field)
+            if key is not None:
+                self.group(field, key).record(result)
+
+    def record_exception(self, exception: Optional[BaseException] = None):
+        """记录一个未被send_request捕获的异常"""
+        self.total += 1
+        self.exceptions += 1
+
+    def merge(self, other: "StatsCollector"):
+        """把另一个统计合并进来（例如其他进程的统计）"""
+        self.total += other.total
+        self.success += other.success
+        self.failed += other.failed
+        self.exceptions += other.exceptions
+        self.connections_reused += other.connections_reused
+        self.connections_new += other.connections_new
+        self.aborted += other.aborted
+        self.stop_failed += other.stop_failed
+        for status_code, count in other.status_codes.items():
+            self.status_codes[status_code] = self.status_codes.get(status_code, 0) + count
+        for failure_type, count in other.failure_types.items():
+            self.failure_types[failure_type] = self.failure_types.get(failure_type, 0) + count
+        for name, histogram in other.histograms.items():
+            self.histogram(name).merge(histogram)
+        for field, groups in other.groups.items():
+            for key, collector in groups.items():
+                self.group(field, key).merge(collector)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """导出为可JSON序列化的字典"""
+        return {
+            "significant_digits": self.significant_digits,
+            "group_fields": list(self.group_fields),
+            "total": self.total,
+            "success": self.success,
+            "failed": self.failed,
+            "exceptions": self.exceptions,
+            "status_codes": {str(k): v for k, v in self.status_codes.items()},
+            "connections_reused": self.connections_reused,
+            "connections_new": self.connections_new,
+            "failure_types": self.failure_types,
+            "aborted": self.aborted,
+            "stop_failed": self.stop_failed,
+            "histograms": {name: h.to_dict() for name, h in self.histograms.items()},
+            "groups": {
+                field: [[key, collector.to_dict()] for key, collector in groups.items()]
+                for field, groups in self.groups.items()
+            }
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "StatsCollector":
+        """从to_dict的结果还原"""
+        collector = cls(data["significant_digits"], data["group_fields"])
+        collector.total = data["total"]
+        collector.success = data["success"]
+        collector.failed = data["failed"]
+        collector.exceptions = data["exceptions"]
+        collector.status_codes = {int(k): v for k, v in data["status_codes"].items()}
+        collector.connections_reused = data.get("connections_reused", 0)
+        collector.connections_new = data.get("connections_new", 0)
+        collector.failure_types = dict(data.get("failure_types", {}))
+        collector.aborted = data.get("aborted", 0)
+        collector.stop_failed = data.get("stop_failed", 0)
+        collector.histograms = {
+            name: LatencyHistogram.from_dict(h) for name, h in data["histograms"].items()
+        }
+        for field, groups in data["groups"].items():
+            collector.groups[field] = {key: cls.from_dict(sub) for key, sub in groups}
+        return collector
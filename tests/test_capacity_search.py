@@ -0,0 +1,64 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api_stress_test import APIStressTester
+from capacity_search import SLO, CapacitySearch
+from mock_server import MockConfig, MockDifyServer
+
+
+def make_trial(**overrides):
+    trial = {"requests": 5, "error_rate": 0.0, "ttft_p95": 0.1, "response_time_p95": 0.5, "client_saturated": False}
+    trial.update(overrides)
+    return trial
+
+
+def test_check_passes_within_slo():
+    assert SLO(ttft_p95=1, response_time_p95=1).check(make_trial()) == []
+
+
+def test_check_without_requests():
+    assert SLO().check(make_trial(requests=0)) == ["测量阶段没有完成的请求"]
+
+
+def test_check_without_ttft():
+    assert SLO(ttft_p95=1).check(make_trial(ttft_p95=None)) == ["没有流式响应，无法计算TTFT"]
+
+
+def test_check_without_response_time():
+    violations = SLO(response_time_p95=1).check(make_trial(response_time_p95=None))
+    assert violations == ["没有成功的请求，无法计算响应时间"]
+
+
+def test_check_reports_each_violation():
+    violations = SLO(ttft_p95=0.05, error_rate=0.01, response_time_p95=0.2).check(make_trial(error_rate=0.5))
+    assert len(violations) == 3
+
+
+def test_negative_warmup_rejected():
+    with pytest.raises(ValueError):
+        CapacitySearch(None, SLO(), warmup=-1)
+
+
+@pytest.mark.parametrize("dimension", ["concurrency", "rate"])
+@pytest.mark.parametrize("warmup", [0, 0.2])
+def test_run_trial(dimension, warmup):
+    async def trial():
+        config = MockConfig(ttft="constant:0.005", token_delay="constant:0.001", min_tokens=2, max_tokens=2)
+        async with MockDifyServer(config, port=0) as server:
+            tester = APIStressTester(server.url_for("dify-chat"), {},
+                                     {"inputs": {}, "query": "", "response_mode": "streaming", "user": "t"},
+                                     loop_lag_threshold=None)
+            search = CapacitySearch(tester, SLO(ttft_p95=1, response_time_p95=1), dimension=dimension,
+                                    trial_duration=0.5, warmup=warmup)
+            return await search.run_trial(2 if dimension == "concurrency" else 20)
+
+    result = asyncio.run(trial())
+    assert result["requests"] > 0
+    assert result["error_rate"] == 0.0
+    assert result["ttft_p95"] is not None and result["response_time_p95"] is not None
+    assert result["passed"], result["violations"]
@@ -0,0 +1,37 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from protocols import PROTOCOLS, Backend
+
+# 各协议的最小请求模板，均不含问题字段
+PAYLOADS = {
+    "dify-chat": {"response_mode": "streaming", "user": "u"},
+    "dify-completion": {"response_mode": "streaming", "user": "u"},
+    "dify-workflow": {"response_mode": "streaming", "user": "u"},
+    "openai-chat": {"model": "m", "stream": True},
+}
+
+
+@pytest.mark.parametrize("protocol", sorted(PROTOCOLS))
+def test_build_body_contains_prompt(protocol):
+    backend = Backend("http://127.0.0.1/v1", {}, PAYLOADS[protocol], protocol)
+    body = json.loads(backend.build_body("你好", user="vu1"))
+    assert backend.adapter.prompt_of(body) == "你好"
+    for key, value in PAYLOADS[protocol].items():
+        if key != "user":
+            assert body[key] == value
+
+
+@pytest.mark.parametrize("protocol", ["dify-chat", "dify-completion", "dify-workflow"])
+def test_build_body_with_attachments(protocol):
+    payload = dict(PAYLOADS[protocol], files=[{"type": "image", "transfer_method": "remote_url", "url": "http://x"}])
+    backend = Backend("http://127.0.0.1/v1", {}, payload, protocol, attach_files=True)
+    files = [{"type": "image", "transfer_method": "local_file", "upload_file_id": "f1"}]
+    body = json.loads(backend.build_body("你好", files=files))
+    assert body["files"] == files
+    assert json.loads(backend.build_body("你好"))["files"] == []
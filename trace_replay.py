@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+生产流量回放
+逐行惰性读取JSONL格式的请求轨迹（时间戳、问题、用户、会话ID），
+按原始的相对时间计算每个请求的计划发送时刻，支持加速回放和循环回放
+
+轨迹格式（每行一个JSON对象）：
+    {"timestamp": 1718000000.123, "query": "...", "user": "u-1", "conversation_id": "", "category": "chat"}
+timestamp可以是Unix秒、Unix毫秒或ISO 8601字符串
+"""
+
+import json
+from datetime import datetime
+from typing import Iterator, Dict, Any, Optional, Tuple
+
+
+def parse_timestamp(value: Any) -> float:
+    """把轨迹中的时间戳转换为Unix秒"""
+    if isinstance(value, (int, float)):
+        # 大于1e11的数值视为毫秒
+        return value / 1000.0 if value > 1e11 else float(value)
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    raise ValueError(f"无法解析的时间戳: {value!r}")
+
+
+class TraceReader:
+    """惰性读取请求轨迹，产出(计划发送时刻, 记录)"""
+
+    def __init__(self, path: str, speed: float = 1.0, loops: int = 1, duration: Optional[float] = None,
+                 prompt_field: str = "query", shard_index: int = 0, shard_count: int = 1):
+        if speed <= 0:
+            raise ValueError("speed必须大于0")
+        self.path = path
+        self.speed = speed              # 回放倍速，2表示以两倍速度回放
+        self.loops = loops              # 循环次数，0表示一直循环直到duration
+        self.duration = duration        # 回放的最长时间（秒，按回放后的时间计算）
+        self.prompt_field = prompt_field
+        self.shard_index = shard_index  # 多进程回放时只取第shard_index份
+        self.shard_count = shard_count
+        self.completed_loops = 0
+        if loops == 0 and duration is None:
+            raise ValueError("无限循环回放时必须设置duration")
+
+    def _read_once(self) -> Iterator[Tuple[float, Dict[str, Any], bool]]:
+        """读取一遍轨迹，产出(原始Unix时间, 记录, 是否属于本分片)
+
+        其他分片的记录也会产出，用于按整份轨迹计算起止时间和记录数，使各分片共用同一条时间线"""
+        with open(self.path, "r", encoding="utf-8") as f:
+            line_number = -1
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                line_number += 1
+                try:
+                    record = json.loads(line)
+                    timestamp = parse_timestamp(record["timestamp"])
+                except (ValueError, KeyError, TypeError):
+                    continue
+                if record.get(self.prompt_field):
+                    yield timestamp, record, line_number % self.shard_count == self.shard_index
+
+    def __iter__(self) -> Iterator[Tuple[float, Dict[str, Any]]]:
+        """产出相对回放开始的计划时刻（秒）及记录"""
+        self.completed_loops = 0
+        loop_start = 0.0
+        while self.loops == 0 or self.completed_loops < self.loops:
+            first = last = None
+            count = 0
+            for timestamp, record, in_shard in self._read_once():
+                if first is None:
+                    first = timestamp
+                last = timestamp
+                count += 1
+                offset = loop_start + max(timestamp - first, 0.0) / self.speed
+                if self.duration is not None and offset >= self.duration:
+                    return
+                if in_shard:
+                    yield offset, record
+            if count == 0:
+                return
+            self.completed_loops += 1
+
+            # 下一轮紧接着整份轨迹的最后一个请求开始，间隔取整份轨迹的平均到达间隔，各分片一致
+            span = (last - first) / self.speed
+            gap = span / (count - 1) if count > 1 else 1.0 / self.speed
+            loop_start += span + gap